@@ -0,0 +1,332 @@
+# api/_admission.py inside your Vercel project's 'api' directory
+# Admission control in front of Gemini: per-client rate limits and a shared, prioritized limit on
+# concurrent upstream calls.
+#
+# Every request and upstream call belongs to a priority class: nlu (voice commands) before insight
+# (solve insights and lesson chat) before course (course generation and repair). Two layers:
+#
+#   admit(client, class)     Token bucket per (client, class), checked when a request arrives.
+#                            An empty bucket is answered at once with 429 and the seconds until
+#                            the next token as Retry-After.
+#   upstream_limiter         At most UPSTREAM_MAX_CONCURRENCY Gemini calls in flight per process;
+#                            each class may hold only its share of them, so long course
+#                            generations can never occupy the slots voice commands need. A call
+#                            that finds no free slot waits in its class's bounded queue; freed
+#                            slots go to the highest-priority waiter first. A full queue, or a wait
+#                            longer than the class allows, sheds the request with 503 and
+#                            Retry-After instead of letting it pile up.
+#
+# The limiter serves blocking callers (Flask threads) and coroutines (ASGI, background jobs)
+# from the same slot pool. Limits are per process, like the caches.
+
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque, namedtuple
+
+import _metrics as metrics
+
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "64"))
+ADMISSION_MAX_CLIENTS = int(os.environ.get("ADMISSION_MAX_CLIENTS", "10000"))
+
+PriorityClass = namedtuple('PriorityClass', [
+    'name', 'rank',          # Lower rank is served first.
+    'rate_per_minute',       # Sustained requests per client; 0 disables the client limit.
+    'burst',                 # Token bucket size.
+    'slot_share',            # Share of UPSTREAM_MAX_CONCURRENCY the class may hold at once.
+    'max_waiting',           # Upstream calls allowed to queue for a slot.
+    'max_wait_seconds',      # Longest a call may wait for a slot before it is shed.
+])
+
+
+def _priority_class(name, rank, rate_per_minute, burst, slot_share, max_waiting, max_wait_seconds):
+    """A PriorityClass whose numbers can be overridden with ADMISSION_<NAME>_<FIELD> variables."""
+    prefix = f"ADMISSION_{name.upper()}_"
+    return PriorityClass(
+        name, rank,
+        float(os.environ.get(prefix + "RATE_PER_MINUTE", rate_per_minute)),
+        float(os.environ.get(prefix + "BURST", burst)),
+        float(os.environ.get(prefix + "SLOT_SHARE", slot_share)),
+        int(os.environ.get(prefix + "MAX_WAITING", max_waiting)),
+        float(os.environ.get(prefix + "MAX_WAIT_SECONDS", max_wait_seconds)),
+    )
+
+
+PRIORITY_CLASSES = {
+    'nlu': _priority_class('nlu', 0, 120, 20, 1.0, 64, 2),
+    'insight': _priority_class('insight', 1, 30, 10, 0.8, 64, 10),
+    'course': _priority_class('course', 2, 4, 3, 0.5, 16, 30),
+}
+
+# UpstreamCall.request_type -> priority class.
+REQUEST_TYPE_CLASSES = {
+    'nlu': 'nlu',
+    'insight': 'insight',
+    'lesson_chat': 'insight',
+    'generate_course': 'course',
+    'course_repair': 'course',
+}
+
+ADMISSION_REJECTIONS = metrics.Counter(
+    'cubetimer_admission_rejections_total', 'Requests shed by admission control.', ['priority_class', 'reason'])
+
+
+class AdmissionRejected(Exception):
+    """A request turned away by admission control; `status` is 429 or 503."""
+
+    def __init__(self, message, status, retry_after, priority_class, reason):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.priority_class = priority_class
+        self.reason = reason
+        ADMISSION_REJECTIONS.inc(priority_class=priority_class, reason=reason)
+
+    def headers(self):
+        return {'Retry-After': str(self.retry_after)}
+
+
+def class_for(request_type):
+    return PRIORITY_CLASSES[REQUEST_TYPE_CLASSES.get(request_type, 'insight')]
+
+
+def client_id_for(headers, remote_addr=None):
+    """The client a request is rate limited as: first X-Forwarded-For hop, else the peer address."""
+    forwarded = headers.get('X-Forwarded-For') or ''
+    return forwarded.split(',')[0].strip() or remote_addr or 'unknown'
+
+
+class RateLimiter:
+    """Token buckets per (client, priority class), bounded to the most recently seen clients."""
+
+    def __init__(self, max_clients=ADMISSION_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # (client, class) -> [tokens, updated_at]
+
+    def admit(self, client, priority_class):
+        """Takes a token for the client or raises AdmissionRejected(429)."""
+        if priority_class.rate_per_minute <= 0:
+            return
+        rate = priority_class.rate_per_minute / 60
+        key = (client, priority_class.name)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [priority_class.burst, now]
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(priority_class.burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return
+            wait = (1 - bucket[0]) / rate
+        raise AdmissionRejected("Too many requests. Please slow down and try again shortly.",
+                                429, wait, priority_class.name, 'rate_limit')
+
+
+class _Waiter:
+    __slots__ = ('granted', 'event', 'loop', 'future')
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class UpstreamSlot:
+    """One held upstream slot; release() is idempotent."""
+
+    def __init__(self, limiter, priority_class):
+        self._limiter = limiter
+        self.priority_class = priority_class
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self.priority_class)
+
+
+class UpstreamLimiter:
+    """Prioritized counting semaphore over upstream calls, shared by threads and event loops."""
+
+    def __init__(self, capacity=UPSTREAM_MAX_CONCURRENCY, classes=PRIORITY_CLASSES):
+        self.capacity = capacity
+        self.classes = sorted(classes.values(), key=lambda c: c.rank)
+        self._lock = threading.Lock()
+        self._in_use = {c.name: 0 for c in self.classes}
+        self._waiting = {c.name: deque() for c in self.classes}
+        self._total = 0
+        self.admitted = {c.name: 0 for c in self.classes}
+        self.queued = {c.name: 0 for c in self.classes}
+
+    def _cap(self, priority_class):
+        return max(1, int(self.capacity * priority_class.slot_share))
+
+    def _has_room(self, priority_class):
+        return self._total < self.capacity and self._in_use[priority_class.name] < self._cap(priority_class)
+
+    def _take(self, priority_class):
+        self._in_use[priority_class.name] += 1
+        self._total += 1
+        self.admitted[priority_class.name] += 1
+
+    def _try_take(self, priority_class):
+        """Takes a slot now unless none is free or callers of equal or higher priority are queued."""
+        if not self._has_room(priority_class):
+            return False
+        if any(self._waiting[c.name] for c in self.classes if c.rank <= priority_class.rank):
+            return False
+        self._take(priority_class)
+        return True
+
+    def _enqueue(self, priority_class, waiter):
+        queue = self._waiting[priority_class.name]
+        if len(queue) >= priority_class.max_waiting:
+            raise AdmissionRejected("The AI service is busy. Please try again shortly.",
+                                    503, priority_class.max_wait_seconds, priority_class.name, 'queue_full')
+        queue.append(waiter)
+        self.queued[priority_class.name] += 1
+
+    def _give_up(self, priority_class, waiter):
+        """Called under the lock when a waiter stops waiting; True if it got a slot in the meantime."""
+        if waiter.granted:
+            return True
+        self._waiting[priority_class.name].remove(waiter)
+        return False
+
+    def _timed_out(self, priority_class):
+        return AdmissionRejected("The AI service is busy. Please try again shortly.",
+                                 503, priority_class.max_wait_seconds, priority_class.name, 'wait_timeout')
+
+    def _release(self, priority_class):
+        with self._lock:
+            self._in_use[priority_class.name] -= 1
+            self._total -= 1
+            # Hand freed slots to the highest-priority waiters that are within their class's share.
+            for waiting_class in self.classes:
+                queue = self._waiting[waiting_class.name]
+                while queue and self._has_room(waiting_class):
+                    waiter = queue.popleft()
+                    waiter.granted = True
+                    self._take(waiting_class)
+                    waiter.wake()
+
+    def acquire(self, request_type):
+        """Blocks until a slot is free for the request type's class; returns an UpstreamSlot."""
+        priority_class = class_for(request_type)
+        with self._lock:
+            if self._try_take(priority_class):
+                return UpstreamSlot(self, priority_class)
+            waiter = _Waiter()
+            self._enqueue(priority_class, waiter)
+        started = time.perf_counter()
+        waiter.event.wait(priority_class.max_wait_seconds)
+        with self._lock:
+            granted = self._give_up(priority_class, waiter)
+        metrics.record_span('queue_wait', time.perf_counter() - started)
+        if not granted:
+            raise self._timed_out(priority_class)
+        return UpstreamSlot(self, priority_class)
+
+    def try_acquire(self, request_type):
+        """An UpstreamSlot if one is free right now, else None (never waits or sheds)."""
+        priority_class = class_for(request_type)
+        with self._lock:
+            if self._try_take(priority_class):
+                return UpstreamSlot(self, priority_class)
+        return None
+
+    async def acquire_async(self, request_type):
+        """Async counterpart of acquire()."""
+        priority_class = class_for(request_type)
+        with self._lock:
+            if self._try_take(priority_class):
+                return UpstreamSlot(self, priority_class)
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._enqueue(priority_class, waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), priority_class.max_wait_seconds)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = self._give_up(priority_class, waiter)
+            if granted:
+                UpstreamSlot(self, priority_class).release()
+            raise
+        with self._lock:
+            granted = self._give_up(priority_class, waiter)
+        metrics.record_span('queue_wait', time.perf_counter() - started)
+        if not granted:
+            raise self._timed_out(priority_class)
+        return UpstreamSlot(self, priority_class)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "inUse": dict(self._in_use),
+                "waiting": {name: len(queue) for name, queue in self._waiting.items()},
+                "admitted": dict(self.admitted),
+                "queued": dict(self.queued),
+            }
+
+
+rate_limiter = RateLimiter()
+upstream_limiter = UpstreamLimiter()
+
+
+def admit(client, priority_class_name):
+    """Per-client rate limit check for an incoming request; raises AdmissionRejected(429)."""
+    rate_limiter.admit(client, PRIORITY_CLASSES[priority_class_name])
+
+
+if __name__ == '__main__':
+    # Simulation: course calls saturate the limiter while voice commands keep arriving.
+    from concurrent.futures import ThreadPoolExecutor
+
+    limiter = UpstreamLimiter(capacity=8)
+    latencies = {'nlu': [], 'generate_course': []}
+    outcomes = {'nlu': {}, 'generate_course': {}}
+
+    def call(request_type, seconds):
+        started = time.perf_counter()
+        try:
+            slot = limiter.acquire(request_type)
+        except AdmissionRejected as e:
+            outcomes[request_type][e.reason] = outcomes[request_type].get(e.reason, 0) + 1
+            return
+        try:
+            time.sleep(seconds)
+        finally:
+            slot.release()
+        latencies[request_type].append(time.perf_counter() - started)
+        outcomes[request_type]['ok'] = outcomes[request_type].get('ok', 0) + 1
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        for i in range(200):
+            pool.submit(call, 'generate_course', 0.5)
+            if i % 4 == 0:
+                pool.submit(call, 'nlu', 0.02)
+            time.sleep(0.005)
+    for request_type, values in latencies.items():
+        values.sort()
+        p95 = values[int(len(values) * 0.95) - 1] * 1000 if values else 0
+        print(f"{request_type:>16}: {outcomes[request_type]}  p95={p95:.0f} ms")
+    print(limiter.stats())
@@ -0,0 +1,219 @@
+# api/_asgi.py inside your Vercel project's 'api' directory
+# Asyncio/ASGI serving mode for the Gemini endpoints.
+#
+# The Flask functions block one worker per request for as long as Gemini takes (up to 120 s for a
+# course). This app serves the same routes with the same request/response contract, but drives
+# the shared generator handlers with gemini_client.run_async, so waiting on Gemini costs no thread
+# and one process can keep hundreds of upstream calls in flight.
+#
+# Run locally with:  python api/_asgi.py --port 8000   (needs uvicorn and httpx)
+
+import os
+import sys
+import json
+import time
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _gemini_client as gemini_client
+import _metrics as metrics
+from _single_flight import IdempotencyConflict, idempotent_async
+from _admission import AdmissionRejected, admit, client_id_for
+
+
+def load_function_module(filename):
+    """Imports one of the hyphen-named Vercel function files in this directory."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    module_name = filename[:-len('.py')].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+insight_function = load_function_module('gemini-insight.py')
+nlu_function = load_function_module('gemini-nlu.py')
+
+
+def insight_steps(request_json):
+    if not request_json:
+        return None
+    return insight_function.dispatch_insight_request(request_json)
+
+
+POST_ROUTES = {
+    '/api/gemini-insight': insight_steps,
+    '/api/gemini-nlu': nlu_function.interpret_transcript,
+}
+
+
+def metrics_request_type(path, request_json):
+    if path == '/api/gemini-nlu':
+        return 'nlu'
+    # This app answers "stream": true with the plain JSON course.
+    if not isinstance(request_json, dict):
+        return 'insight'
+    return insight_function.metrics_request_type(request_json) or 'generate_course'
+
+
+def admission_class(path, request_json):
+    if path == '/api/gemini-nlu':
+        return 'nlu'
+    return insight_function.admission_class(request_json)
+
+
+error_response = gemini_client.error_response
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, body, status, extra_headers=()):
+    payload = json.dumps(body).encode('utf-8')
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(payload)).encode()),
+        (b'access-control-allow-origin', b'*'),
+        *extra_headers,
+    ]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await gemini_client.close_async_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path'].rstrip('/') or '/'
+    method = scope['method']
+
+    if method == 'OPTIONS' and path in POST_ROUTES:
+        # CORS preflight, mirroring what flask_cors answers for the Flask functions.
+        request_headers = dict(scope.get('headers') or [])
+        allowed_headers = request_headers.get(b'access-control-request-headers', b'Content-Type')
+        await send({'type': 'http.response.start', 'status': 204, 'headers': [
+            (b'access-control-allow-origin', b'*'),
+            (b'access-control-allow-methods', b'POST, OPTIONS'),
+            (b'access-control-allow-headers', allowed_headers),
+        ]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    if method == 'GET' and path == '/api/metrics':
+        payload = metrics.render().encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', metrics.CONTENT_TYPE.encode()),
+            (b'content-length', str(len(payload)).encode()),
+        ]})
+        await send({'type': 'http.response.body', 'body': payload})
+        return
+
+    if method == 'GET' and path == '/api/gemini-insight/cache-stats':
+        await send_json(send, insight_function.cache_stats(), 200)
+        return
+
+    if method == 'GET' and path == '/api/gemini-insight/course-store-stats':
+        await send_json(send, insight_function.course_store.stats(), 200)
+        return
+
+    if method == 'GET' and path == '/api/gemini-insight/admission-stats':
+        await send_json(send, gemini_client.upstream_stats(), 200)
+        return
+
+    if method == 'GET' and path == '/api/gemini-insight/jobs':
+        await send_json(send, insight_function.course_jobs.stats(), 200)
+        return
+
+    if method in ('GET', 'DELETE') and path.startswith('/api/gemini-insight/jobs/'):
+        job_id = path[len('/api/gemini-insight/jobs/'):]
+        jobs = insight_function.course_jobs
+        job = jobs.cancel(job_id) if method == 'DELETE' else jobs.get(job_id)
+        if job is None:
+            await send_json(send, {"error": "Unknown or expired job ID."}, 404)
+        else:
+            await send_json(send, job.to_dict(), 200)
+        return
+
+    make_steps = POST_ROUTES.get(path)
+    if make_steps is None or method != 'POST':
+        await send_json(send, {"error": "Not found."}, 404)
+        return
+
+    raw_body = await read_body(receive)
+    parse_started = time.perf_counter()
+    try:
+        request_json = json.loads(raw_body) if raw_body else None
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        request_json = None  # Same as Flask's get_json(silent=True).
+    trace = metrics.begin_request(metrics_request_type(path, request_json))
+    metrics.record_span('parse', time.perf_counter() - parse_started)
+
+    request_headers = {name.decode('latin-1').title(): value.decode('latin-1')
+                       for name, value in scope.get('headers') or []}
+
+    async def compute():
+        if path == '/api/gemini-insight' and request_json and request_json.get('type') == 'generate_course' \
+                and request_json.get('background'):
+            return insight_function.submit_course_job(request_json)
+        steps = make_steps(request_json)
+        if steps is None:
+            return {"error": "Invalid JSON body or empty request."}, 400
+        return await gemini_client.run_async(steps)
+
+    idempotency_key = None
+    if path == '/api/gemini-insight' and isinstance(request_json, dict):
+        idempotency_key = insight_function.idempotency_key_for(request_json, request_headers)
+
+    extra_headers = []
+    try:
+        if isinstance(request_json, dict):
+            peer = (scope.get('client') or (None,))[0]
+            admit(client_id_for(request_headers, peer), admission_class(path, request_json))
+        if idempotency_key:
+            # Retries and double-clicks carrying the same key share (or replay) the first response.
+            body, status = await idempotent_async(insight_function.idempotent_requests, idempotency_key,
+                                                  insight_function.request_fingerprint(request_json), compute)
+        else:
+            body, status = await compute()
+    except insight_function.JobQueueFull:
+        body, status = {"error": "Too many courses are being generated right now. Please try again shortly."}, 503
+        extra_headers.append((b'retry-after', b'30'))
+    except IdempotencyConflict as e:
+        body, status = {"error": str(e)}, 422
+    except (AdmissionRejected, gemini_client.UpstreamUnavailable) as e:
+        body, status = error_response(e)
+        extra_headers.append((b'retry-after', str(e.retry_after).encode()))
+    except Exception as e:
+        body, status = error_response(e)
+    extra_headers.append((b'server-timing', metrics.server_timing(metrics.end_request(trace, status)).encode()))
+    await send_json(send, body, status, extra_headers)
+
+
+if __name__ == '__main__':
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host='0.0.0.0', port=args.port)
@@ -0,0 +1,158 @@
+# api/_chat_slots.py inside your Vercel project's 'api' directory
+# Single-pass, incremental extraction of course parameters ("slots") from chatHistory.
+#
+# Every pattern the course flow cares about (skill level, focus area, learning style and the
+# explicit generate commands) is compiled into one alternation, so each user message is scanned
+# once instead of once per pattern. The extracted state is cached per conversation under a hash
+# chain of its messages (a conversation's identity is its own content, as in _chat_window): the
+# client resends the whole history on every turn, but only the messages added since the last
+# cached state are scanned, so the regex work per request stays flat as the conversation grows.
+
+import os
+import re
+import hashlib
+from collections import namedtuple
+
+from _chat_window import message_text
+from _insight_cache import InsightCache
+
+CHAT_SLOT_CACHE_SIZE = int(os.environ.get("CHAT_SLOT_CACHE_SIZE", "4096"))
+CHAT_SLOT_TTL_SECONDS = float(os.environ.get("CHAT_SLOT_TTL_SECONDS", "21600"))
+# How many messages back to look for a cached state before rescanning the whole history.
+CHAT_SLOT_LOOKBACK = int(os.environ.get("CHAT_SLOT_LOOKBACK", "8"))
+
+chat_slot_cache = InsightCache(max_entries=CHAT_SLOT_CACHE_SIZE, ttl_seconds=CHAT_SLOT_TTL_SECONDS, db_path=None)
+
+# (slot, value, pattern). Within one message the first listed value of a slot wins; across
+# messages the latest message that mentions a slot wins. Patterns must not overlap each other,
+# since the combined scan consumes the text it matches.
+USER_PATTERNS = [
+    ('skill_level', 'beginner', r'\b(?:beginner|begginer|biginner)\b'),
+    ('skill_level', 'intermediate', r'\b(?:intermediate|intermidiate)\b'),
+    ('skill_level', 'advanced', r'\b(?:advanced|advance)\b'),
+    ('focus_area', 'F2L', r'\bf2l\b'),
+    ('focus_area', 'OLL', r'\boll\b'),
+    ('focus_area', 'PLL', r'\bpll\b'),
+    ('focus_area', 'Cross', r'\bcross\b'),
+    ('learning_style', 'theoretical', r'\b(?:theoretical|concept(?:ual)?)\b'),
+    ('learning_style', 'hands-on practice', r'\b(?:hands[- ]?on|practical|practice|practce)\b'),
+    ('learning_style', 'interactive quiz', r'\b(?:interactive )?quiz(?:zes)?\b'),
+    ('command', 'verification_course', r'generate verification course'),
+    ('command', 'generate_course', r'generate course|create course|make the course|generate the course now'),
+]
+
+# Phrases in Jarvis' own replies that mean it is ready to build the course.
+REPLY_PATTERNS = [
+    ('command', 'generate_course', r'i have enough information|build your course now|assemble it for you|creating your course'),
+]
+
+ChatSlots = namedtuple('ChatSlots', [
+    'skill_level', 'focus_area', 'learning_style',
+    'verification_requested',  # Any user message asked for the verification course.
+    'latest_user_message',     # Lower-cased text of the most recent user message.
+    'latest_commands',         # Commands found in that message, e.g. {'generate_course'}.
+])
+
+
+class SlotMatcher:
+    """One compiled alternation over a list of (slot, value, pattern)."""
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self._regex = re.compile("|".join(f"(?P<p{index}>{pattern})" for index, (_, _, pattern) in enumerate(patterns)))
+
+    def scan(self, text):
+        """Returns {slot: value} for one (lower-cased) text, plus the set of commands under 'command'."""
+        best = {}
+        commands = set()
+        for match in self._regex.finditer(text):
+            index = int(match.lastgroup[1:])
+            slot, value, _ = self.patterns[index]
+            if slot == 'command':
+                commands.add(value)
+            elif slot not in best or index < best[slot][0]:
+                best[slot] = (index, value)
+        found = {slot: value for slot, (_, value) in best.items()}
+        found['command'] = commands
+        return found
+
+
+user_slots = SlotMatcher(USER_PATTERNS)
+reply_slots = SlotMatcher(REPLY_PATTERNS)
+
+
+def reply_commands(text):
+    """Commands (e.g. {'generate_course'}) signalled by a Jarvis reply."""
+    return reply_slots.scan(str(text).lower())['command']
+
+
+def _empty_state():
+    return {'skill_level': None, 'focus_area': None, 'learning_style': None,
+            'verification_requested': False, 'latest_user_message': '', 'latest_commands': frozenset()}
+
+
+def _prefix_keys(messages, last):
+    """Hash chain over the messages; returns {i: key identifying messages[:i + 1]} for the last `last` i."""
+    keys = {}
+    digest = hashlib.sha1(b'chat-slots')
+    first_key = len(messages) - last
+    for index, msg in enumerate(messages):
+        digest.update(f"{msg.get('role')}\0{message_text(msg)}\0".encode('utf-8'))
+        if index >= first_key:
+            keys[index] = "slots|" + digest.copy().hexdigest()
+    return keys
+
+
+def extract_chat_slots(chat_history):
+    """Returns the ChatSlots for a chatHistory, scanning only messages not covered by a cached state."""
+    messages = [msg for msg in chat_history if isinstance(msg, dict)] if isinstance(chat_history, list) else []
+    if not messages:
+        return ChatSlots(**_empty_state())
+
+    keys = _prefix_keys(messages, CHAT_SLOT_LOOKBACK)
+    state, start = None, 0
+    for index in sorted(keys, reverse=True):
+        state = chat_slot_cache.get(keys[index])
+        if state is not None:
+            start = index + 1
+            break
+    state = dict(state or _empty_state())
+
+    for msg in messages[start:]:
+        if msg.get('role') != 'user' or not msg.get('parts'):
+            continue
+        text = message_text(msg).lower()
+        found = user_slots.scan(text)
+        for slot in ('skill_level', 'focus_area', 'learning_style'):
+            if slot in found:
+                state[slot] = found[slot]
+        if 'verification_course' in found['command']:
+            state['verification_requested'] = True
+        state['latest_user_message'] = text
+        state['latest_commands'] = frozenset(found['command'])
+
+    if start < len(messages):
+        chat_slot_cache.set(keys[len(messages) - 1], state)
+    return ChatSlots(**state)
+
+
+if __name__ == '__main__':
+    # Benchmark: cost of one more turn on conversations of growing length.
+    import time
+
+    turns = ["I'm a beginner on 3x3", "Sounds good, tell me more.", "I'd like to focus on f2l please",
+             "Hands-on practice works best for me", "What about oll later?"]
+    for length in (10, 100, 1000):
+        history = []
+        for turn in range(length):
+            history.append({'role': 'user', 'parts': [{'text': turns[turn % len(turns)]}]})
+            history.append({'role': 'model', 'parts': [{'text': 'Got it. Anything else you want to cover?'}]})
+        extract_chat_slots(history[:-2])  # The previous turn, as the server saw it.
+        started = time.perf_counter()
+        slots = extract_chat_slots(history)
+        incremental_ms = (time.perf_counter() - started) * 1000
+        chat_slot_cache._entries.clear()
+        started = time.perf_counter()
+        extract_chat_slots(history)
+        full_ms = (time.perf_counter() - started) * 1000
+        print(f"{len(history):5d} messages: next turn {incremental_ms:.3f} ms, cold scan {full_ms:.3f} ms -> {slots[:3]}")
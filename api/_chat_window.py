@@ -0,0 +1,113 @@
+# api/_chat_window.py inside your Vercel project's 'api' directory
+# Bounded context for lesson_chat: the last CHAT_WINDOW_MESSAGES messages go to Gemini verbatim,
+# everything older is folded into a rolling summary.
+#
+# Older messages are folded in whole blocks of CHAT_SUMMARY_BLOCK messages, so the summary only
+# changes once every few turns instead of on every turn. Each block's summary is cached under a
+# hash chain of the messages folded so far (a conversation's identity is its own content), and a
+# new summary is built from the previous cached one plus the newly folded block. Per-turn prompt
+# size therefore stays flat however long a course-design conversation runs.
+
+import os
+import json
+import hashlib
+
+import _gemini_client as gemini_client
+from _insight_cache import InsightCache
+from _log import get_logger
+
+log = get_logger('chat-window')
+
+CHAT_WINDOW_MESSAGES = int(os.environ.get("CHAT_WINDOW_MESSAGES", "12"))
+CHAT_SUMMARY_BLOCK = int(os.environ.get("CHAT_SUMMARY_BLOCK", "6"))
+CHAT_SUMMARY_CACHE_SIZE = int(os.environ.get("CHAT_SUMMARY_CACHE_SIZE", "1024"))
+CHAT_SUMMARY_TTL_SECONDS = float(os.environ.get("CHAT_SUMMARY_TTL_SECONDS", "21600"))
+
+chat_summary_cache = InsightCache(max_entries=CHAT_SUMMARY_CACHE_SIZE, ttl_seconds=CHAT_SUMMARY_TTL_SECONDS, db_path=None)
+
+
+def message_text(msg):
+    """Text of a chatHistory message whose first part is either a string or {'text': ...}."""
+    parts = msg.get('parts') if isinstance(msg, dict) else None
+    if not isinstance(parts, list) or not parts:
+        return ''
+    first = parts[0]
+    return first if isinstance(first, str) else (first.get('text', '') if isinstance(first, dict) else '')
+
+
+def split_chat(chat_history):
+    """Splits chatHistory into (system texts, Gemini-shaped user/model messages).
+
+    lessons.js prepends its own instructions as a role "system" message on every turn; Gemini
+    contents only accept user/model turns, so those are returned separately for systemInstruction.
+    """
+    system_texts = []
+    messages = []
+    for msg in chat_history if isinstance(chat_history, list) else []:
+        if not isinstance(msg, dict) or not msg.get('parts') or not msg.get('role'):
+            continue
+        if msg['role'] == 'system':
+            system_texts.append(message_text(msg))
+        else:
+            messages.append({"role": msg['role'], "parts": [{"text": message_text(msg)}]})
+    return system_texts, messages
+
+
+def window_chat(messages, keep=CHAT_WINDOW_MESSAGES, block=CHAT_SUMMARY_BLOCK):
+    """Returns (older messages to fold, recent messages to send verbatim).
+
+    The fold boundary moves in steps of `block`, so between keep and keep + block - 1 messages
+    are always sent verbatim.
+    """
+    boundary = max(0, (len(messages) - keep) // block * block)
+    return messages[:boundary], messages[boundary:]
+
+
+def _block_keys(older, block):
+    keys = []
+    digest = hashlib.sha1(b'chat-summary')
+    for start in range(0, len(older), block):
+        digest.update(json.dumps(older[start:start + block], sort_keys=True).encode('utf-8'))
+        keys.append("chat|" + digest.copy().hexdigest())
+    return keys
+
+
+def _transcript(messages):
+    return "\n".join(f"{'User' if msg['role'] == 'user' else 'Jarvis'}: {msg['parts'][0]['text']}" for msg in messages)
+
+
+def rolling_summary(older, block=CHAT_SUMMARY_BLOCK, model=None):
+    """Generator (use with `yield from`) returning a summary of `older`, or None if it can't be built.
+
+    Only blocks that are not yet covered by a cached summary are sent upstream, together with
+    the latest cached summary, in a single call.
+    """
+    if not older:
+        return ''
+    keys = _block_keys(older, block)
+    summary = ''
+    start = 0
+    for index in reversed(range(len(keys))):
+        cached = chat_summary_cache.get(keys[index])
+        if cached is not None:
+            summary, start = cached, index + 1
+            break
+    if start == len(keys):
+        return summary
+
+    prompt = (
+        "Summarize this cubing course-design conversation for your own later reference. Keep every fact the user "
+        "gave (cube type, skill level, methods and algorithms they know, goals, preferences, time available) and any "
+        "decisions already made. Reply with at most 120 words of plain text.\n\n"
+        + (f"Summary so far:\n{summary}\n\n" if summary else "")
+        + f"Conversation to add:\n{_transcript(older[start * block:])}"
+    )
+    payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+    try:
+        response_data = yield gemini_client.routed_call('lesson_chat', payload, model, optional=True)
+        summary = response_data['candidates'][0]['content']['parts'][0]['text'].strip()
+    except (gemini_client.UpstreamError, *gemini_client.SHED_ERRORS, KeyError, IndexError, TypeError) as e:
+        log.error("Could not summarize older chat turns, sending full history instead", error=str(e))
+        return None
+    chat_summary_cache.set(keys[-1], summary)
+    return summary
@@ -0,0 +1,326 @@
+# api/_course_schema.py inside your Vercel project's 'api' directory
+# The course responseSchema, a validator compiled from it, and fragment-level repair.
+#
+# A course that breaks the schema (or was cut off and salvaged by _json_extract) used to fail the
+# whole request, and the user waited another two minutes for a full regeneration. Here the schema
+# is compiled once into nested checker closures that report the exact path of every problem
+# (e.g. modules[1].lessons[0].quiz[2].answer), and repair_course fixes only what is broken:
+#
+#   - missing course/module header fields get defaults from the generation parameters,
+#   - broken quiz questions are dropped,
+#   - broken lessons are regenerated together in one small follow-up call (at most
+#     COURSE_REPAIR_MAX_LESSONS of them), and dropped if that fails too,
+#   - modules left without lessons are dropped.
+
+import os
+import json
+
+import _gemini_client as gemini_client
+import _metrics as metrics
+from _log import get_logger
+from _json_extract import extract_json_object
+
+log = get_logger('course-schema')
+
+COURSE_REPAIR_MAX_LESSONS = int(os.environ.get("COURSE_REPAIR_MAX_LESSONS", "4"))
+
+QUIZ_ITEM_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "question": {"type": "STRING"},
+        "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "answer": {"oneOf": [{"type": "STRING"}, {"type": "ARRAY", "items": {"type": "STRING"}}]}
+    },
+    "required": ["question", "options", "answer"]
+}
+
+LESSON_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "lesson_id": {"type": "STRING"},
+        "lesson_title": {"type": "STRING"},
+        "lesson_type": {"type": "STRING"},
+        "content": {"type": "STRING"},
+        "scrambles": {"type": "ARRAY", "items": {"type": "STRING"}, "nullable": True},
+        "algorithms": {"type": "ARRAY", "items": {"type": "STRING"}, "nullable": True},
+        "quiz": {"type": "ARRAY", "items": QUIZ_ITEM_SCHEMA, "nullable": True}
+    },
+    "required": ["lesson_id", "lesson_title", "lesson_type", "content"]
+}
+
+COURSE_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "course_id": {"type": "STRING"},
+        "title": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "cubeType": {"type": "STRING"},
+        "level": {"type": "STRING"},
+        "modules": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "module_id": {"type": "STRING"},
+                    "module_title": {"type": "STRING"},
+                    "lessons": {"type": "ARRAY", "items": LESSON_SCHEMA}
+                },
+                "required": ["module_id", "module_title", "lessons"]
+            }
+        }
+    },
+    "required": ["course_id", "title", "description", "cubeType", "level", "modules"]
+}
+
+_TYPE_CHECKS = {
+    'STRING': lambda value: isinstance(value, str),
+    'NUMBER': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'INTEGER': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'BOOLEAN': lambda value: isinstance(value, bool),
+    'ARRAY': lambda value: isinstance(value, list),
+    'OBJECT': lambda value: isinstance(value, dict),
+}
+
+
+def compile_schema(schema):
+    """Compiles a Gemini responseSchema into check(value, path, errors), which appends (path, message)."""
+    nullable = schema.get('nullable', False)
+
+    if 'oneOf' in schema or 'anyOf' in schema:
+        options = [compile_schema(option) for option in schema.get('oneOf') or schema['anyOf']]
+
+        def check_union(value, path, errors):
+            if value is None and nullable:
+                return
+            for option in options:
+                option_errors = []
+                option(value, path, option_errors)
+                if not option_errors:
+                    return
+            errors.append((path, "does not match any of the allowed types"))
+        return check_union
+
+    type_name = str(schema.get('type', '')).upper()
+    type_check = _TYPE_CHECKS.get(type_name)
+    enum = schema.get('enum')
+    items = compile_schema(schema['items']) if 'items' in schema else None
+    properties = [(key, compile_schema(child)) for key, child in (schema.get('properties') or {}).items()]
+    required = tuple(schema.get('required') or ())
+
+    def check(value, path, errors):
+        if value is None:
+            if not nullable:
+                errors.append((path, "is null"))
+            return
+        if type_check is not None and not type_check(value):
+            errors.append((path, f"should be {type_name.lower()}, got {type(value).__name__}"))
+            return
+        if enum is not None and value not in enum:
+            errors.append((path, f"should be one of {enum}"))
+        if type_name == 'OBJECT':
+            for key in required:
+                if key not in value:
+                    errors.append((path + (key,), "is missing"))
+            for key, check_child in properties:
+                if key in value:
+                    check_child(value[key], path + (key,), errors)
+        elif items is not None:
+            for index, item in enumerate(value):
+                items(item, path + (index,), errors)
+    return check
+
+
+check_course = compile_schema(COURSE_RESPONSE_SCHEMA)
+check_lesson = compile_schema(LESSON_SCHEMA)
+check_quiz_item = compile_schema(QUIZ_ITEM_SCHEMA)
+
+
+def _answer_errors(item, path):
+    # Assumes the question already passed its schema check.
+    answers = item['answer'] if isinstance(item['answer'], list) else [item['answer']]
+    if not answers or any(answer not in item['options'] for answer in answers):
+        return [(path + ('answer',), "is not one of the options")]
+    return []
+
+
+def _content_errors(lesson, path):
+    # Rules the schema cannot express; assumes the lesson already passed its schema check.
+    errors = []
+    for index, item in enumerate(lesson.get('quiz') or []):
+        errors.extend(_answer_errors(item, path + ('quiz', index)))
+    if lesson.get('lesson_type') == 'interactive_quiz' and not lesson.get('quiz'):
+        errors.append((path + ('quiz',), "is empty in an interactive_quiz lesson"))
+    return errors
+
+
+def quiz_item_errors(item, path=()):
+    """Schema errors of one quiz question, plus answers that are not among its options."""
+    errors = []
+    check_quiz_item(item, path, errors)
+    return errors or _answer_errors(item, path)
+
+
+def lesson_errors(lesson, path=()):
+    """Schema and content errors of one lesson (quiz questions included)."""
+    errors = []
+    check_lesson(lesson, path, errors)
+    return errors or _content_errors(lesson, path)
+
+
+def validate_course(course):
+    """Returns every (path, message) problem in a course; an empty list means it is valid."""
+    errors = []
+    check_course(course, (), errors)
+    broken = {path[:4] for path, _ in errors}
+    modules = course.get('modules') if isinstance(course, dict) else None
+    for module_index, module in enumerate(modules if isinstance(modules, list) else []):
+        lessons = module.get('lessons') if isinstance(module, dict) else None
+        for lesson_index, lesson in enumerate(lessons if isinstance(lessons, list) else []):
+            path = ('modules', module_index, 'lessons', lesson_index)
+            if path not in broken:
+                errors.extend(_content_errors(lesson, path))
+    return errors
+
+
+def format_path(path):
+    """('modules', 1, 'lessons', 0) -> 'modules[1].lessons[0]'."""
+    text = ''
+    for part in path:
+        text += f"[{part}]" if isinstance(part, int) else (f".{part}" if text else part)
+    return text or '(course)'
+
+
+def _repair_payload(broken, cube_type, skill_level, focus_area, learning_style):
+    fragments = "\n\n".join(
+        f"Lesson {number} (in module \"{module_title}\"), problems: "
+        + "; ".join(f"{format_path(path)} {message}" for path, message in errors)
+        + f"\n{json.dumps(lesson)[:2000]}"
+        for number, (_, _, module_title, lesson, errors) in enumerate(broken, 1)
+    )
+    prompt = (
+        f"These lessons from a {skill_level} {cube_type} course on {focus_area} ({learning_style} learning style) "
+        "came back incomplete or malformed. Return a corrected version of each one, in the same order, keeping "
+        "their topic and everything that was already fine. Every lesson needs lesson_title, lesson_type, content "
+        "and a steps array of {title, content}; interactive_quiz lessons need at least one quiz question whose "
+        "answer is one of its options. Wrap algorithms in [ALGORITHM: ...] tags.\n\n" + fragments
+    )
+    lesson_schema = dict(LESSON_SCHEMA, required=["lesson_title", "lesson_type", "content"])
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": {
+                "type": "OBJECT",
+                "properties": {"lessons": {"type": "ARRAY", "items": lesson_schema}},
+                "required": ["lessons"]
+            }
+        }
+    }
+
+
+def repair_course(course, cube_type, skill_level, focus_area, learning_style, model=None):
+    """Generator (use with `yield from`) returning (course or None, report) with only broken fragments fixed.
+
+    Expects IDs to be backfilled already; repaired lessons come back without IDs, so backfill again.
+    """
+    report = {"droppedQuizItems": 0, "repairedLessons": 0, "droppedLessons": 0, "droppedModules": 0}
+    if not isinstance(course, dict):
+        return None, report
+    with metrics.span('validate'):
+        errors = validate_course(course)
+    if not errors:
+        return course, report
+    log.info("Course has schema problems", count=len(errors), first=f"{format_path(errors[0][0])} {errors[0][1]}")
+
+    defaults = {"title": f"{str(focus_area).capitalize()} for {str(skill_level).capitalize()}s", "description": "",
+                "cubeType": cube_type, "level": skill_level}
+    for key, value in defaults.items():
+        if not isinstance(course.get(key), str):
+            course[key] = value
+    modules = course.get('modules') if isinstance(course.get('modules'), list) else []
+    report["droppedModules"] += sum(1 for module in modules if not isinstance(module, dict))
+    modules = [module for module in modules if isinstance(module, dict)]
+
+    broken = []  # (module_index, lesson_index, module_title, lesson, errors)
+    for module_index, module in enumerate(modules):
+        if not isinstance(module.get('module_title'), str):
+            module['module_title'] = f"Module {module_index + 1}"
+        lessons = module.get('lessons') if isinstance(module.get('lessons'), list) else []
+        module['lessons'] = lessons
+        for lesson_index, lesson in enumerate(lessons):
+            if not isinstance(lesson, dict):
+                broken.append((module_index, lesson_index, module['module_title'], lesson, [((), "is not an object")]))
+                continue
+            if isinstance(lesson.get('quiz'), list):
+                kept = [item for item in lesson['quiz'] if not quiz_item_errors(item)]
+                report["droppedQuizItems"] += len(lesson['quiz']) - len(kept)
+                lesson['quiz'] = kept
+            problems = lesson_errors(lesson)
+            if problems:
+                broken.append((module_index, lesson_index, module['module_title'], lesson, problems))
+
+    replacements = {}
+    to_repair = broken[:COURSE_REPAIR_MAX_LESSONS]
+    if to_repair:
+        log.debug("Repairing broken lessons", lessons=[f"modules[{m}].lessons[{l}]" for m, l, _, _, _ in to_repair])
+        try:
+            response_data = yield gemini_client.routed_call(
+                'course_repair', _repair_payload(to_repair, cube_type, skill_level, focus_area, learning_style), model,
+                optional=True)
+            text = "".join(part['text'] for part in response_data['candidates'][0]['content']['parts'])
+            repaired = extract_json_object(text).get('lessons') or []
+        except (gemini_client.UpstreamError, *gemini_client.SHED_ERRORS, json.JSONDecodeError, KeyError, IndexError,
+                TypeError, AttributeError) as e:
+            log.error("Course repair call failed, dropping the broken lessons instead", error=str(e))
+            repaired = []
+        for (module_index, lesson_index, _, _, _), lesson in zip(to_repair, repaired):
+            if isinstance(lesson, dict):
+                # The repair schema leaves IDs out; give lesson_errors a placeholder, the caller backfills it.
+                candidate = dict(lesson, lesson_id=lesson.get('lesson_id') or '')
+                if not lesson_errors(candidate):
+                    lesson.pop('lesson_id', None)
+                    replacements[(module_index, lesson_index)] = lesson
+
+    broken_keys = {(module_index, lesson_index) for module_index, lesson_index, _, _, _ in broken}
+    kept_modules = []
+    for module_index, module in enumerate(modules):
+        lessons = []
+        for lesson_index, lesson in enumerate(module['lessons']):
+            key = (module_index, lesson_index)
+            if key in replacements:
+                lessons.append(replacements[key])
+                report["repairedLessons"] += 1
+            elif key in broken_keys:
+                report["droppedLessons"] += 1
+            else:
+                lessons.append(lesson)
+        module['lessons'] = lessons
+        if lessons:
+            kept_modules.append(module)
+        else:
+            report["droppedModules"] += 1
+    course['modules'] = kept_modules
+    log.info("Course repair report", **report)
+    if not kept_modules:
+        return None, report
+    return course, report
+
+
+if __name__ == '__main__':
+    # Benchmark: validating a large course with the compiled checker.
+    import time
+
+    lesson = {"lesson_id": "l", "lesson_title": "Lesson", "lesson_type": "interactive_quiz", "content": "Text",
+              "scrambles": [], "algorithms": ["R U R' U'"],
+              "quiz": [{"question": "Q?", "options": ["a", "b", "c"], "answer": "a"}] * 4}
+    course = {"course_id": "c", "title": "Course", "description": "", "cubeType": "3x3", "level": "beginner",
+              "modules": [{"module_id": f"m{m}", "module_title": f"Module {m}", "lessons": [dict(lesson) for _ in range(6)]}
+                          for m in range(6)]}
+    started = time.perf_counter()
+    for _ in range(200):
+        validate_course(course)
+    print(f"valid course: {(time.perf_counter() - started) * 1000 / 200:.3f} ms per validation")
+    course['modules'][2]['lessons'][3]['quiz'] = [{"question": "Q?", "options": ["a"], "answer": "b"}]
+    del course['modules'][4]['lessons'][1]['content']
+    for path, message in validate_course(course):
+        print(f"  {format_path(path)} {message}")
@@ -0,0 +1,155 @@
+# api/_course_store.py inside your Vercel project's 'api' directory
+# Persistent store of generated courses, keyed on the normalized generation parameters.
+#
+# handle_generate_course boils every request down to (cube_type, skill_level, focus_area,
+# learning_style) before spending up to two minutes generating a course. Courses generated for a
+# tuple are kept in SQLite (up to COURSE_STORE_VARIANTS different variants per tuple) and later
+# requests for the same tuple are served from disk, rotating through the stored variants. The
+# whole store is bounded at COURSE_STORE_MAX_COURSES rows, evicting the least recently served.
+#
+# Stored courses have their IDs removed; the caller backfills fresh IDs on every serve so two
+# users (or the same user twice) never get courses with colliding IDs.
+#
+# Pre-generate the common combinations with:  python api/gemini-insight.py --warm-course-store
+
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+
+from _insight_cache import canonical_cube_type
+from _log import get_logger
+
+log = get_logger('course-store')
+
+# Vercel functions can only write under /tmp; point this at a persistent volume elsewhere.
+COURSE_STORE_DB = os.environ.get("COURSE_STORE_DB", "/tmp/course_store.sqlite3")
+COURSE_STORE_VARIANTS = int(os.environ.get("COURSE_STORE_VARIANTS", "3"))
+COURSE_STORE_MAX_COURSES = int(os.environ.get("COURSE_STORE_MAX_COURSES", "500"))
+
+# Combinations pre-generated by the warm-up command.
+COMMON_COURSE_PARAMS = [
+    ('3x3', level, focus, 'conceptual')
+    for level in ('beginner', 'intermediate', 'advanced')
+    for focus in ('general', 'cross', 'f2l', 'oll', 'pll')
+]
+
+ID_FIELDS = ('course_id', 'module_id', 'lesson_id', 'step_id')
+
+
+def course_store_key(cube_type, skill_level, focus_area, learning_style):
+    """Normalized key for a parameter tuple ('3x3x3', 'Beginner', 'F2L', ...) -> '3x3|beginner|f2l|...'."""
+    return "|".join([
+        canonical_cube_type(cube_type),
+        str(skill_level or 'beginner').strip().lower(),
+        str(focus_area or 'general').strip().lower(),
+        str(learning_style or 'conceptual').strip().lower(),
+    ])
+
+
+def strip_course_ids(course):
+    """Deep copy of a course with every course/module/lesson/step ID removed."""
+    def strip(node):
+        if isinstance(node, dict):
+            return {key: strip(value) for key, value in node.items() if key not in ID_FIELDS}
+        if isinstance(node, list):
+            return [strip(value) for value in node]
+        return copy.copy(node)
+    return strip(course)
+
+
+class CourseStore:
+    """Thread-safe SQLite store with several variants per key and LRU eviction."""
+
+    def __init__(self, db_path=COURSE_STORE_DB, variants=COURSE_STORE_VARIANTS, max_courses=COURSE_STORE_MAX_COURSES):
+        self.variants = variants
+        self.max_courses = max_courses
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS course_store ("
+                    "key TEXT NOT NULL, variant INTEGER NOT NULL, course TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (key, variant))"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                log.error("Course store disabled, could not open the database", db_path=db_path, error=str(e))
+                self._db = None
+
+    def get(self, key):
+        """Returns the least recently served variant for key (as a new, ID-less dict) or None."""
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT variant, course FROM course_store WHERE key = ? ORDER BY last_used ASC LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE course_store SET last_used = ? WHERE key = ? AND variant = ?", (time.time(), key, row[0]))
+            self._db.commit()
+            self.hits += 1
+            return json.loads(row[1])
+
+    def variant_count(self, key):
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM course_store WHERE key = ?", (key,)).fetchone()[0]
+
+    def put(self, key, course):
+        """Adds a course as a new variant, replacing the least recently served one when key is full."""
+        if self._db is None:
+            return
+        now = time.time()
+        template = json.dumps(strip_course_ids(course))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT variant FROM course_store WHERE key = ? ORDER BY last_used ASC", (key,)
+            ).fetchall()
+            used = {variant for (variant,) in rows}
+            if len(rows) < self.variants:
+                variant = next(index for index in range(self.variants + len(rows)) if index not in used)
+            else:
+                variant = rows[0][0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO course_store (key, variant, course, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, variant, template, now, now),
+            )
+            evicted = self._db.execute(
+                "DELETE FROM course_store WHERE rowid IN ("
+                "SELECT rowid FROM course_store ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_courses,),
+            ).rowcount
+            self.evictions += max(evicted, 0)
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            courses = keys = 0
+            if self._db is not None:
+                courses, keys = self._db.execute("SELECT COUNT(*), COUNT(DISTINCT key) FROM course_store").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "persistent": self._db is not None,
+                "courses": courses,
+                "keys": keys,
+                "variantsPerKey": self.variants,
+                "maxCourses": self.max_courses,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+course_store = CourseStore()
@@ -0,0 +1,46 @@
+# api/_course_stream.py inside your Vercel project's 'api' directory
+# Incremental scanner for course JSON streamed from Gemini.
+#
+# Text is fed in as it arrives; on top of the brace/string tracking of _json_extract's
+# JsonObjectScanner, the parser keeps the path of the object/array it is inside and reports every
+# modules[i] and modules[i].lessons[j] object the moment its closing brace arrives, so
+# handle_generate_course can forward it without waiting for the rest of the course.
+
+import re
+import json
+
+from _json_extract import JsonObjectScanner
+
+
+class CourseStreamParser(JsonObjectScanner):
+    """Scans a growing course JSON text and reports completed module and lesson objects.
+
+    feed() returns a list of completed objects as ('module', module_index, raw_json) or
+    ('lesson', (module_index, lesson_index), raw_json).
+    """
+
+    STRUCTURAL = re.compile(r'[{}\[\]"\\:,]')
+
+    def _token(self, c, i):
+        if c == ':':
+            if self.stack[-1]['kind'] == '{':
+                self.stack[-1]['key'] = json.loads(self.text[self.last_string[0]:self.last_string[1]])
+            return None
+        if c == ',':
+            frame = self.stack[-1]
+            if frame['kind'] == '[':
+                frame['index'] += 1
+            else:
+                frame['key'] = None
+            return None
+        frame = super()._token(c, i)
+        if c == '}' and frame is not None and self.stack:
+            path = self._path()
+            if len(path) == 2 and path[0] == 'modules':
+                self._completed.append(('module', path[1], self.text[frame['start']:i + 1]))
+            elif len(path) == 4 and path[0] == 'modules' and path[2] == 'lessons':
+                self._completed.append(('lesson', (path[1], path[3]), self.text[frame['start']:i + 1]))
+        return frame
+
+    def _path(self):
+        return [frame['key'] if frame['kind'] == '{' else frame['index'] for frame in self.stack]
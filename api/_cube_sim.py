@@ -0,0 +1,254 @@
+# api/_cube_sim.py inside your Vercel project's 'api' directory
+# Facelet-level simulator for 2x2, 3x3, 4x4 and pyraminx.
+#
+# A state is a small uint8 array with one entry (a face colour) per sticker. Every move is a
+# precomputed permutation of sticker positions, so applying a move is one gather:
+# new_state = state[perm]. The permutations are derived once from geometry (rotate the sticker
+# centres of the turning layers and match them back to sticker positions) instead of being
+# typed in by hand. apply_sequences() turns a whole batch of states by a whole batch of move
+# sequences with one vectorized gather per move position.
+#
+# Benchmark with:  python api/_cube_sim.py
+
+import re
+
+import numpy as np
+
+CUBE_FACES = {  # Outward axis of each face, with y up and z toward the viewer.
+    'R': (1, 0, 0), 'L': (-1, 0, 0), 'U': (0, 1, 0), 'D': (0, -1, 0), 'F': (0, 0, 1), 'B': (0, 0, -1),
+}
+CUBE_COLOR_ORDER = ['U', 'R', 'F', 'D', 'L', 'B']
+
+MOVE_TOKEN = re.compile(r"^([A-Za-z]w?)(\d*)('?)$")
+
+
+def rotation_matrix(axis, angle):
+    """Rodrigues rotation matrix for a right-handed rotation of `angle` radians about `axis`."""
+    axis = np.asarray(axis, dtype=float)
+    axis = axis / np.linalg.norm(axis)
+    x, y, z = axis
+    cross = np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+    return np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * cross @ cross
+
+
+def permutation_for(points, axis, angle, mask):
+    """Gather permutation for rotating the stickers in `mask`: new_state = state[perm]."""
+    rotated = points.copy()
+    rotated[mask] = points[mask] @ rotation_matrix(axis, angle).T
+    distances = ((rotated[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+    destination = distances.argmin(axis=1)
+    if not np.allclose(distances[np.arange(len(points)), destination], 0, atol=1e-6) or \
+            len(set(destination.tolist())) != len(points):
+        raise ValueError("Move does not map stickers onto stickers.")
+    perm = np.empty(len(points), dtype=np.intp)
+    perm[destination] = np.arange(len(points))
+    return perm
+
+
+class PuzzleModel:
+    """Sticker geometry plus a table of move permutations for one puzzle."""
+
+    def __init__(self, name, points, sticker_faces, face_count, base_moves, quarter_turns):
+        self.name = name
+        self.sticker_count = len(points)
+        self.face_count = face_count
+        self.solved = np.asarray(sticker_faces, dtype=np.uint8)
+
+        tokens = []
+        perms = []
+        for move_name, (axis, mask) in base_moves.items():
+            quarter = permutation_for(points, axis, -2 * np.pi / quarter_turns, mask)
+            powers = [quarter]
+            for _ in range(quarter_turns - 2):
+                powers.append(powers[-1][quarter])
+            # X, X' and (for cubes) X2.
+            tokens.append(move_name)
+            perms.append(powers[0])
+            tokens.append(move_name + "'")
+            perms.append(powers[-1])
+            if quarter_turns == 4:
+                tokens.append(move_name + '2')
+                perms.append(powers[1])
+        tokens.append('')  # Identity, used to pad sequences of different lengths.
+        perms.append(np.arange(self.sticker_count, dtype=np.intp))
+
+        self.tokens = tokens
+        self.token_codes = {token: code for code, token in enumerate(tokens)}
+        self.identity_code = len(tokens) - 1
+        self.move_perms = np.stack(perms)
+        self.quarter_turns = quarter_turns
+
+    def parse(self, algorithm):
+        """Parses move notation ("R U R' U'", "(r U2) x'", "R2'") into an array of move codes."""
+        codes = []
+        for raw in re.sub(r"[()\[\],]", ' ', str(algorithm)).replace('’', "'").split():
+            match = MOVE_TOKEN.match(raw)
+            if not match:
+                raise ValueError(f"Unrecognized move '{raw}' for {self.name}.")
+            base, amount, prime = match.groups()
+            turns = int(amount or 1) % self.quarter_turns
+            if prime:
+                turns = (-turns) % self.quarter_turns
+            if turns == 0:
+                continue
+            suffix = {1: '', self.quarter_turns - 1: "'"}.get(turns, '2')
+            code = self.token_codes.get(base + suffix)
+            if code is None:
+                raise ValueError(f"Unrecognized move '{raw}' for {self.name}.")
+            codes.append(code)
+        return np.asarray(codes, dtype=np.int16)
+
+    def pad(self, code_lists):
+        """Stacks code arrays of different lengths into one identity-padded (count, length) array."""
+        length = max((len(codes) for codes in code_lists), default=0)
+        padded = np.full((len(code_lists), length), self.identity_code, dtype=np.int16)
+        for row, codes in enumerate(code_lists):
+            padded[row, :len(codes)] = codes
+        return padded
+
+    def solved_states(self, count=1):
+        return np.tile(self.solved, (count, 1))
+
+    def sequence_permutation(self, codes):
+        """Composes a move sequence into a single permutation (apply with state[perm])."""
+        perm = np.arange(self.sticker_count, dtype=np.intp)
+        for code in codes:
+            perm = perm[self.move_perms[code]]
+        return perm
+
+    def apply_sequences(self, states, sequences):
+        """Applies sequences[i] to states[i] for every row at once.
+
+        `states` is (count, stickers) or a single state; `sequences` is (count, length) or a
+        single sequence. A single state or sequence is broadcast against the other argument.
+        """
+        states = np.atleast_2d(np.asarray(states, dtype=np.uint8))
+        sequences = np.atleast_2d(np.asarray(sequences, dtype=np.int16))
+        if len(sequences) == 1 and len(states) > 1:
+            # Same sequence for every state: compose it once, then do one gather.
+            return states[:, self.sequence_permutation(sequences[0])]
+        if len(states) == 1 and len(sequences) > 1:
+            states = np.repeat(states, len(sequences), axis=0)
+        for position in range(sequences.shape[1]):
+            states = np.take_along_axis(states, self.move_perms[sequences[:, position]], axis=1)
+        return states
+
+    def apply(self, state, algorithm):
+        """Applies one algorithm string to one state."""
+        return self.apply_sequences(state, self.parse(algorithm)[None, :])[0]
+
+    def is_solved(self, states):
+        """True for each state whose faces are all a single colour (any orientation)."""
+        states = np.atleast_2d(states)
+        by_face = states.reshape(len(states), self.face_count, -1)
+        return (by_face == by_face[:, :, :1]).all(axis=(1, 2))
+
+
+def build_cube(size):
+    """Builds an NxN cube: face turns, two-layer wide turns (Rw, or lowercase r), 3x3 slices and rotations."""
+    half = size / 2
+    offsets = np.arange(size) - half + 0.5
+    points = []
+    faces = []
+    for face_name in CUBE_COLOR_ORDER:
+        normal = np.array(CUBE_FACES[face_name], dtype=float)
+        # Two in-plane axes for this face.
+        in_plane = [np.array(axis, dtype=float) for axis in np.eye(3) if abs(np.dot(axis, normal)) < 0.5]
+        for a in offsets:
+            for b in offsets:
+                points.append(normal * half + in_plane[0] * a + in_plane[1] * b)
+                faces.append(CUBE_COLOR_ORDER.index(face_name))
+    points = np.array(points)
+
+    def layers(face_name, first, last):
+        """Mask of stickers in layers first..last (0 = the face's own layer)."""
+        depth = half - points @ np.array(CUBE_FACES[face_name], dtype=float)
+        layer = np.minimum(np.floor(depth + 1e-9), size - 1)
+        return (layer >= first) & (layer <= last)
+
+    base_moves = {}
+    for face_name in CUBE_FACES:
+        axis = CUBE_FACES[face_name]
+        base_moves[face_name] = (axis, layers(face_name, 0, 0))
+        if size >= 3:
+            base_moves[face_name + 'w'] = (axis, layers(face_name, 0, 1))
+            base_moves[face_name.lower()] = (axis, layers(face_name, 0, 1))
+    if size == 3:
+        base_moves['M'] = (CUBE_FACES['L'], layers('L', 1, 1))
+        base_moves['E'] = (CUBE_FACES['D'], layers('D', 1, 1))
+        base_moves['S'] = (CUBE_FACES['F'], layers('F', 1, 1))
+    base_moves['x'] = (CUBE_FACES['R'], layers('R', 0, size - 1))
+    base_moves['y'] = (CUBE_FACES['U'], layers('U', 0, size - 1))
+    base_moves['z'] = (CUBE_FACES['F'], layers('F', 0, size - 1))
+    return PuzzleModel(f"{size}x{size}", points, faces, 6, base_moves, quarter_turns=4)
+
+
+def build_pyraminx():
+    """Builds a pyraminx: main moves (R L U B) turn two layers, tips (r l u b) turn one."""
+    radius = np.sqrt(8) / 3
+    vertices = {
+        'U': np.array([0.0, 1.0, 0.0]),
+        'L': np.array([-radius * np.sin(np.pi / 3), -1 / 3, radius * np.cos(np.pi / 3)]),
+        'R': np.array([radius * np.sin(np.pi / 3), -1 / 3, radius * np.cos(np.pi / 3)]),
+        'B': np.array([0.0, -1 / 3, -radius]),
+    }
+    # Faces named after the vertex they are opposite to: F (opposite B), L, R and D.
+    face_corners = [('U', 'L', 'R'), ('U', 'B', 'L'), ('U', 'R', 'B'), ('L', 'B', 'R')]
+    points = []
+    faces = []
+    for face_index, corners in enumerate(face_corners):
+        a, b, c = (vertices[name] for name in corners)
+        # 6 upward and 3 downward triangles of the 3x3 triangular grid, by barycentric centroid.
+        centroids = [(i + 1 / 3, j + 1 / 3, 2 - i - j + 1 / 3) for i in range(3) for j in range(3 - i)]
+        centroids += [(i + 2 / 3, j + 2 / 3, 1 - i - j + 2 / 3) for i in range(2) for j in range(2 - i)]
+        for wa, wb, wc in centroids:
+            points.append((wa * a + wb * b + wc * c) / 3)
+            faces.append(face_index)
+    points = np.array(points)
+
+    base_moves = {}
+    for name, vertex in vertices.items():
+        height = points @ (vertex / np.linalg.norm(vertex))
+        top = np.linalg.norm(vertex)
+        span = top * 4 / 3  # Vertex to opposite face.
+        base_moves[name] = (vertex, height > top - span * 2 / 3)
+        base_moves[name.lower()] = (vertex, height > top - span / 3)
+    return PuzzleModel('pyraminx', points, faces, 4, base_moves, quarter_turns=3)
+
+
+PUZZLE_MODELS = {
+    '2x2': build_cube(2),
+    '3x3': build_cube(3),
+    '4x4': build_cube(4),
+    'pyraminx': build_pyraminx(),
+}
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    from _scramble_engine import generate_scrambles
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type=int, default=10000)
+    args = parser.parse_args()
+
+    for cube_type, model in PUZZLE_MODELS.items():
+        scrambles = generate_scrambles(cube_type, args.states, seed=0)
+        sequences = model.pad([model.parse(scramble) for scramble in scrambles])
+        states = model.solved_states(args.states)
+
+        started = time.perf_counter()
+        single_count = min(args.states, 2000)
+        for row in range(single_count):
+            model.apply_sequences(states[row], sequences[row])
+        single_rate = single_count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        scrambled = model.apply_sequences(states, sequences)
+        batch_rate = args.states / (time.perf_counter() - started)
+
+        moves_per_state = sequences.shape[1]
+        print(f"{cube_type:>9}: single={single_rate:,.0f} states/s  batched={batch_rate:,.0f} states/s "
+              f"({batch_rate * moves_per_state:,.0f} moves/s, {moves_per_state} moves each)  "
+              f"solved_after_scramble={int(model.is_solved(scrambled).sum())}")
@@ -0,0 +1,812 @@
+# api/_gemini_client.py inside your Vercel project's 'api' directory
+# Shared upstream client for every Gemini call made by gemini-insight.py and gemini-nlu.py.
+# The leading underscore keeps Vercel from deploying this helper as its own function.
+#
+# One requests.Session with a keep-alive connection pool is shared by all handlers and threads,
+# so warm invocations reuse the TCP+TLS connection to generativelanguage.googleapis.com instead
+# of paying a fresh handshake per request.
+#
+# Handlers never call the network themselves: they are generators that yield an UpstreamCall and
+# receive the decoded response back. run_sync() drives them with the pooled requests.Session for
+# Flask; run_async() drives the very same generators with a shared httpx.AsyncClient for the ASGI
+# serving mode in _asgi.py, where one process can hold hundreds of upstream calls in flight.
+#
+# Identical upstream calls (same request type, model and payload) that are in flight at the same
+# time are coalesced with _single_flight: a double-click waits for the call already being made
+# instead of paying for a second generation. Finished responses are not replayed: a later
+# identical call (a `fresh` course, the next warm-up variant, another user) gets its own
+# generation. Replaying a finished response is left to Idempotency-Key requests.
+#
+# Every upstream wait is recorded in _metrics (latency histogram, the request's 'upstream' span and
+# the usageMetadata token counters).
+#
+# Every call that actually goes upstream (the single-flight leader, or an opened stream) first takes
+# a slot from _admission.upstream_limiter, which caps concurrent Gemini calls per process and serves
+# NLU before insight before course calls. A call the limiter sheds raises AdmissionRejected, which
+# run_sync()/run_async() pass straight out of the handler so the endpoint can answer 503 with
+# Retry-After. Calls made with optional=True (a course repair, a chat summary) are ones the handler
+# can do without: their shed errors (SHED_ERRORS) are raised into the handler like any other
+# upstream error, so it falls back instead of failing the whole request.
+#
+# Transient failures (connection errors, timeouts, 429 and 5xx) are retried with jittered
+# exponential backoff while the _resilience retry budget and the call's own timeout allow. Short
+# calls (HEDGE_REQUEST_TYPES) that run past the model's p95 latency get a hedged duplicate, and the
+# first answer wins. A model whose recent calls mostly failed trips its circuit breaker, and calls
+# to it fail at once with UpstreamUnavailable (passed out of the handler like AdmissionRejected)
+# until a probe call gets through again.
+#
+# Handlers get their UpstreamCall from routed_call(), which lets _model_routing pick the cheapest
+# model that meets the request type's latency budget. When a call still fails after its retries
+# (or its model's breaker is open), it fails over to the next model of its route.
+#
+# Set GEMINI_STANDIN=1 to answer every call locally with canned responses (no network, no API key),
+# which is what the benchmark at the bottom of this file uses when run offline.
+
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import namedtuple
+from concurrent import futures
+from contextlib import contextmanager, nullcontext
+import requests
+from requests.adapters import HTTPAdapter
+
+from _single_flight import SingleFlight, fingerprint
+from _admission import AdmissionRejected, upstream_limiter, UPSTREAM_MAX_CONCURRENCY
+import _resilience as resilience
+import _model_routing as model_routing
+import _metrics as metrics
+from _log import get_logger
+
+log = get_logger('gemini-client')
+
+GEMINI_API_ROOT = os.environ.get("GEMINI_API_ROOT", "https://generativelanguage.googleapis.com").rstrip('/')
+
+# (connect, read) timeouts in seconds per request type. The connect timeout stays short so a
+# dead upstream fails fast; the read timeout reflects how long each kind of generation can take.
+REQUEST_TIMEOUTS = {
+    'insight': (3.05, 30),
+    'lesson_chat': (3.05, 30),
+    'generate_course': (3.05, 120),
+    'course_repair': (3.05, 60),
+    'nlu': (3.05, 10),
+}
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Pool limits. POOL_MAXSIZE bounds the keep-alive connections kept per host; extra concurrent
+# callers still get a connection, it just isn't returned to the pool afterwards.
+POOL_CONNECTIONS = int(os.environ.get("GEMINI_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.environ.get("GEMINI_POOL_MAXSIZE", "32"))
+# The async client multiplexes many requests over few threads, so its ceiling is much higher.
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("GEMINI_ASYNC_MAX_CONNECTIONS", "512"))
+
+# Upstream statuses worth retrying: rate limited, or failed on the server side.
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Calls short enough to hedge: once one has waited past the model's HEDGE_QUANTILE latency, a
+# duplicate is sent and whichever answers first is used.
+HEDGE_REQUEST_TYPES = {name.strip() for name in os.environ.get("GEMINI_HEDGE_TYPES", "insight,nlu").split(',') if name.strip()}
+HEDGE_QUANTILE = float(os.environ.get("GEMINI_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.environ.get("GEMINI_HEDGE_MIN_DELAY", "0.05"))  # seconds
+
+STANDIN_MODE = os.environ.get("GEMINI_STANDIN", "").lower() in ("1", "true", "yes")
+STANDIN_LATENCY_MS = float(os.environ.get("GEMINI_STANDIN_LATENCY_MS", "0"))
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = {}  # event loop -> httpx.AsyncClient
+
+# What a handler yields when it needs Gemini: the request type picks the timeout. `optional` marks
+# a call the handler has a fallback for (see run_sync).
+UpstreamCall = namedtuple('UpstreamCall', ['request_type', 'model', 'payload', 'api_version', 'optional'],
+                          defaults=['v1beta', False])
+
+upstream_flights = SingleFlight()
+
+# Runs the racing attempts of hedged blocking calls. Every attempt holds an upstream slot, so the
+# pool never has more work than two threads per slot.
+_hedge_pool = futures.ThreadPoolExecutor(max_workers=2 * UPSTREAM_MAX_CONCURRENCY, thread_name_prefix='gemini-hedge')
+
+
+def routed_call(request_type, payload, model=None, optional=False):
+    """An UpstreamCall on the model _model_routing picks for this request type and payload, or on
+    `model` if one is pinned. With optional=True, shed errors are raised into the handler."""
+    if model is None:
+        model, api_version = model_routing.route(request_type, payload)
+    else:
+        api_version = model_routing.MODELS[model].api_version if model in model_routing.MODELS else 'v1beta'
+    return UpstreamCall(request_type, model, payload, api_version, optional)
+
+
+def call_key(call):
+    """Single-flight key for an UpstreamCall: identical calls share one upstream request."""
+    return fingerprint([call.request_type, call.model, call.api_version, call.payload])
+
+
+class UpstreamError(Exception):
+    """Raised into a handler when the Gemini call fails. `details` holds the upstream error body, if any."""
+
+    def __init__(self, message, status_code=None, details=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class UpstreamConnectionError(UpstreamError):
+    """The upstream host could not be reached."""
+
+
+class UpstreamTimeout(UpstreamError):
+    """The upstream call exceeded its timeout."""
+
+
+class UpstreamUnavailable(UpstreamConnectionError):
+    """The model's circuit breaker is open: recent calls failed, so this one was not attempted.
+
+    Like AdmissionRejected, it is passed straight out of the handler (503 with Retry-After).
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message, status_code=503)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+    def headers(self):
+        return {'Retry-After': str(self.retry_after)}
+
+
+# Load turned away before reaching Gemini. run_sync()/run_async() pass these straight out of the
+# handler, except for optional calls.
+SHED_ERRORS = (AdmissionRejected, UpstreamUnavailable)
+
+
+def get_session():
+    """Returns the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = StandInAdapter() if STANDIN_MODE else HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def model_url(model, api_version='v1beta', method='generateContent'):
+    """Builds the generateContent (or streamGenerateContent) URL for a model on the given API version."""
+    return f"{GEMINI_API_ROOT}/{api_version}/models/{model}:{method}"
+
+
+def request_headers():
+    """Headers for a Gemini call. The key is read per call so a rotated key takes effect immediately."""
+    return {
+        'Content-Type': 'application/json',
+        'x-goog-api-key': os.environ.get("GEMINI_API_KEY") or '',
+    }
+
+
+def generate_content(request_type, model, payload, api_version='v1beta'):
+    """POSTs a generateContent payload through the shared pool and returns the requests.Response.
+
+    The caller is responsible for raise_for_status() and decoding, exactly as with requests.post.
+    """
+    return get_session().post(
+        model_url(model, api_version),
+        headers=request_headers(),
+        json=payload,
+        timeout=REQUEST_TIMEOUTS.get(request_type, DEFAULT_TIMEOUT),
+    )
+
+
+@contextmanager
+def translate_requests_errors():
+    """Re-raises requests exceptions as the UpstreamError family handlers catch."""
+    try:
+        yield
+    except requests.exceptions.ConnectionError as e:
+        raise UpstreamConnectionError(str(e)) from e
+    except requests.exceptions.Timeout as e:
+        raise UpstreamTimeout(str(e)) from e
+    except requests.exceptions.RequestException as e:
+        response = getattr(e, 'response', None)
+        raise UpstreamError(
+            str(e),
+            status_code=response.status_code if response is not None else None,
+            details=response.text if response is not None else None,
+        ) from e
+
+
+@contextmanager
+def timed_upstream(call):
+    """Records an upstream wait in the latency histogram and as the current request's 'upstream' span."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    except UpstreamError as e:
+        outcome = type(e).__name__
+        raise
+    except AdmissionRejected:
+        outcome = 'shed'
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.UPSTREAM_SECONDS.observe(seconds, call_type=call.request_type, model=call.model, outcome=outcome)
+        metrics.record_span('upstream', seconds)
+
+
+def is_transient(exc):
+    """True for upstream failures that a later attempt may not hit: connection errors, timeouts, 429, 5xx."""
+    if isinstance(exc, UpstreamUnavailable):
+        return False
+    if isinstance(exc, (UpstreamConnectionError, UpstreamTimeout)):
+        return True
+    return isinstance(exc, UpstreamError) and exc.status_code in TRANSIENT_STATUS_CODES
+
+
+# Gemini's 429 bodies carry a RetryInfo detail saying when the quota frees up.
+_RETRY_INFO_DELAY = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+def retry_delay(call, exc, attempt, started):
+    """Seconds to back off before retrying `call` after `exc`, or None to give up and raise it."""
+    if not is_transient(exc) or attempt + 1 >= resilience.GEMINI_MAX_ATTEMPTS:
+        return None
+    delay = resilience.backoff_delay(attempt)
+    match = _RETRY_INFO_DELAY.search(exc.details or '') if exc.status_code == 429 else None
+    if match:
+        delay = max(delay, float(match.group(1)))
+    if time.monotonic() - started + delay >= REQUEST_TIMEOUTS.get(call.request_type, DEFAULT_TIMEOUT)[1] \
+            or delay >= model_routing.remaining_budget(call.request_type, call.payload):
+        return None  # The retry could not finish within the call's timeout or the request's latency budget.
+    if not resilience.retry_budget.try_spend():
+        resilience.UPSTREAM_RETRIES.inc(call_type=call.request_type, outcome='budget_exhausted')
+        return None
+    resilience.UPSTREAM_RETRIES.inc(call_type=call.request_type, outcome='retried')
+    log.info("Retrying upstream call", call_type=call.request_type, model=call.model,
+             attempt=attempt + 1, delay=round(delay, 3), error=str(exc))
+    return delay
+
+
+def failover(call, exc, failed_models):
+    """`call` moved to the next model of its route after `exc` ended its retries on every model in
+    `failed_models`, or None to give up and raise `exc`."""
+    if not (is_transient(exc) or isinstance(exc, UpstreamUnavailable)):
+        return None
+    choice = model_routing.next_model(call.request_type, call.payload, failed_models)
+    if choice is None or not resilience.retry_budget.try_spend():
+        return None
+    log.warning("Failing over to another model", call_type=call.request_type, failed=call.model,
+                model=choice[0], error=str(exc))
+    return call._replace(model=choice[0], api_version=choice[1])
+
+
+@contextmanager
+def upstream_attempt(call, record_latency=True):
+    """Wraps one request to Gemini: consults and feeds the model's circuit breaker and records the
+    latency of a successful attempt in resilience.latency_stats."""
+    breaker = resilience.breakers.get(call.model)
+    if not breaker.allow():
+        retry_after = breaker.retry_after()
+        raise UpstreamUnavailable(f"{call.model} is failing; calls to it are paused for {retry_after:.0f} s.", retry_after)
+    started = time.perf_counter()
+    try:
+        yield
+    except UpstreamError as e:
+        breaker.record(not is_transient(e))
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        breaker.abandon()
+        raise
+    except Exception:
+        breaker.record(True)  # Gemini answered; the failure is in what we made of the answer.
+        raise
+    breaker.record(True)
+    if record_latency:
+        resilience.latency_stats.record(call.request_type, call.model, time.perf_counter() - started)
+
+
+def hedge_delay(call):
+    """How long `call` waits before it is hedged, or None if it is not hedged."""
+    if call.request_type not in HEDGE_REQUEST_TYPES:
+        return None
+    latency = resilience.latency_stats.quantile(call.request_type, call.model, HEDGE_QUANTILE)
+    return None if latency is None else max(HEDGE_MIN_DELAY, latency)
+
+
+def hedge_slot(call):
+    """An upstream slot for a hedged duplicate of `call`, or None when hedging would add load to an
+    unhealthy or saturated upstream (breaker not closed, no free slot, retry budget spent)."""
+    slot = upstream_limiter.try_acquire(call.request_type) \
+        if resilience.breakers.get(call.model).state == 'closed' else None
+    if slot is not None and not resilience.retry_budget.try_spend():
+        slot.release()
+        slot = None
+    resilience.UPSTREAM_HEDGES.inc(call_type=call.request_type, outcome='skipped' if slot is None else 'sent')
+    return slot
+
+
+def attempt_sync(call, slot=None):
+    """One blocking generateContent request; returns the decoded JSON body."""
+    slot = slot or upstream_limiter.acquire(call.request_type)
+    try:
+        with upstream_attempt(call):
+            with translate_requests_errors():
+                response = generate_content(call.request_type, call.model, call.payload, call.api_version)
+                response.raise_for_status()
+            body = response.json()
+        metrics.record_usage(call.request_type, call.model, body)
+        return body
+    finally:
+        slot.release()
+
+
+def hedged_sync(call):
+    """attempt_sync, plus a duplicate attempt once the first has run past the hedge delay."""
+    delay = hedge_delay(call)
+    if delay is None:
+        return attempt_sync(call)
+    slot = upstream_limiter.acquire(call.request_type)
+    primary = _hedge_pool.submit(contextvars.copy_context().run, attempt_sync, call, slot)
+    if futures.wait([primary], timeout=delay).done:
+        return primary.result()
+    slot = hedge_slot(call)
+    if slot is None:
+        return primary.result()
+    hedge = _hedge_pool.submit(contextvars.copy_context().run, attempt_sync, call, slot)
+    # The first success wins; the losing request finishes in the background and is ignored.
+    pending, error = {primary, hedge}, None
+    while pending:
+        done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for attempt in done:
+            if attempt.exception() is None:
+                if attempt is hedge:
+                    resilience.UPSTREAM_HEDGES.inc(call_type=call.request_type, outcome='won')
+                return attempt.result()
+            error = error or attempt.exception()
+    raise error
+
+
+def call_with_retries(call):
+    """hedged_sync, retried with backoff while the failure is transient and the budget allows, then
+    failed over to the route's next model."""
+    resilience.retry_budget.record_call()
+    started = time.monotonic()
+    attempt = 0
+    failed_models = []
+    while True:
+        try:
+            return hedged_sync(call)
+        except UpstreamError as e:
+            delay = retry_delay(call, e, attempt, started)
+            if delay is None:
+                failed_models.append(call.model)
+                call = failover(call, e, failed_models)
+                if call is None:
+                    raise
+                attempt, delay = 0, 0
+        if delay:
+            time.sleep(delay)
+            attempt += 1
+
+
+def call_sync(call):
+    """Performs an UpstreamCall and returns the decoded JSON body, raising UpstreamError on failure."""
+    with timed_upstream(call):
+        return upstream_flights.do(call_key(call), lambda: call_with_retries(call))
+
+
+def open_stream(call):
+    """Starts a streamGenerateContent (SSE) call and returns the open response once headers arrive.
+
+    HTTP and connection errors are raised here, before any streamed content is handed out, so
+    opening the stream is retried (and failed over) like any other call. The response holds an
+    upstream slot until it is passed to close_stream(); `response.upstream_call` is the call that
+    was actually made.
+    """
+    resilience.retry_budget.record_call()
+    started = time.monotonic()
+    attempt = 0
+    failed_models = []
+    while True:
+        slot = upstream_limiter.acquire(call.request_type)
+        try:
+            # Time to first byte is not comparable with whole-call latencies, so it is not recorded.
+            with upstream_attempt(call, record_latency=False):
+                with translate_requests_errors():
+                    response = get_session().post(
+                        model_url(call.model, call.api_version, method='streamGenerateContent') + '?alt=sse',
+                        headers=request_headers(),
+                        json=call.payload,
+                        timeout=REQUEST_TIMEOUTS.get(call.request_type, DEFAULT_TIMEOUT),
+                        stream=True,
+                    )
+                    response.raise_for_status()
+        except UpstreamError as e:
+            slot.release()
+            delay = retry_delay(call, e, attempt, started)
+            if delay is None:
+                failed_models.append(call.model)
+                call = failover(call, e, failed_models)
+                if call is None:
+                    raise
+                attempt, delay = 0, 0
+        except BaseException:
+            slot.release()
+            raise
+        else:
+            response.upstream_slot = slot
+            response.upstream_call = call
+            return response
+        if delay:
+            time.sleep(delay)
+            attempt += 1
+
+
+def close_stream(response):
+    """Closes an open_stream() response and frees its upstream slot."""
+    try:
+        response.close()
+    finally:
+        response.upstream_slot.release()
+
+
+def iter_stream_text(response, call=None):
+    """Yields the candidate text of each streamed chunk from an open_stream() response.
+
+    With `call`, the whole stream is recorded as one upstream wait and its token usage counted
+    (against the model open_stream() actually used).
+    """
+    call = call and getattr(response, 'upstream_call', call)
+    response.encoding = response.encoding or 'utf-8'  # text/event-stream is sent without a charset.
+    usage_chunk = None
+    with timed_upstream(call) if call else nullcontext():
+        with translate_requests_errors():
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                chunk = json.loads(line[len('data:'):])
+                if chunk.get('usageMetadata'):
+                    usage_chunk = chunk  # Each chunk carries the running totals; the last one is final.
+                for candidate in chunk.get('candidates') or []:
+                    for part in (candidate.get('content') or {}).get('parts') or []:
+                        if part.get('text'):
+                            yield part['text']
+    if call and usage_chunk:
+        metrics.record_usage(call.request_type, call.model, usage_chunk)
+
+
+def get_async_client():
+    """Returns the httpx.AsyncClient for the running event loop, creating it on first use."""
+    import httpx  # Only the ASGI serving mode needs httpx.
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=POOL_MAXSIZE)
+        transport = httpx.MockTransport(standin_async_handler) if STANDIN_MODE else None
+        client = httpx.AsyncClient(limits=limits, transport=transport)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Closes the AsyncClient bound to the running event loop (ASGI lifespan shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def attempt_async(call, slot=None):
+    """Async counterpart of attempt_sync, on the shared AsyncClient."""
+    import httpx
+
+    connect_timeout, read_timeout = REQUEST_TIMEOUTS.get(call.request_type, DEFAULT_TIMEOUT)
+    slot = slot or await upstream_limiter.acquire_async(call.request_type)
+    try:
+        with upstream_attempt(call):
+            try:
+                response = await get_async_client().post(
+                    model_url(call.model, call.api_version),
+                    headers=request_headers(),
+                    json=call.payload,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                )
+                response.raise_for_status()
+            except httpx.ConnectError as e:
+                raise UpstreamConnectionError(str(e)) from e
+            except httpx.TimeoutException as e:
+                raise UpstreamTimeout(str(e)) from e
+            except httpx.HTTPStatusError as e:
+                raise UpstreamError(str(e), status_code=e.response.status_code, details=e.response.text) from e
+            except httpx.HTTPError as e:
+                raise UpstreamError(str(e)) from e
+            body = response.json()
+        metrics.record_usage(call.request_type, call.model, body)
+        return body
+    finally:
+        slot.release()
+
+
+async def hedged_async(call):
+    """Async counterpart of hedged_sync; the losing attempt is cancelled."""
+    delay = hedge_delay(call)
+    if delay is None:
+        return await attempt_async(call)
+    slot = await upstream_limiter.acquire_async(call.request_type)
+    racers = [(asyncio.ensure_future(attempt_async(call, slot)), slot)]
+    try:
+        primary = racers[0][0]
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        slot = hedge_slot(call)
+        if slot is None:
+            return await primary
+        hedge = asyncio.ensure_future(attempt_async(call, slot))
+        racers.append((hedge, slot))
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    if attempt is hedge:
+                        resilience.UPSTREAM_HEDGES.inc(call_type=call.request_type, outcome='won')
+                    return attempt.result()
+                error = error or attempt.exception()
+        raise error
+    finally:
+        for task, task_slot in racers:
+            task.cancel()
+            task_slot.release()  # A task cancelled before it started never releases its own slot.
+
+
+async def call_async(call):
+    """Async counterpart of call_sync, using non-blocking I/O on the shared AsyncClient."""
+    async def post(call):
+        resilience.retry_budget.record_call()
+        started = time.monotonic()
+        attempt = 0
+        failed_models = []
+        while True:
+            try:
+                return await hedged_async(call)
+            except UpstreamError as e:
+                delay = retry_delay(call, e, attempt, started)
+                if delay is None:
+                    failed_models.append(call.model)
+                    call = failover(call, e, failed_models)
+                    if call is None:
+                        raise
+                    attempt, delay = 0, 0
+            if delay:
+                await asyncio.sleep(delay)
+                attempt += 1
+    with timed_upstream(call):
+        return await upstream_flights.do_async(call_key(call), lambda: post(call))
+
+
+def upstream_stats():
+    """Upstream slots, current model routes, circuit breakers, retry budget and model latencies."""
+    return {**upstream_limiter.stats(), "routes": model_routing.stats(), "breakers": resilience.breakers.stats(),
+            "retryBudget": resilience.retry_budget.stats(), "latency": resilience.latency_stats.stats()}
+
+
+def error_response(exc):
+    """Maps an exception escaping a handler to the same (body, status) the Flask endpoints return."""
+    if isinstance(exc, AdmissionRejected):
+        return {"error": str(exc), "retryAfter": exc.retry_after}, exc.status
+    if isinstance(exc, UpstreamUnavailable):
+        return {"error": "The AI service is temporarily unavailable. Please try again shortly.", "retryAfter": exc.retry_after}, 503
+    if isinstance(exc, UpstreamConnectionError):
+        return {"error": "Network error: Could not connect to the AI service. Please check your internet connection or try again later."}, 503
+    if isinstance(exc, UpstreamTimeout):
+        return {"error": "AI service request timed out. The request took too long to get a response."}, 504
+    if isinstance(exc, UpstreamError):
+        return {"error": f"An unknown error occurred during the AI service request: {exc}"}, 500
+    if isinstance(exc, json.JSONDecodeError):
+        return {"error": f"Invalid JSON format in your request. Details: {exc}"}, 400
+    if isinstance(exc, ValueError):
+        return {"error": f"Invalid data received or generated: {exc}"}, 400
+    log.exception("An unexpected server-side error occurred", exc_info=exc)
+    return {"error": f"An unexpected internal server error occurred. Details: {str(exc)}."}, 500
+
+
+def run_sync(steps):
+    """Drives a handler generator to completion with blocking upstream calls; returns (body, status)."""
+    try:
+        call = next(steps)
+        while True:
+            try:
+                result = call_sync(call)
+            except SHED_ERRORS as e:
+                if call.optional:
+                    call = steps.throw(e)  # The handler falls back; if it doesn't catch e, e propagates.
+                    continue
+                steps.close()  # Shed load is answered by the endpoint, not turned into a handler error.
+                raise
+            except Exception as e:
+                call = steps.throw(e)
+            else:
+                call = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_async(steps):
+    """Drives a handler generator to completion with non-blocking upstream calls; returns (body, status)."""
+    try:
+        call = next(steps)
+        while True:
+            try:
+                result = await call_async(call)
+            except SHED_ERRORS as e:
+                if call.optional:
+                    call = steps.throw(e)  # The handler falls back; if it doesn't catch e, e propagates.
+                    continue
+                steps.close()  # Shed load is answered by the endpoint, not turned into a handler error.
+                raise
+            except Exception as e:
+                call = steps.throw(e)
+            else:
+                call = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+# --- Local stand-in -------------------------------------------------------------------------
+
+STANDIN_TEXT = {
+    'insight': json.dumps({
+        "scrambleAnalysis": "This scramble has a short cross on the white face.",
+        "personalizedTip": "Plan your first F2L pair during inspection.",
+        "targetedPracticeFocus": "Do ten untimed solves focusing on look-ahead."
+    }),
+    'lesson_chat': "That sounds great! Which cube type would you like to focus on?",
+    'generate_course': json.dumps({
+        "course_id": "standin-course",
+        "title": "F2L for Beginners",
+        "description": "A stand-in course returned without calling Gemini.",
+        "cubeType": "3x3",
+        "level": "beginner",
+        "modules": [{
+            "module_id": "standin-module-1",
+            "module_title": "Module 1: Pairs",
+            "lessons": [{
+                "lesson_id": "standin-lesson-1",
+                "lesson_title": "Basic Inserts",
+                "lesson_type": "conceptual",
+                "content": "Insert a pair with [ALGORITHM: R U R' U'].",
+                "steps": [{"step_id": "standin-step-1", "title": "Insert", "content": "Use [ALGORITHM: R U R' U']."}]
+            }]
+        }]
+    }),
+    'course_repair': json.dumps({"lessons": [{
+        "lesson_title": "Basic Inserts",
+        "lesson_type": "conceptual",
+        "content": "Insert a pair with [ALGORITHM: R U R' U'].",
+        "steps": [{"title": "Insert", "content": "Use [ALGORITHM: R U R' U']."}]
+    }]}),
+    'nlu': json.dumps({"canonicalCommand": "start_timer", "commandValue": None, "confidence": 1.0}),
+}
+
+
+def standin_kind(payload):
+    """Which call type a generateContent payload looks like (a key of STANDIN_TEXT)."""
+    config = payload.get('generationConfig') or {}
+    properties = (config.get('responseSchema') or {}).get('properties') or {}
+    system_text = json.dumps(payload.get('systemInstruction') or {})
+    if 'modules' in properties:
+        return 'generate_course'
+    if 'lessons' in properties:
+        return 'course_repair'
+    if 'personalizedTip' in properties:
+        return 'insight'
+    if 'canonicalCommand' in system_text:
+        return 'nlu'
+    return 'lesson_chat'
+
+
+def standin_text_for(payload):
+    """Picks the canned text that matches the shape of a generateContent payload."""
+    return STANDIN_TEXT[standin_kind(payload)]
+
+
+def standin_body(request_body, text=None):
+    """Builds a generateContent response body for a raw request body (answering `text` if given)."""
+    if text is None:
+        text = standin_text_for(json.loads(request_body or b'{}'))
+    # Rough token counts (about four characters per token) so the usage metrics move in stand-in mode.
+    prompt_tokens, candidate_tokens = len(request_body or b'') // 4, len(text) // 4
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": candidate_tokens,
+                          "totalTokenCount": prompt_tokens + candidate_tokens},
+    }
+
+
+async def standin_async_handler(request):
+    """httpx.MockTransport handler used by the async client in stand-in mode."""
+    import httpx
+
+    if STANDIN_LATENCY_MS:
+        await asyncio.sleep(STANDIN_LATENCY_MS / 1000)
+    return httpx.Response(200, json=standin_body(await request.aread()))
+
+
+def standin_sse(body, pieces=8):
+    """Splits a stand-in response into SSE chunks the way streamGenerateContent?alt=sse sends them."""
+    text = body['candidates'][0]['content']['parts'][0]['text']
+    size = max(1, -(-len(text) // pieces))
+    events = []
+    for offset in range(0, len(text), size):
+        chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": text[offset:offset + size]}]}}],
+                 "usageMetadata": body['usageMetadata']}
+        events.append(f"data: {json.dumps(chunk)}\r\n\r\n")
+    return ''.join(events)
+
+
+class StandInAdapter(HTTPAdapter):
+    """Transport adapter that answers generateContent calls locally instead of over the network."""
+
+    def send(self, request, **kwargs):
+        if STANDIN_LATENCY_MS:
+            time.sleep(STANDIN_LATENCY_MS / 1000)
+        body = standin_body(request.body)
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        if 'streamGenerateContent' in request.url:
+            response.headers['Content-Type'] = 'text/event-stream'
+            response._content = standin_sse(body).encode('utf-8')
+        else:
+            response.headers['Content-Type'] = 'application/json'
+            response._content = json.dumps(body).encode('utf-8')
+        response._content_consumed = True  # Lets iter_lines() replay _content instead of reading a socket.
+        return response
+
+
+if __name__ == '__main__':
+    # Offline benchmark: GEMINI_STANDIN=1 python api/_gemini_client.py --requests 500 --threads 16
+    # Point GEMINI_API_ROOT at a local mock server to include real keep-alive connections.
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--type', default='insight', choices=sorted(REQUEST_TIMEOUTS))
+    args = parser.parse_args()
+
+    bench_payload = {
+        "contents": [{"role": "user", "parts": [{"text": "benchmark"}]}],
+        "generationConfig": {"responseSchema": {"properties": {"personalizedTip": {}}}},
+    }
+
+    model, api_version = model_routing.route(args.type, bench_payload)
+
+    def timed_call(_):
+        started = time.perf_counter()
+        generate_content(args.type, model, bench_payload, api_version).raise_for_status()
+        return time.perf_counter() - started
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = sorted(pool.map(timed_call, range(args.requests)))
+    wall = time.perf_counter() - wall_started
+
+    print(f"mode={'standin' if STANDIN_MODE else GEMINI_API_ROOT} requests={args.requests} threads={args.threads}")
+    print(f"throughput={args.requests / wall:.1f} req/s "
+          f"p50={latencies[len(latencies) // 2] * 1000:.2f}ms "
+          f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.2f}ms")
@@ -0,0 +1,161 @@
+# api/_history_features.py inside your Vercel project's 'api' directory
+# Reduces a SolveHistory of any length to a small, fixed-size summary for the insight prompt.
+#
+# Pasting raw history into a prompt grows tokens (and upstream latency) with every solve. Instead
+# a handful of NumPy reductions pick out what a coach would look at: PB, mean and spread, DNF rate,
+# the recent trend, how the current session compares with earlier ones and how the other puzzle
+# types are going. describe_history_features() renders that as a few lines of text whose length
+# does not depend on the history size; the same text is folded into the insight cache key.
+#
+# Benchmark with:  python api/_history_features.py --solves 50000
+
+import os
+
+import numpy as np
+
+from _solve_history import PENALTY_CODES, history_results
+from _solve_stats import summarize_results
+from _insight_cache import canonical_cube_type
+
+# A gap longer than this between two solves starts a new session.
+HISTORY_SESSION_GAP_MS = int(os.environ.get("HISTORY_SESSION_GAP_MS", str(30 * 60 * 1000)))
+# How many recent solves the trend line is fitted over.
+HISTORY_TREND_WINDOW = int(os.environ.get("HISTORY_TREND_WINDOW", "100"))
+# Cube types listed in the per-type breakdown (most-practised first).
+HISTORY_MAX_CUBE_TYPES = 4
+
+
+def _ms(value):
+    """Rounds a duration to 0.1 s so small changes don't alter the prompt (or the cache key)."""
+    return None if value is None or not np.isfinite(value) else int(round(value / 100.0)) * 100
+
+
+def _average(summary):
+    """Rounded current average from summarize_results(), keeping 'DNF' as is."""
+    current = summary["current"] if summary else None
+    return current if current in (None, 'DNF') else _ms(current)
+
+
+def _finite_stats(results):
+    finite = results[np.isfinite(results)]
+    if not len(finite):
+        return None, None, None
+    return float(finite.min()), float(finite.mean()), float(finite.std())
+
+
+def _trend(results):
+    """Least-squares slope of the last HISTORY_TREND_WINDOW finite results, in ms per 100 solves."""
+    recent = results[np.isfinite(results)][-HISTORY_TREND_WINDOW:]
+    if len(recent) < 10:
+        return None
+    index = np.arange(len(recent), dtype=np.float64)
+    index -= index.mean()
+    return float((index * (recent - recent.mean())).sum() / (index ** 2).sum()) * 100
+
+
+def _sessions(timestamps, results):
+    """Current-session size and mean versus the mean of all earlier sessions."""
+    if not len(timestamps) or not timestamps.any():
+        return None  # No usable timestamps, so sessions can't be told apart.
+    starts = np.flatnonzero(np.diff(timestamps) > HISTORY_SESSION_GAP_MS) + 1
+    current_start = int(starts[-1]) if len(starts) else 0
+    _, current_mean, _ = _finite_stats(results[current_start:])
+    _, previous_mean, _ = _finite_stats(results[:current_start])
+    return {
+        "count": len(starts) + 1,
+        "currentSessionSolves": len(results) - current_start,
+        "currentSessionMean": _ms(current_mean),
+        "previousSessionsMean": _ms(previous_mean),
+    }
+
+
+def extract_history_features(history, cube_type=None):
+    """Fixed-size feature dict for a SolveHistory. Solves without a cube type count as `cube_type`."""
+    results = history_results(history)
+    type_names = np.array([canonical_cube_type(name) if name else '' for name in history.cube_types] or [''])
+    solve_types = type_names[history.cube_type_code] if len(results) else np.zeros(0, dtype=type_names.dtype)
+    wanted = canonical_cube_type(cube_type) if cube_type else None
+    if wanted:
+        solve_types = np.where(solve_types == '', wanted, solve_types)
+        selected = solve_types == wanted
+    else:
+        selected = np.ones(len(results), dtype=bool)
+
+    own = results[selected]
+    best, mean, spread = _finite_stats(own)
+    recent = summarize_results(own[-12:].tolist(), (5, 12))["averages"] if len(own) else {}
+    features = {
+        "solveCount": int(len(own)),
+        "personalBest": _ms(best),
+        "mean": _ms(mean),
+        "stdDev": _ms(spread),
+        "dnfRate": round(float((history.penalty[selected] == PENALTY_CODES['DNF']).mean()), 2) if len(own) else None,
+        "ao5": _average(recent.get("ao5")),
+        "ao12": _average(recent.get("ao12")),
+        "trendMsPer100Solves": _ms(_trend(own)),
+        "sessions": _sessions(history.timestamp_ms[selected], own),
+        "byCubeType": {},
+    }
+
+    if len(results):
+        names, counts = np.unique(solve_types, return_counts=True)
+        for name in names[np.argsort(-counts, kind='stable')][:HISTORY_MAX_CUBE_TYPES]:
+            type_best, type_mean, _ = _finite_stats(results[solve_types == name])
+            features["byCubeType"][str(name or 'unknown')] = {
+                "solveCount": int((solve_types == name).sum()),
+                "personalBest": _ms(type_best),
+                "mean": _ms(type_mean),
+            }
+    return features
+
+
+def _seconds(value):
+    return 'DNF' if value == 'DNF' else (f"{value / 1000:.1f}s" if value is not None else 'n/a')
+
+
+def describe_history_features(features):
+    """Prompt text for extract_history_features() output; empty when there is no history."""
+    if not features or not features["solveCount"]:
+        return ""
+    lines = [
+        f"Solver history ({features['solveCount']} solves of this puzzle): PB {_seconds(features['personalBest'])}, "
+        f"mean {_seconds(features['mean'])}, standard deviation {_seconds(features['stdDev'])}, "
+        f"DNF rate {features['dnfRate']:.0%}, current Ao5 {_seconds(features['ao5'])}, Ao12 {_seconds(features['ao12'])}."
+    ]
+    trend = features["trendMsPer100Solves"]
+    if trend is not None:
+        direction = "improving" if trend < 0 else ("slowing down" if trend > 0 else "flat")
+        lines.append(f"Recent trend: {direction} ({abs(trend) / 1000:.1f}s per 100 solves).")
+    sessions = features["sessions"]
+    if sessions and sessions['count'] > 1:
+        lines.append(f"Current session: {sessions['currentSessionSolves']} solves, mean {_seconds(sessions['currentSessionMean'])} "
+                     f"vs {_seconds(sessions['previousSessionsMean'])} in {sessions['count'] - 1} earlier session(s).")
+    if len(features["byCubeType"]) > 1:
+        lines.append("By puzzle: " + "; ".join(
+            f"{name} {stats['solveCount']} solves, PB {_seconds(stats['personalBest'])}, mean {_seconds(stats['mean'])}"
+            for name, stats in features["byCubeType"].items()) + ".")
+    return "\n    ".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from _solve_history import SolveHistory
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--solves', type=int, default=50000)
+    args = parser.parse_args()
+
+    for count in (100, 1000, args.solves):
+        rng = np.random.default_rng(0)
+        history = SolveHistory(
+            time_ms=(rng.normal(15000, 2500, count) - np.linspace(0, 3000, count)).astype(np.int64),
+            penalty=rng.choice(np.array([0, 1, 2], dtype=np.uint8), count, p=[.96, .02, .02]),
+            timestamp_ms=1_700_000_000_000 + np.cumsum(rng.choice([40_000, 4_000_000], count, p=[.97, .03])),
+            cube_type_code=(np.arange(count) % 5 == 0).astype(np.uint8),
+            cube_types=['3x3', '2x2'],
+        )
+        started = time.perf_counter()
+        text = describe_history_features(extract_history_features(history, '3x3'))
+        print(f"{count:>6} solves: {(time.perf_counter() - started) * 1000:.2f}ms, prompt text {len(text)} chars")
+    print(text)
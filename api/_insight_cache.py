@@ -0,0 +1,168 @@
+# api/_insight_cache.py inside your Vercel project's 'api' directory
+# Bounded LRU + TTL cache for generate_insight responses.
+#
+# An insight only depends on (scramble, solve time, cube type, user level, history summary), so
+# responses are keyed on a canonical form of those fields with the solve time rounded down to a
+# bucket and the history summary hashed. Entries live in memory; set INSIGHT_CACHE_DB to a file
+# path to also persist them in SQLite so they survive cold starts and are shared between worker
+# processes on the same machine.
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+INSIGHT_CACHE_SIZE = int(os.environ.get("INSIGHT_CACHE_SIZE", "2048"))
+INSIGHT_CACHE_TTL_SECONDS = float(os.environ.get("INSIGHT_CACHE_TTL_SECONDS", "86400"))
+INSIGHT_CACHE_BUCKET_MS = int(os.environ.get("INSIGHT_CACHE_BUCKET_MS", "1000"))
+INSIGHT_CACHE_DB = os.environ.get("INSIGHT_CACHE_DB")
+
+# Apostrophe look-alikes that speech input and some keyboards produce in place of "'".
+PRIME_VARIANTS = ("’", "′", "`", "´")
+
+
+def canonical_scramble(scramble):
+    """Normalizes whitespace and prime notation so equivalent scrambles share a key."""
+    moves = []
+    for move in str(scramble).split():
+        for variant in PRIME_VARIANTS:
+            move = move.replace(variant, "'")
+        if move.endswith("2'"):
+            move = move[:-1]  # R2' and R2 are the same turn.
+        moves.append(move)
+    return " ".join(moves)
+
+
+def canonical_cube_type(cube_type):
+    """Maps '3x3x3', ' 3X3 ' etc. onto the short form the frontend uses ('3x3')."""
+    value = str(cube_type or '3x3').strip().lower()
+    parts = value.split('x')
+    if len(parts) == 3 and parts[0] == parts[1] == parts[2]:
+        value = f"{parts[0]}x{parts[0]}"
+    return value
+
+
+def insight_cache_key(scramble, time_ms, cube_type, user_level, bucket_ms=None, history_summary=''):
+    """Builds the cache key for an insight request.
+
+    `history_summary` is the (already rounded) history text that goes into the prompt; it is
+    hashed into the key so insights for different histories are never shared.
+    """
+    bucket_ms = bucket_ms or INSIGHT_CACHE_BUCKET_MS
+    time_bucket = int(float(time_ms) // bucket_ms)
+    parts = [
+        canonical_scramble(scramble),
+        str(time_bucket),
+        canonical_cube_type(cube_type),
+        str(user_level or 'beginner').strip().lower(),
+    ]
+    if history_summary:
+        parts.append(hashlib.sha1(history_summary.encode('utf-8')).hexdigest()[:16])
+    return "|".join(parts)
+
+
+class InsightCache:
+    """Thread-safe LRU cache with per-entry TTL and optional SQLite write-through."""
+
+    def __init__(self, max_entries=INSIGHT_CACHE_SIZE, ttl_seconds=INSIGHT_CACHE_TTL_SECONDS, db_path=INSIGHT_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS insight_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, stored_at FROM insight_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value_json, stored_at = row
+                    if now - stored_at <= self.ttl_seconds:
+                        value = json.loads(value_json)
+                        self._db.execute("UPDATE insight_cache SET last_used = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._store(key, stored_at, value)
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM insight_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Stores value under key, evicting the least recently used entries beyond the size limit."""
+        now = time.time()
+        with self._lock:
+            self._store(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO insight_cache (key, value, stored_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now),
+                )
+                # The disk tier is bounded too, at a multiple of the memory tier.
+                self._db.execute(
+                    "DELETE FROM insight_cache WHERE stored_at < ? OR key IN ("
+                    "SELECT key FROM insight_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (now - self.ttl_seconds, self.max_entries * 8),
+                )
+                self._db.commit()
+
+    def _store(self, key, stored_at, value):
+        # Caller holds self._lock.
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Returns hit/miss counters for tuning the cache size and time-bucket width."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl_seconds,
+                "bucketMs": INSIGHT_CACHE_BUCKET_MS,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hitRate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+insight_cache = InsightCache()
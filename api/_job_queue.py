@@ -0,0 +1,160 @@
+# api/_job_queue.py inside your Vercel project's 'api' directory
+# Background jobs for slow handlers (course generation), with submit / poll / cancel.
+#
+# Jobs run on one background asyncio event loop (a daemon thread) through
+# gemini_client.run_async, so a job waiting on Gemini holds a semaphore slot, not a thread. The
+# number of jobs talking to Gemini at once is JOB_CONCURRENCY no matter how slow the upstream is,
+# and at most JOB_MAX_PENDING jobs may be queued or running; anything beyond that is refused so
+# the caller can retry later. Finished jobs (and their results) are kept for
+# JOB_RETENTION_SECONDS, then forgotten.
+#
+# Jobs live in process memory, so polling must reach the same long-running process (the ASGI app
+# or a Flask server), not a fresh serverless instance.
+
+import os
+import time
+import uuid
+import asyncio
+import threading
+
+import _gemini_client as gemini_client
+import _metrics as metrics
+
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "8"))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "64"))
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+
+class JobQueueFull(Exception):
+    """Raised by JobQueue.submit when JOB_MAX_PENDING jobs are already queued or running."""
+
+
+class Job:
+    """State of one background job."""
+
+    def __init__(self, kind):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.status_code = None
+        self.future = None
+
+    def finish(self, status, result=None, status_code=None):
+        if self.finished_at is not None:
+            return  # A cancel and a completion can race; the first one wins.
+        self.status = status
+        self.result = result
+        self.status_code = status_code
+        self.finished_at = time.time()
+
+    def to_dict(self):
+        body = {"jobId": self.id, "kind": self.kind, "status": self.status, "createdAt": self.created_at,
+                "startedAt": self.started_at, "finishedAt": self.finished_at}
+        if self.status == 'succeeded':
+            body["result"] = self.result
+        elif self.status == 'failed':
+            body["error"] = (self.result or {}).get("error", "Job failed.")
+            body["statusCode"] = self.status_code
+        return body
+
+
+class JobQueue:
+    """Bounded queue of generator-handler jobs executed on a background event loop."""
+
+    def __init__(self, concurrency=JOB_CONCURRENCY, max_pending=JOB_MAX_PENDING, retention_seconds=JOB_RETENTION_SECONDS):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._semaphore = None
+
+    def _ensure_loop(self):
+        # Caller holds self._lock.
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name='job-queue', daemon=True).start()
+            ready.wait()
+            self._loop = loop
+        return self._loop
+
+    def _purge(self, now):
+        # Caller holds self._lock.
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.retention_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, kind, make_steps):
+        """Queues make_steps() (a handler generator factory) and returns the Job right away."""
+        with self._lock:
+            self._purge(time.time())
+            pending = sum(1 for job in self._jobs.values() if job.status not in FINISHED_STATES)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs are already queued or running.")
+            job = Job(kind)
+            self._jobs[job.id] = job
+            loop = self._ensure_loop()
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job, make_steps), loop)
+        return job
+
+    async def _run(self, job, make_steps):
+        try:
+            async with self._semaphore:
+                job.status = 'running'
+                job.started_at = time.time()
+                trace = metrics.begin_request(f"{job.kind}_job")
+                status = 499  # Cancelled while running.
+                try:
+                    body, status = await gemini_client.run_async(make_steps())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    body, status = gemini_client.error_response(e)
+                finally:
+                    metrics.end_request(trace, status)
+                job.finish('succeeded' if status == 200 else 'failed', body, status)
+        except asyncio.CancelledError:
+            job.finish('cancelled')
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge(time.time())
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job; returns the Job (None if unknown)."""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES and job.future is not None:
+            # Cancelling the wrapping future cancels the task on the loop, including any
+            # in-flight upstream request.
+            job.future.cancel()
+            if job.status not in FINISHED_STATES:
+                job.finish('cancelled')
+        return job
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"concurrency": self.concurrency, "maxPending": self.max_pending,
+                    "retentionSeconds": self.retention_seconds, "jobs": counts}
+
+
+course_jobs = JobQueue()
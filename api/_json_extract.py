@@ -0,0 +1,201 @@
+# api/_json_extract.py inside your Vercel project's 'api' directory
+# Finds the JSON object inside a Gemini text response (which may be wrapped in a ```json fence or
+# followed by prose) without the greedy r'\{.*\}' regex.
+#
+# JsonObjectScanner tracks brace depth and string state over text fed in chunks, so it can tell
+# the moment the top-level object closes while the response is still streaming; it jumps between
+# structural characters with a regex instead of looking at every character. extract_json_object
+# handles complete texts: it decodes straight from the first '{' (one C-speed pass that stops at
+# the object's closing brace, so trailing prose with braces does no harm) and only falls back to
+# the scanner to skip a candidate that fails to decode. Decode errors keep their absolute offset
+# into the response, and json_error_context() turns one into a log line showing where it failed.
+#
+# For a response that was cut off (token limit, dropped stream), salvage_json_object() closes the
+# object right after the last complete nested value, keeping every finished module and lesson.
+
+import re
+import json
+
+# How many '{' candidates extract_json_object tries before giving up.
+MAX_JSON_CANDIDATES = 8
+
+_decoder = json.JSONDecoder()
+
+
+class JsonNotFound(json.JSONDecodeError):
+    """Raised when the text holds no (complete) top-level JSON object at all."""
+
+
+class JsonObjectScanner:
+    """Incrementally finds the first balanced top-level {...} in a growing text."""
+
+    STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+
+    def __init__(self):
+        self.text = ''
+        self.pos = 0
+        self.stack = []  # One frame per open object/array: {'kind', 'start', 'key', 'index'}
+        self.in_string = False
+        self.skip_until = -1  # Offset of a character escaped by a backslash
+        self.string_start = None
+        self.last_string = None  # (start, end) offsets of the last complete string, quotes included
+        self.start = None  # Offset of the top-level '{'
+        self.end = None    # Offset of its matching '}'
+        self.last_cut = None  # (offset, kinds of the frames still open) after the last complete nested value
+        self._completed = []
+
+    def feed(self, chunk):
+        """Consumes the next piece of text; returns whatever _token() reported as completed."""
+        self.text += chunk
+        self._completed = []
+        text = self.text
+        for match in self.STRUCTURAL.finditer(text, self.pos):
+            i = match.start()
+            if self.end is not None:
+                break
+            if i <= self.skip_until:
+                continue
+            c = text[i]
+            if self.in_string:
+                if c == '\\':
+                    self.skip_until = i + 1
+                elif c == '"':
+                    self.in_string = False
+                    self.last_string = (self.string_start, i + 1)
+                continue
+            if self.start is None:
+                # Skip anything (e.g. a ```json fence) before the object starts.
+                if c == '{':
+                    self.start = i
+                    self.stack.append({'kind': '{', 'start': i, 'key': None, 'index': 0})
+                continue
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+            else:
+                self._token(c, i)
+        self.pos = len(text)
+        return self._completed
+
+    def _token(self, c, i):
+        """Handles a structural character outside strings; returns the frame it closed, if any."""
+        if c in '{[':
+            self.stack.append({'kind': c, 'start': i, 'key': None, 'index': 0})
+        elif c in '}]' and self.stack:
+            frame = self.stack.pop()
+            if not self.stack:
+                self.end = i
+            else:
+                self.last_cut = (i, [open_frame['kind'] for open_frame in self.stack])
+            return frame
+        return None
+
+    def result(self):
+        """Returns the complete top-level JSON text, or None if it has not closed (yet)."""
+        if self.end is None:
+            return None
+        return self.text[self.start:self.end + 1]
+
+    def decode(self):
+        """Decodes the top-level object; JSONDecodeError offsets are relative to the whole text."""
+        if self.start is None:
+            raise JsonNotFound("No JSON object found", self.text, len(self.text))
+        if self.end is None:
+            raise JsonNotFound("JSON object never closed", self.text, len(self.text))
+        return decode_object(self.text, self.start)
+
+    def decode_truncated(self):
+        """Decodes the object closed right after its last complete nested value, or returns None."""
+        if self.start is None or self.last_cut is None:
+            return None
+        end, kinds = self.last_cut
+        closers = ''.join(']' if kind == '[' else '}' for kind in reversed(kinds))
+        try:
+            return decode_object(self.text[self.start:end + 1] + closers, 0)
+        except json.JSONDecodeError:
+            return None
+
+
+def decode_object(text, start):
+    """Decodes the JSON object starting at text[start] ('{'), ignoring anything after it."""
+    value, _ = _decoder.raw_decode(text, start)
+    if not isinstance(value, dict):
+        raise json.JSONDecodeError("Expecting a JSON object", text, start)
+    return value
+
+
+def extract_json_object(text):
+    """Returns the first decodable top-level JSON object in text.
+
+    Raises JsonNotFound if there is no '{' at all, otherwise the JSONDecodeError of the first
+    candidate (with its offset into text) when no candidate decodes.
+    """
+    start = text.find('{')
+    if start < 0:
+        raise JsonNotFound("No JSON object found", text, 0)
+    first_error = None
+    for _ in range(MAX_JSON_CANDIDATES):
+        try:
+            return decode_object(text, start)
+        except json.JSONDecodeError as e:
+            first_error = first_error or e
+        # Skip past this candidate's balanced span, so a nested object is never returned alone.
+        scanner = JsonObjectScanner()
+        scanner.feed(text[start:])
+        if scanner.end is None:
+            break
+        start = text.find('{', start + scanner.end + 1)
+        if start < 0:
+            break
+    raise first_error
+
+
+def salvage_json_object(text):
+    """Best-effort object from a truncated or broken text (see decode_truncated), or None."""
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    if scanner.end is not None:
+        return None  # It closed but did not decode; there is no truncation to undo.
+    return scanner.decode_truncated()
+
+
+def json_error_context(error, radius=40):
+    """One-line description of a JSONDecodeError with the text around the failing offset."""
+    doc = error.doc or ''
+    before = doc[max(0, error.pos - radius):error.pos]
+    after = doc[error.pos:error.pos + radius]
+    return f"{error.msg} (line {error.lineno} column {error.colno}, char {error.pos} of {len(doc)}): {before!r} <-- HERE --> {after!r}"
+
+
+if __name__ == '__main__':
+    # Benchmark: greedy regex + json.loads versus extract_json_object on a large course response.
+    import time
+
+    lesson = {"lesson_title": "Lesson", "lesson_type": "theory", "content": "Text with \"quotes\" and {braces} " * 20,
+              "steps": [{"content": "Do R U R' U' {x4}", "quiz": [{"question": "Q?", "options": ["a", "b"], "answer": "a"}]}] * 3}
+    course = {"title": "Course", "modules": [{"module_title": f"Module {m}", "lessons": [lesson] * 6} for m in range(6)]}
+    fenced = "```json\n" + json.dumps(course, indent=2) + "\n```"
+    trailing = fenced + "\nLet me know if you want changes to {any} module!"
+
+    def greedy(text):
+        return json.loads(re.search(r'\{.*\}', text, re.DOTALL).group(0))
+
+    for label, text in (("fenced", fenced), ("trailing prose", trailing)):
+        print(f"{label}, {len(text)} characters")
+        for name, function in (("greedy regex", greedy), ("extract_json_object", extract_json_object)):
+            try:
+                function(text)
+                started = time.perf_counter()
+                for _ in range(50):
+                    function(text)
+                print(f"{name:>20}: {(time.perf_counter() - started) * 1000 / 50:.2f} ms")
+            except json.JSONDecodeError as e:
+                print(f"{name:>20}: fails, {json_error_context(e)}")
+
+    text = trailing
+    scanner = JsonObjectScanner()
+    started = time.perf_counter()
+    for offset in range(0, len(text), 512):
+        scanner.feed(text[offset:offset + 512])
+    scanner.decode()
+    print(f"{'streamed scanner':>20}: {(time.perf_counter() - started) * 1000:.2f} ms in 512-character chunks")
@@ -0,0 +1,213 @@
+# api/_log.py inside your Vercel project's 'api' directory
+# Level-gated, structured logging for the API functions.
+#
+# The functions used to print every incoming body and every Gemini response (whole generated
+# courses included) synchronously to stdout. Loggers from get_logger() instead:
+#   - check the level first, so a disabled log.debug(...) costs one comparison and never builds its
+#     message or serializes its payload;
+#   - truncate payload fields to LOG_PAYLOAD_CHARS (0 = keep everything, for debug runs);
+#   - sample DEBUG/INFO records at LOG_SAMPLE_RATE (warnings and errors are always kept);
+#   - hand finished records to a bounded queue that a background thread writes out, so a request
+#     never waits on stdout. When the queue is full, records are dropped (and counted) instead.
+#
+# Production:  LOG_LEVEL=WARNING (or INFO with LOG_SAMPLE_RATE=0.01).
+# Debugging:   LOG_LEVEL=DEBUG LOG_PAYLOAD_CHARS=0 LOG_FORMAT=text.
+# Set LOG_QUEUE_SIZE=0 to write synchronously (e.g. when a serverless runtime freezes the process
+# right after the response and the writer thread would not get to run).
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # "json" (one object per line) or "text"
+LOG_PAYLOAD_CHARS = int(os.environ.get("LOG_PAYLOAD_CHARS", "500"))
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+ROOT_LOGGER = 'cubetimer'
+
+
+# Pure-Python iterencode yields the JSON text piece by piece, so a big payload is only serialized
+# as far as the limit (json.dumps would always serialize all of it).
+_payload_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def truncate(value, limit=None):
+    """Renders a payload (any JSON-able value) as text of at most `limit` characters."""
+    limit = LOG_PAYLOAD_CHARS if limit is None else limit
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8', 'replace')
+    if not isinstance(value, str):
+        pieces, size = [], 0
+        try:
+            for piece in _payload_encoder.iterencode(value):
+                pieces.append(piece)
+                size += len(piece)
+                if limit and size > limit:
+                    return "".join(pieces)[:limit] + "...[truncated]"
+        except (TypeError, ValueError):
+            value = repr(value)
+        else:
+            value = "".join(pieces)
+    if limit and len(value) > limit:
+        return f"{value[:limit]}...[{len(value) - limit} more chars]"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, the record's fields and any traceback."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_info or record.exc_text:
+            entry['exc'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """'DEBUG gemini-insight: message key=value ...', close to the old print() lines."""
+
+    def format(self, record):
+        fields = getattr(record, 'fields', {})
+        line = f"{record.levelname} {record.name[len(ROOT_LOGGER) + 1:] or record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info or record.exc_text:
+            line += "\n" + (record.exc_text or self.formatException(record.exc_info))
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Payload fields are already rendered and the message is formatted on the writer thread;
+        # only a traceback has to be rendered now, while the exception is still alive.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handler = None
+_listener = None
+
+
+def _configure():
+    global _queue_handler, _listener
+    root = logging.getLogger(ROOT_LOGGER)
+    if root.handlers:
+        return root
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate = False
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    if LOG_QUEUE_SIZE > 0:
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler)
+        _listener.start()
+        atexit.register(_listener.stop)  # Flushes whatever is still queued.
+        root.addHandler(_queue_handler)
+    else:
+        root.addHandler(stream_handler)
+    return root
+
+
+class Logger:
+    """Thin wrapper over a stdlib logger: log.debug("message", field=value, payload=body).
+
+    `payload` and `body` fields go through truncate(); other fields are logged as given.
+    """
+
+    PAYLOAD_FIELDS = ('payload', 'body', 'response')
+
+    def __init__(self, name):
+        self._logger = _configure().getChild(name)
+
+    def enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, msg, exc_info=None, fields=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING and LOG_SAMPLE_RATE < 1 and random.random() >= LOG_SAMPLE_RATE:
+            return
+        if fields:
+            fields = {key: truncate(value) if key in self.PAYLOAD_FIELDS else value for key, value in fields.items()}
+        self._logger.log(level, msg, exc_info=exc_info, extra={'fields': fields or {}})
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields=fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields=fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields=fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields=fields)
+
+    def exception(self, msg, exc_info=True, **fields):
+        """ERROR with the traceback of the exception being handled (or of `exc_info`)."""
+        self._log(logging.ERROR, msg, exc_info=exc_info, fields=fields)
+
+
+def get_logger(name):
+    return Logger(name)
+
+
+if __name__ == '__main__':
+    # Benchmark: cost per request of the old full-payload print() versus a disabled and an
+    # enabled log.debug() with a large course payload.
+    import io
+    import contextlib
+
+    course = {"title": "Course", "modules": [{"module_title": f"Module {m}", "lessons": [
+        {"lesson_title": "Lesson", "content": "Some lesson text. " * 40}] * 6} for m in range(6)]}
+    log = get_logger('bench')
+    runs = 200
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(runs):
+            print(f"DEBUG: Gemini API raw response for course generation: {course}")
+    print(f"{'print(full payload)':>28}: {(time.perf_counter() - started) * 1e6 / runs:.1f} us")
+
+    log._logger.setLevel(logging.INFO)
+    started = time.perf_counter()
+    for _ in range(runs):
+        log.debug("Gemini response for course generation", response=course)
+    print(f"{'log.debug (level INFO)':>28}: {(time.perf_counter() - started) * 1e6 / runs:.2f} us")
+
+    log._logger.setLevel(logging.DEBUG)
+    _listener.handlers = (logging.NullHandler(),) if _listener else ()
+    started = time.perf_counter()
+    for _ in range(runs):
+        log.debug("Gemini response for course generation", response=course)
+    print(f"{'log.debug (DEBUG, queued)':>28}: {(time.perf_counter() - started) * 1e6 / runs:.1f} us "
+          f"(payload truncated to {LOG_PAYLOAD_CHARS} chars)")
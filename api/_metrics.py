@@ -0,0 +1,219 @@
+# api/_metrics.py inside your Vercel project's 'api' directory
+# In-process metrics: latency histograms, timing spans and Gemini token counters, rendered in the
+# Prometheus text exposition format at /api/metrics.
+#
+# Every API request gets a trace (begin_request/end_request) and the handlers mark their phases
+# with `with span('prompt_build'):` etc.; upstream waits are spanned by _gemini_client itself. A
+# span is recorded both in the per-request-type histogram and in the request's own trace, which
+# the endpoints return as a Server-Timing header so one slow request can be read off directly.
+#
+# Metrics live in process memory: scrape the long-running process (the ASGI app or a Flask dev
+# server), not individual serverless invocations. No client library is needed.
+
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; covers everything from a cached NLU answer to a two-minute course.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Usage fields of a Gemini response -> `kind` label of the token counter.
+USAGE_FIELDS = {
+    'promptTokenCount': 'prompt',
+    'candidatesTokenCount': 'candidates',
+    'cachedContentTokenCount': 'cached',
+    'thoughtsTokenCount': 'thoughts',
+    'totalTokenCount': 'total',
+}
+
+_lock = threading.Lock()
+_registry = []
+_trace = ContextVar('metrics_trace', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'cubetimer_request_duration_seconds', 'End-to-end API request latency.', ['request_type', 'status'])
+SPAN_SECONDS = Histogram(
+    'cubetimer_span_duration_seconds', 'Time spent in each phase of an API request.', ['request_type', 'span'])
+UPSTREAM_SECONDS = Histogram(
+    'cubetimer_upstream_duration_seconds', 'Gemini call latency as seen by the handler.', ['call_type', 'model', 'outcome'])
+UPSTREAM_TOKENS = Counter(
+    'cubetimer_gemini_tokens_total', 'Tokens reported in Gemini usageMetadata.', ['call_type', 'model', 'kind'])
+
+
+def begin_request(request_type):
+    """Starts the trace for one request in the current context; pass the token to end_request."""
+    return _trace.set({'request_type': request_type, 'started': time.perf_counter(), 'spans': []})
+
+
+def end_request(token, status):
+    """Records the request's latency, ends its trace and returns its [(span, seconds)]."""
+    trace = _trace.get()
+    try:
+        _trace.reset(token)
+    except ValueError:  # Ended from another context (e.g. a streamed response body).
+        _trace.set(None)
+    if trace is None:
+        return []
+    REQUEST_SECONDS.observe(time.perf_counter() - trace['started'], request_type=trace['request_type'], status=str(status))
+    return trace['spans']
+
+
+def request_elapsed():
+    """Seconds since the current request's trace began, or None outside a request."""
+    trace = _trace.get()
+    return time.perf_counter() - trace['started'] if trace else None
+
+
+def current_request_type():
+    trace = _trace.get()
+    return trace['request_type'] if trace else 'unknown'
+
+
+@contextmanager
+def span(name, request_type=None):
+    """Times a phase of the current request (or of `request_type` outside a request trace)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started, request_type)
+
+
+def record_span(name, seconds, request_type=None):
+    trace = _trace.get()
+    if trace is not None:
+        trace['spans'].append((name, seconds))
+    SPAN_SECONDS.observe(seconds, request_type=request_type or current_request_type(), span=name)
+
+
+def record_usage(call_type, model, response_data):
+    """Adds the usageMetadata token counts of a Gemini response (or stream chunk) to the counters."""
+    usage = response_data.get('usageMetadata') if isinstance(response_data, dict) else None
+    for field, kind in USAGE_FIELDS.items():
+        if usage and usage.get(field):
+            UPSTREAM_TOKENS.inc(usage[field], call_type=call_type, model=model, kind=kind)
+
+
+def server_timing(spans):
+    """Server-Timing header value for a trace: 'prompt_build;dur=1.2, upstream;dur=850.0'."""
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+def instrument_flask(app, path, request_type_for):
+    """Traces every POST to `path` on a Flask app and serves the metrics at /api/metrics.
+
+    request_type_for(request_json) names the request type; returning None skips the trace (the
+    streaming course endpoint traces its own response body instead).
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def begin_metrics_trace():
+        if request.method != 'POST' or request.path != path:
+            return
+        started = time.perf_counter()
+        request_json = request.get_json(silent=True)  # Cached, so the handler does not parse again.
+        request_type = request_type_for(request_json if isinstance(request_json, dict) else {})
+        if request_type:
+            g.metrics_trace = begin_request(request_type)
+            record_span('parse', time.perf_counter() - started)
+
+    @app.after_request
+    def end_metrics_trace(response):
+        trace = g.pop('metrics_trace', None)
+        if trace is not None:
+            response.headers['Server-Timing'] = server_timing(end_request(trace, response.status_code))
+        return response
+
+    @app.teardown_request
+    def drop_metrics_trace(error=None):
+        trace = g.pop('metrics_trace', None)  # Only still set when the handler raised.
+        if trace is not None:
+            end_request(trace, 500)
+
+    @app.route('/api/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Prometheus scrape endpoint."""
+        return Response(render(), content_type=CONTENT_TYPE)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        lines = []
+        for metric in _registry:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
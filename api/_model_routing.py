@@ -0,0 +1,156 @@
+# api/_model_routing.py inside your Vercel project's 'api' directory
+# Picks the Gemini model (and API version) for every upstream call.
+#
+# ROUTES lists, per request type and prompt size, a latency budget and the models allowed to
+# answer. choose() takes the cheapest allowed model that
+#   - is not behind an open circuit breaker (_resilience.breakers),
+#   - can produce the output the payload asks for (maxOutputTokens), and
+#   - has a live p95 latency (_resilience.latency_stats) that fits in what is left of the
+#     request's budget, with BUDGET_HEADROOM to spare.
+# A model without enough samples yet counts as fitting, so a cold process starts on the cheapest
+# model. If no model fits, the one with the lowest p95 is used: the faster fallback. When a
+# call still fails after its retries, _gemini_client fails over to the next model with
+# next_model().
+#
+# Long prompts (chats with long histories, insights with long solve histories) take longer and
+# need a model that handles long context well, so they have their own tier.
+#
+# MODEL_ROUTES overrides the table with JSON in the same shape; every model it names must be in
+# MODELS, or the import fails:
+#   MODEL_ROUTES='{"insight": [[null, 8, ["gemini-2.5-flash-lite"]]]}'
+
+import os
+import json
+import math
+from collections import namedtuple
+
+import _metrics as metrics
+import _resilience as resilience
+
+# api_version: what the model is served on. cost: USD per million tokens at a typical 4:1
+# input:output mix, from the Gemini price list. max_output_tokens: the model's output limit.
+ModelSpec = namedtuple('ModelSpec', ['api_version', 'cost', 'max_output_tokens'])
+
+MODELS = {
+    'gemini-2.0-flash-lite': ModelSpec('v1beta', 0.12, 8192),
+    'gemini-2.5-flash-lite': ModelSpec('v1beta', 0.16, 65536),
+    'gemini-2.0-flash': ModelSpec('v1beta', 0.16, 8192),
+    'gemini-2.5-flash': ModelSpec('v1beta', 0.74, 65536),
+}
+
+# One tier of a route: prompts of up to max_prompt_chars (None = any size) must be answered within
+# budget_seconds by one of `models`.
+RouteTier = namedtuple('RouteTier', ['max_prompt_chars', 'budget_seconds', 'models'])
+
+ROUTES = {
+    'nlu': [RouteTier(None, 3, ['gemini-2.0-flash-lite', 'gemini-2.5-flash-lite'])],
+    'insight': [RouteTier(16000, 10, ['gemini-2.0-flash-lite', 'gemini-2.5-flash-lite']),
+                RouteTier(None, 20, ['gemini-2.5-flash-lite', 'gemini-2.5-flash'])],
+    'lesson_chat': [RouteTier(16000, 10, ['gemini-2.0-flash-lite', 'gemini-2.5-flash-lite']),
+                    RouteTier(None, 20, ['gemini-2.5-flash-lite', 'gemini-2.5-flash'])],
+    # A whole course can outgrow the 8k output limit of the 2.0 models.
+    'generate_course': [RouteTier(None, 100, ['gemini-2.5-flash-lite', 'gemini-2.5-flash'])],
+    'course_repair': [RouteTier(None, 50, ['gemini-2.5-flash-lite', 'gemini-2.5-flash'])],
+}
+
+
+def parse_routes(text):
+    """ROUTES entries from MODEL_ROUTES JSON; ValueError if a tier is empty or names a model not in MODELS."""
+    routes = {request_type: [RouteTier(*tier) for tier in tiers] for request_type, tiers in json.loads(text).items()}
+    for request_type, tiers in routes.items():
+        for tier in tiers:
+            unknown = [model for model in tier.models if model not in MODELS]
+            if unknown:
+                raise ValueError(f"MODEL_ROUTES: unknown model(s) {unknown} for {request_type}; "
+                                 f"known models are {sorted(MODELS)}")
+            if not tier.models:
+                raise ValueError(f"MODEL_ROUTES: a {request_type} tier lists no models")
+    return routes
+
+
+if os.environ.get("MODEL_ROUTES"):
+    ROUTES.update(parse_routes(os.environ["MODEL_ROUTES"]))
+
+# A model fits the budget when its p95 is at most this share of the time left.
+BUDGET_HEADROOM = float(os.environ.get("MODEL_BUDGET_HEADROOM", "0.8"))
+
+ROUTE_CHOICES = metrics.Counter(
+    'cubetimer_model_routes_total', 'Models chosen for upstream calls, by reason (cheapest, fastest, fallback, failover).',
+    ['call_type', 'model', 'reason'])
+
+
+def prompt_chars(payload):
+    """Characters of text in a generateContent payload's contents and system instruction."""
+    parts = [part for content in payload.get('contents') or [] for part in content.get('parts') or []]
+    parts += (payload.get('systemInstruction') or {}).get('parts') or []
+    return sum(len(part.get('text') or '') for part in parts)
+
+
+def tier_for(request_type, payload):
+    tiers = ROUTES.get(request_type) or ROUTES['insight']
+    size = prompt_chars(payload)
+    return next((tier for tier in tiers if tier.max_prompt_chars is None or size <= tier.max_prompt_chars), tiers[-1])
+
+
+def remaining_budget(request_type, payload):
+    """Seconds left of the current request's latency budget for a call of this type and payload."""
+    elapsed = metrics.request_elapsed()
+    return tier_for(request_type, payload).budget_seconds - (elapsed or 0.0)
+
+
+def _p95(request_type, model):
+    return resilience.latency_stats.quantile(request_type, model, 0.95)
+
+
+def _candidates(request_type, payload, exclude=()):
+    """The tier's models that can produce the requested output, cheapest first."""
+    wanted_output = (payload.get('generationConfig') or {}).get('maxOutputTokens') or 0
+    models = [model for model in tier_for(request_type, payload).models
+              if model not in exclude and MODELS[model].max_output_tokens >= wanted_output]
+    return sorted(models, key=lambda model: MODELS[model].cost)
+
+
+def choose(request_type, payload, exclude=()):
+    """(model, api_version, reason) for a call; reason is 'cheapest' or 'fastest'. None if every
+    model of the tier is excluded or too small for the requested output."""
+    models = _candidates(request_type, payload, exclude)
+    if not models:
+        return None
+    healthy = [model for model in models if resilience.breakers.get(model).available()] or models
+    budget = remaining_budget(request_type, payload) * BUDGET_HEADROOM
+    for model in healthy:
+        p95 = _p95(request_type, model)
+        if p95 is None or p95 <= budget:
+            return model, MODELS[model].api_version, 'cheapest'
+    model = min(healthy, key=lambda model: _p95(request_type, model) or math.inf)
+    return model, MODELS[model].api_version, 'fastest'
+
+
+def route(request_type, payload):
+    """(model, api_version) for a new call, counted in ROUTE_CHOICES. When no model of the tier can
+    produce the requested output, the tier's last (most capable) model is used anyway and Gemini
+    reports the problem."""
+    choice = choose(request_type, payload)
+    if choice is None:
+        model = tier_for(request_type, payload).models[-1]
+        choice = model, MODELS[model].api_version, 'fallback'
+    model, api_version, reason = choice
+    ROUTE_CHOICES.inc(call_type=request_type, model=model, reason=reason)
+    return model, api_version
+
+
+def next_model(request_type, payload, failed_models):
+    """(model, api_version) to fail over to after `failed_models` failed, or None if there is none."""
+    if not set(failed_models) <= set(tier_for(request_type, payload).models):
+        return None  # A pinned model outside the table: no failover.
+    choice = choose(request_type, payload, exclude=failed_models)
+    if choice is None:
+        return None
+    model, api_version, _ = choice
+    ROUTE_CHOICES.inc(call_type=request_type, model=model, reason='failover')
+    return model, api_version
+
+
+def stats():
+    """The model each request type would get for a short prompt right now."""
+    return {request_type: choose(request_type, {})[0] for request_type in ROUTES}
@@ -0,0 +1,206 @@
+# api/_nlu_classifier.py inside your Vercel project's 'api' directory
+# Local, deterministic classifier for the canonical voice commands listed in gemini-nlu.py's prompt.
+#
+# Most voice traffic is "start timer", "stop", "set cube type 3x3" and the like. Those are matched
+# here in microseconds with a small keyword grammar (synonyms, number words, "three by three" ->
+# "3x3") and only transcripts that look like questions, or that the grammar can't place with
+# confidence, are sent on to Gemini.
+#
+# Benchmark against the labelled corpus with:  python api/_nlu_classifier.py
+
+import os
+import re
+
+# Results below this confidence are handed to Gemini instead of being answered locally.
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get("NLU_FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+WAKE_AND_FILLER_WORDS = {
+    'jarvis', 'hey', 'ok', 'okay', 'please', 'can', 'could', 'would', 'you', 'will', 'kindly',
+    'the', 'a', 'an', 'my', 'me', 'for', 'to', 'now', 'right', 'just', 'up', 'on', 'off', 'of',
+    'i', 'want', 'wanna', 'like', 'let', 'lets', "let's", 'go', 'ahead', 'and', 'again', 'it',
+    'this', 'that', 'into', 'in', 'mode', 'sir', 'thanks', 'thank', 'latest', 'last', 'current',
+}
+
+# Negated commands ("don't start the timer") and statements about the app ("the timer is stopped")
+# contain command words but are not commands; they go to Gemini instead of being answered here.
+# "non" catches "non-stop", where "stop" describes rather than commands.
+NEGATION_WORDS = {'not', 'no', 'never', "don't", 'dont', "doesn't", 'doesnt', "didn't", 'didnt',
+                  "won't", 'wont', "can't", 'cant', 'cannot', 'nothing', 'without', 'non'}
+STATEMENT_WORDS = {'is', 'was', 'are', 'were', 'been', "it's", "that's", "isn't", 'isnt', "wasn't", 'wasnt'}
+
+QUESTION_WORDS = {'how', 'what', 'why', 'when', 'where', 'who', 'which', 'explain', 'tell', 'is', 'are', 'does', 'do', 'should'}
+
+NUMBER_WORDS = {
+    'one': '1', 'won': '1', 'two': '2', 'too': '2', 'three': '3', 'tree': '3', 'free': '3',
+    'four': '4', 'fore': '4', 'five': '5',
+}
+
+CUBE_TYPE_SYNONYMS = {
+    '2x2': '2x2', '3x3': '3x3', '4x4': '4x4',
+    'pyraminx': 'pyraminx', 'pyramix': 'pyraminx', 'pyramid': 'pyraminx', 'pyramids': 'pyraminx', 'pyra': 'pyraminx',
+}
+
+THEME_SYNONYMS = {
+    'dark': 'dark', 'night': 'dark', 'black': 'dark',
+    'light': 'light', 'white': 'light', 'bright': 'light', 'day': 'light',
+    'vibrant': 'vibrant', 'colorful': 'vibrant', 'colourful': 'vibrant', 'vivid': 'vibrant',
+}
+
+# canonicalCommand -> (action words, object words, value synonyms or None).
+# A command matches on an action and an object word; START/STOP/RESET may also match on the
+# action alone because that is how people shout them mid-solve.
+COMMAND_GRAMMAR = {
+    'start_timer': ({'start', 'begin', 'commence', 'initiate', 'resume', 'starts', 'started'},
+                    {'timer', 'time', 'timing', 'clock', 'solve', 'solving', 'stopwatch'}, None),
+    'stop_timer': ({'stop', 'halt', 'end', 'finish', 'finished', 'done', 'pause', 'freeze', 'stopped'},
+                   {'timer', 'time', 'timing', 'clock', 'solve', 'solving', 'stopwatch'}, None),
+    'reset_timer': ({'reset', 'clear', 'zero', 'restart'},
+                    {'timer', 'time', 'clock', 'stopwatch'}, None),
+    'generate_scramble': ({'generate', 'new', 'next', 'another', 'give', 'make', 'create', 'get', 'different', 'rescramble'},
+                          {'scramble', 'scrambles', 'scrambling'}, None),
+    'analyze_solve': ({'analyze', 'analyse', 'analysis', 'review', 'evaluate', 'assess', 'get', 'give'},
+                      {'solve', 'solves', 'insight', 'insights', 'analysis', 'feedback'}, None),
+    'toggle_sound_effects': ({'toggle', 'turn', 'enable', 'disable', 'mute', 'unmute', 'switch', 'silence'},
+                             {'sound', 'sounds', 'audio', 'effects', 'sfx', 'beeps', 'beep'}, None),
+    'toggle_inspection': ({'toggle', 'turn', 'enable', 'disable', 'switch', 'skip'},
+                          {'inspection', 'inspect', 'inspections'}, None),
+    'show_history': ({'show', 'open', 'display', 'view', 'see', 'bring', 'navigate'},
+                     {'history', 'solves', 'times', 'log'}, None),
+    'show_stats': ({'show', 'open', 'display', 'view', 'see', 'bring'},
+                   {'stats', 'statistics', 'averages', 'average', 'numbers'}, None),
+    'set_cube_type': ({'set', 'change', 'switch', 'use', 'select', 'pick', 'choose'},
+                      {'cube', 'puzzle', 'type', 'event'}, CUBE_TYPE_SYNONYMS),
+    'set_theme': ({'set', 'change', 'switch', 'use', 'select', 'pick', 'choose', 'make', 'apply'},
+                  {'theme', 'themes', 'colors', 'colours', 'appearance', 'skin'}, THEME_SYNONYMS),
+}
+ACTION_ONLY_COMMANDS = {'start_timer', 'stop_timer', 'reset_timer'}
+
+NON_WORD = re.compile(r"[^a-z0-9' ]+")
+# "3 by 3", "3 x 3 x 3", "3x3x3" -> "3x3"
+CUBE_SIZE = re.compile(r"\b([2-5])\s*(?:by|x|times)\s*\1(?:\s*(?:by|x|times)\s*\1)?\b")
+
+
+def normalize_transcript(transcript):
+    """Lower-cases, strips punctuation, maps number words to digits and collapses cube sizes."""
+    text = str(transcript or '').lower().replace('-', ' ')
+    text = NON_WORD.sub(' ', text)
+    # "to by to" / "two by two": only treat "to"/"for" as numbers next to "by"/"x".
+    text = re.sub(r"\b(to|too|two)\s+(by|x)\s+(to|too|two)\b", r"2 \2 2", text)
+    text = re.sub(r"\b(for|four|fore)\s+(by|x)\s+(for|four|fore)\b", r"4 \2 4", text)
+    words = [NUMBER_WORDS.get(word, word) for word in text.split()]
+    text = ' '.join(words)
+    text = CUBE_SIZE.sub(lambda match: f"{match.group(1)}x{match.group(1)}", text)
+    return text
+
+
+def classify_transcript(transcript):
+    """Returns {'canonicalCommand', 'commandValue', 'confidence'} for a voice transcript.
+
+    Questions come back as general_query; negations, statements and anything unplaceable come
+    back as unknown. Both have a confidence below FAST_PATH_MIN_CONFIDENCE so the caller can ask
+    Gemini instead.
+    """
+    text = normalize_transcript(transcript)
+    tokens = text.split()
+    if not tokens:
+        return {"canonicalCommand": "unknown", "commandValue": None, "confidence": 0.0}
+
+    content_tokens = [token for token in tokens if token not in WAKE_AND_FILLER_WORDS]
+    if tokens[0] in QUESTION_WORDS or (content_tokens and content_tokens[0] in QUESTION_WORDS):
+        return {"canonicalCommand": "general_query", "query": str(transcript).strip(), "confidence": 0.3}
+
+    token_set = set(tokens)
+    if token_set & (NEGATION_WORDS | STATEMENT_WORDS):
+        return {"canonicalCommand": "unknown", "commandValue": None, "confidence": 0.0}
+
+    best = None
+    for command, (actions, objects, values) in COMMAND_GRAMMAR.items():
+        matched_action = token_set & actions
+        matched_object = token_set & objects
+        value = None
+        if values is not None:
+            value_words = [token for token in tokens if token in values]
+            if value_words:
+                value = values[value_words[-1]]
+        if values is not None and value is None:
+            continue  # set_cube_type / set_theme are meaningless without a value.
+
+        if matched_action and matched_object:
+            base = 1.0
+        elif values is not None and (matched_action or matched_object):
+            base = 1.0
+        elif values is not None:
+            base = 0.85  # Just "three by three" or "dark mode".
+        elif matched_action and command in ACTION_ONLY_COMMANDS:
+            base = 0.85  # Just "start" or "stop".
+        elif matched_object and command in ('generate_scramble', 'show_history', 'show_stats') and len(content_tokens) == 1:
+            base = 0.85  # Just "scramble", "history" or "stats".
+        else:
+            continue
+
+        known = matched_action | matched_object | (set(values) if values else set())
+        unexplained = [token for token in content_tokens if token not in known]
+        confidence = max(0.0, base - 0.15 * len(unexplained))
+        if best is None or confidence > best[0]:
+            best = (confidence, command, value, False)
+        elif confidence == best[0]:
+            best = (confidence, best[1], best[2], True)
+
+    if best is None:
+        return {"canonicalCommand": "unknown", "commandValue": None, "confidence": 0.0}
+
+    confidence, command, value, ambiguous = best
+    if ambiguous:
+        confidence = min(confidence, 0.5)  # e.g. "stop and reset the timer": let Gemini decide.
+    return {"canonicalCommand": command, "commandValue": value, "confidence": round(confidence, 2)}
+
+
+def is_confident(result):
+    """True when a local result should be returned without asking Gemini."""
+    return result['canonicalCommand'] not in ('general_query', 'unknown') and result['confidence'] >= FAST_PATH_MIN_CONFIDENCE
+
+
+if __name__ == '__main__':
+    # Reports accuracy and latency of the fast path over the labelled corpus next to this file.
+    import json
+    import time
+
+    corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nlu_corpus.jsonl')
+    with open(corpus_path) as corpus_file:
+        corpus = [json.loads(line) for line in corpus_file if line.strip()]
+
+    handled = correct = deferred_correctly = deferred_wrongly = 0
+    mistakes = []
+    latencies = []
+    for example in corpus:
+        started = time.perf_counter()
+        result = classify_transcript(example['transcript'])
+        latencies.append(time.perf_counter() - started)
+
+        expected_local = example['canonicalCommand'] not in ('general_query', 'unknown')
+        if is_confident(result):
+            handled += 1
+            if result['canonicalCommand'] == example['canonicalCommand'] and result.get('commandValue') == example.get('commandValue'):
+                correct += 1
+            else:
+                mistakes.append((example, result))
+        elif expected_local:
+            deferred_wrongly += 1
+        else:
+            deferred_correctly += 1
+
+    repeats = 200
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for example in corpus:
+            classify_transcript(example['transcript'])
+    per_call_us = (time.perf_counter() - started) / (repeats * len(corpus)) * 1e6
+
+    latencies.sort()
+    print(f"corpus={len(corpus)} handled_locally={handled} precision={correct / handled if handled else 0:.3f} "
+          f"sent_to_llm={deferred_correctly + deferred_wrongly} (of which commands={deferred_wrongly})")
+    print(f"overall_accuracy={(correct + deferred_correctly) / len(corpus):.3f} "
+          f"mean={per_call_us:.1f}us p99={latencies[int(len(latencies) * 0.99)] * 1e6:.1f}us")
+    for example, result in mistakes:
+        print(f"MISMATCH: {example['transcript']!r} expected {example['canonicalCommand']}/{example.get('commandValue')} "
+              f"got {result['canonicalCommand']}/{result.get('commandValue')} ({result['confidence']})")
@@ -0,0 +1,284 @@
+# api/_resilience.py inside your Vercel project's 'api' directory
+# The bookkeeping behind _gemini_client's retries, hedged requests and circuit breaking.
+#
+#   RetryBudget     Retries (and hedges) may add at most RETRY_BUDGET_RATIO extra load on top of
+#                   the calls made in the last RETRY_BUDGET_WINDOW seconds, plus a small floor. When
+#                   Gemini is struggling, retries that would multiply the load stop being made.
+#   LatencyStats    Rolling window of successful call latencies per (request type, model). Once
+#                   a short call has been waiting longer than the p95, it gets a hedged duplicate;
+#                   _model_routing reads the same numbers to keep calls within their budgets.
+#   CircuitBreaker  Per model. Once half or more of the recent calls failed with a transient
+#                   error (connection, timeout, 429, 5xx), the breaker opens and calls fail at
+#                   once for BREAKER_COOLDOWN_SECONDS instead of each waiting out a timeout. After
+#                   the cooldown, one probe call at a time is let through until one succeeds.
+#
+# The policy (what is transient, which calls are hedged) lives in _gemini_client, which owns the
+# upstream error types. Like the caches, all state is per process.
+
+import os
+import math
+import time
+import random
+import threading
+from collections import deque
+
+import _metrics as metrics
+
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", "3"))
+GEMINI_RETRY_BASE_DELAY = float(os.environ.get("GEMINI_RETRY_BASE_DELAY", "0.25"))  # seconds
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get("GEMINI_RETRY_MAX_DELAY", "4"))  # seconds
+
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+RETRY_BUDGET_WINDOW = int(os.environ.get("RETRY_BUDGET_WINDOW", "10"))  # seconds
+
+LATENCY_WINDOW = int(os.environ.get("LATENCY_WINDOW", "256"))  # calls kept per (request type, model)
+LATENCY_MIN_SAMPLES = int(os.environ.get("LATENCY_MIN_SAMPLES", "20"))
+
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))  # recent calls considered
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATIO = float(os.environ.get("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("BREAKER_COOLDOWN_SECONDS", "15"))
+
+UPSTREAM_RETRIES = metrics.Counter(
+    'cubetimer_upstream_retries_total', 'Upstream retries by outcome (retried, budget_exhausted).',
+    ['call_type', 'outcome'])
+UPSTREAM_HEDGES = metrics.Counter(
+    'cubetimer_upstream_hedges_total', 'Hedged upstream calls by outcome (sent, won, skipped).',
+    ['call_type', 'outcome'])
+BREAKER_TRANSITIONS = metrics.Counter(
+    'cubetimer_circuit_breaker_transitions_total', 'Circuit breaker state changes.', ['model', 'state'])
+
+
+def backoff_delay(attempt, base=GEMINI_RETRY_BASE_DELAY, cap=GEMINI_RETRY_MAX_DELAY):
+    """Full-jitter exponential backoff: uniform over [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    """Caps retries at `ratio` of the calls made in a sliding window, plus `min_per_second`."""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, min_per_second=RETRY_BUDGET_MIN_PER_SECOND,
+                 window=RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._lock = threading.Lock()
+        self._seconds = deque()  # [second, calls, retries], oldest first
+
+    def _current(self):
+        now = int(time.monotonic())
+        while self._seconds and self._seconds[0][0] <= now - self.window:
+            self._seconds.popleft()
+        if not self._seconds or self._seconds[-1][0] != now:
+            self._seconds.append([now, 0, 0])
+        return self._seconds[-1]
+
+    def record_call(self):
+        with self._lock:
+            self._current()[1] += 1
+
+    def try_spend(self):
+        """Takes one retry from the budget; False when the budget is used up."""
+        with self._lock:
+            current = self._current()
+            calls = sum(second[1] for second in self._seconds)
+            retries = sum(second[2] for second in self._seconds)
+            if retries >= self.min_per_second * self.window + self.ratio * calls:
+                return False
+            current[2] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._current()
+            return {"calls": sum(second[1] for second in self._seconds),
+                    "retries": sum(second[2] for second in self._seconds),
+                    "windowSeconds": self.window, "ratio": self.ratio}
+
+
+class LatencyStats:
+    """Rolling latencies of successful calls per (request type, model)."""
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=LATENCY_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, request_type, model, seconds):
+        key = (request_type, model)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, request_type, model, q):
+        """The q-quantile in seconds, or None until min_samples calls have been seen."""
+        with self._lock:
+            samples = list(self._samples.get((request_type, model)) or ())
+        if len(samples) < self.min_samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(math.ceil(q * len(samples))) - 1)]
+
+    def stats(self):
+        result = {}
+        for request_type, model in list(self._samples):
+            p50 = self.quantile(request_type, model, 0.5)
+            p95 = self.quantile(request_type, model, 0.95)
+            result[f"{request_type}:{model}"] = {
+                "samples": len(self._samples[(request_type, model)]),
+                "p50Ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95Ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return result
+
+
+class CircuitBreaker:
+    """closed -> open after too many transient failures -> half_open (one probe) -> closed."""
+
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 failure_ratio=BREAKER_FAILURE_RATIO, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True = success
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_TRANSITIONS.inc(model=self.name, state=state)
+
+    def allow(self):
+        """True if a call may be made now. In half_open, only one probe call is let through at a time."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._set_state('half_open')
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, success):
+        """Records the outcome of a call that allow() let through."""
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                if success:
+                    self._outcomes.clear()
+                    self._set_state('closed')
+                else:
+                    self._opened_at = time.monotonic()
+                    self._set_state('open')
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if self.state == 'closed' and len(self._outcomes) >= self.min_calls \
+                    and failures >= self.failure_ratio * len(self._outcomes):
+                self._opened_at = time.monotonic()
+                self._set_state('open')
+
+    def available(self):
+        """True if allow() would let a call through now (without taking the half-open probe)."""
+        with self._lock:
+            if self.state == 'open':
+                return time.monotonic() - self._opened_at >= self.cooldown
+            return self.state == 'closed' or not self._probing
+
+    def abandon(self):
+        """A call that allow() let through ended without an outcome (it was cancelled)."""
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+
+    def retry_after(self):
+        """Seconds until an open breaker lets a probe through."""
+        return max(0.0, self.cooldown - (time.monotonic() - self._opened_at)) if self.state == 'open' else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "recentCalls": len(self._outcomes),
+                    "recentFailures": self._outcomes.count(False)}
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per model, created on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(name, CircuitBreaker(name))
+        return breaker
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in list(self._breakers.items())}
+
+
+retry_budget = RetryBudget()
+latency_stats = LatencyStats()
+breakers = BreakerRegistry()
+
+
+if __name__ == '__main__':
+    # Simulation: tail latency and error rate of a flaky, long-tailed upstream with no protection,
+    # with retries, and with retries plus hedging after the p95.
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    def flaky_call():
+        if random.random() < 0.05:
+            time.sleep(0.01)
+            raise IOError("503")
+        time.sleep(random.lognormvariate(math.log(0.02), 0.3) * (10 if random.random() < 0.03 else 1))
+
+    pool = ThreadPoolExecutor(max_workers=32)
+
+    def protected(hedge):
+        stats, budget = LatencyStats(min_samples=20), RetryBudget()
+        lock = threading.Lock()
+
+        def one():
+            budget.record_call()
+            for attempt in range(GEMINI_MAX_ATTEMPTS):
+                started = time.perf_counter()
+                try:
+                    delay = stats.quantile('insight', 'm', 0.95) if hedge else None
+                    primary = pool.submit(flaky_call)
+                    done, _ = wait([primary], timeout=delay)
+                    if not done and budget.try_spend():
+                        done, _ = wait([primary, pool.submit(flaky_call)], return_when=FIRST_COMPLETED)
+                    list(done or [primary])[0].result()
+                    with lock:
+                        stats.record('insight', 'm', time.perf_counter() - started)
+                    return True
+                except IOError:
+                    if attempt + 1 == GEMINI_MAX_ATTEMPTS or not budget.try_spend():
+                        return False
+                    time.sleep(backoff_delay(attempt, base=0.01))
+        return one
+
+    for label, run in (("no retries", lambda: pool.submit(flaky_call).exception() is None),
+                       ("retries", protected(hedge=False)),
+                       ("retries + hedging", protected(hedge=True))):
+        latencies, errors = [], 0
+        for _ in range(400):
+            started = time.perf_counter()
+            errors += not run()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        print(f"{label:>18}: error rate {errors / 4:.1f}%  p50 {latencies[200] * 1000:.0f} ms  "
+              f"p99 {latencies[395] * 1000:.0f} ms")
@@ -0,0 +1,306 @@
+# api/_scramble_analysis.py inside your Vercel project's 'api' directory
+# Exact 3x3 scramble analysis: optimal cross length for all six colours, optimal EOLine length
+# and a count of F2L pairs that are already connected after the scramble.
+#
+# The cross and EOLine answers come from complete distance tables (every reachable state ->
+# optimal move count, half-turn metric) built once by breadth-first search over small piece
+# coordinates. The tables are stored next to this file as nibble-packed binary files and opened
+# with np.memmap, so a cold start maps them instead of rebuilding them. All six colours use the
+# same D-face tables: the scrambled cube is first rotated so the colour being analysed is on D.
+#
+# Rebuild the tables with:  python api/_scramble_analysis.py --build
+
+import os
+
+import numpy as np
+
+from _cube_sim import PUZZLE_MODELS, CUBE_COLOR_ORDER, CUBE_FACES
+from _log import get_logger
+
+log = get_logger('scramble-analysis')
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+CROSS_TABLE_PATH = os.path.join(TABLE_DIR, 'cross_d.bin')
+EOLINE_TABLE_PATH = os.path.join(TABLE_DIR, 'eoline_d.bin')
+
+# WCA colour scheme in the scrambling orientation (white top, green front).
+FACE_COLOR_NAMES = {'U': 'white', 'D': 'yellow', 'F': 'green', 'B': 'blue', 'R': 'red', 'L': 'orange'}
+# Whole-cube rotation that brings each face to D.
+ROTATION_TO_D = {'D': '', 'U': 'x2', 'F': "x'", 'B': 'x', 'R': 'z', 'L': "z'"}
+
+CUBE = PUZZLE_MODELS['3x3']
+FACE_TURNS = [face + suffix for face in CUBE_FACES for suffix in ('', "'", '2')]
+UNVISITED = 15
+
+
+def _geometry():
+    """Sticker indices grouped by cubie, plus forward sticker maps for the 18 face turns."""
+    face_size = 9
+    face_of = np.repeat(np.arange(6), face_size)
+    normals = np.array([CUBE_FACES[name] for name in CUBE_COLOR_ORDER], dtype=float)
+    # Rebuild sticker centres the same way build_cube does, to group stickers into cubies.
+    offsets = np.arange(3) - 1.0
+    points = []
+    for normal in normals:
+        in_plane = [axis for axis in np.eye(3) if abs(np.dot(axis, normal)) < 0.5]
+        for a in offsets:
+            for b in offsets:
+                points.append(normal * 1.5 + in_plane[0] * a + in_plane[1] * b)
+    points = np.array(points)
+    cubie_centres = points - normals[face_of] * 0.5
+
+    groups = {}
+    for sticker, centre in enumerate(np.round(cubie_centres).astype(int)):
+        groups.setdefault(tuple(centre), []).append(sticker)
+    edges = [stickers for stickers in groups.values() if len(stickers) == 2]
+    corners = [stickers for stickers in groups.values() if len(stickers) == 3]
+
+    forward = {}
+    for turn in FACE_TURNS:
+        perm = CUBE.move_perms[CUBE.token_codes[turn]]
+        fwd = np.empty_like(perm)
+        fwd[perm] = np.arange(len(perm))
+        forward[turn] = fwd
+    return face_of, edges, corners, forward
+
+
+FACE_OF, EDGES, CORNERS, FORWARD = _geometry()
+FACE_INDEX = {name: index for index, name in enumerate(CUBE_COLOR_ORDER)}
+EDGE_STICKERS = [sticker for edge in EDGES for sticker in edge]
+EDGE_STICKER_INDEX = {sticker: index for index, sticker in enumerate(EDGE_STICKERS)}
+# Edge-sticker forward maps: (18, 24) table of where each of the 24 edge sticker slots goes.
+EDGE_STICKER_MOVES = np.array([[EDGE_STICKER_INDEX[int(FORWARD[turn][sticker])] for sticker in EDGE_STICKERS]
+                               for turn in FACE_TURNS], dtype=np.int16)
+
+
+def _edge_between(face_a, face_b):
+    """Index into EDGES of the edge slot between two faces."""
+    for index, edge in enumerate(EDGES):
+        if {int(FACE_OF[sticker]) for sticker in edge} == {FACE_INDEX[face_a], FACE_INDEX[face_b]}:
+            return index
+    raise ValueError(f"No edge between {face_a} and {face_b}.")
+
+
+def _sticker_on(edge_index, face):
+    return next(sticker for sticker in EDGES[edge_index] if FACE_OF[sticker] == FACE_INDEX[face])
+
+
+CROSS_SIDES = ['F', 'R', 'B', 'L']
+# The D-coloured sticker of DF, DR, DB, DL in the solved cube, as edge-sticker indices.
+CROSS_SOLVED = [EDGE_STICKER_INDEX[_sticker_on(_edge_between('D', side), 'D')] for side in CROSS_SIDES]
+
+
+def _pack(distances):
+    """Packs a uint8 distance array (values < 16) two entries per byte."""
+    if len(distances) % 2:
+        distances = np.append(distances, UNVISITED)
+    return (distances[0::2] | (distances[1::2] << 4)).astype(np.uint8)
+
+
+def _lookup(packed, index):
+    return (int(packed[index >> 1]) >> (4 * (index & 1))) & 0xF
+
+
+def _bfs(size, start, neighbours):
+    """Breadth-first search over an integer-coded state space; returns uint8 distances."""
+    distances = np.full(size, UNVISITED, dtype=np.uint8)
+    distances[start] = 0
+    frontier = np.array([start], dtype=np.int64)
+    depth = 0
+    while frontier.size:
+        depth += 1
+        candidates = np.unique(np.concatenate([neighbours(frontier, move) for move in range(len(FACE_TURNS))]))
+        frontier = candidates[distances[candidates] == UNVISITED]
+        distances[frontier] = depth
+    return distances
+
+
+def build_cross_table():
+    """Distance table over the positions of the four D-cross edge stickers (24**4 entries)."""
+    radix = 24 ** np.arange(4, dtype=np.int64)
+
+    def neighbours(states, move):
+        digits = (states[:, None] // radix) % 24
+        return (EDGE_STICKER_MOVES[move][digits] * radix).sum(axis=1)
+
+    return _bfs(24 ** 4, int((np.array(CROSS_SOLVED) * radix).sum()), neighbours)
+
+
+def _eo_reference_stickers():
+    """Reference sticker of each edge slot: its U/D sticker, or its F/B sticker for E-slice edges."""
+    references = []
+    for edge in EDGES:
+        faces = [CUBE_COLOR_ORDER[FACE_OF[sticker]] for sticker in edge]
+        preferred = [sticker for sticker, face in zip(edge, faces) if face in 'UD'] or \
+                    [sticker for sticker, face in zip(edge, faces) if face in 'FB']
+        references.append(preferred[0])
+    return references
+
+
+EO_REFERENCES = _eo_reference_stickers()
+EO_REFERENCE_SET = set(EO_REFERENCES)
+EDGE_SLOT_OF_STICKER = {sticker: index for index, edge in enumerate(EDGES) for sticker in edge}
+# (18, 12) tables: where the piece in each slot goes, and whether its orientation flips.
+EDGE_SLOT_MOVES = np.array([[EDGE_SLOT_OF_STICKER[int(FORWARD[turn][EO_REFERENCES[slot]])] for slot in range(12)]
+                            for turn in FACE_TURNS], dtype=np.int16)
+EDGE_FLIPS = np.array([[int(int(FORWARD[turn][EO_REFERENCES[slot]]) not in EO_REFERENCE_SET) for slot in range(12)]
+                       for turn in FACE_TURNS], dtype=np.int64)
+LINE_SLOTS = [_edge_between('D', 'F'), _edge_between('D', 'B')]
+
+
+def build_eoline_table():
+    """Distance table over (orientation of slots 0-10, DF slot, DB slot): 2048 * 12 * 12 entries."""
+    bit_weights = 1 << np.arange(11, dtype=np.int64)
+
+    def neighbours(states, move):
+        eo, df_slot, db_slot = states // 144, (states // 12) % 12, states % 12
+        bits = np.zeros((len(states), 12), dtype=np.int64)
+        bits[:, :11] = (eo[:, None] >> np.arange(11)) & 1
+        bits[:, 11] = bits[:, :11].sum(axis=1) & 1  # Total flip parity is always even.
+        new_bits = np.zeros_like(bits)
+        new_bits[:, EDGE_SLOT_MOVES[move]] = bits ^ EDGE_FLIPS[move]
+        new_eo = (new_bits[:, :11] * bit_weights).sum(axis=1)
+        return new_eo * 144 + EDGE_SLOT_MOVES[move][df_slot] * 12 + EDGE_SLOT_MOVES[move][db_slot]
+
+    return _bfs(2048 * 144, LINE_SLOTS[0] * 12 + LINE_SLOTS[1], neighbours)
+
+
+def build_tables():
+    os.makedirs(TABLE_DIR, exist_ok=True)
+    _pack(build_cross_table()).tofile(CROSS_TABLE_PATH)
+    _pack(build_eoline_table()).tofile(EOLINE_TABLE_PATH)
+
+
+_tables = {}
+
+
+def _table(path, builder):
+    """Memory-maps a packed table, building it in memory if the file is missing."""
+    if path not in _tables:
+        if os.path.exists(path):
+            _tables[path] = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            log.warning("Pruning table is missing; building it in memory. Run _scramble_analysis.py --build.", path=path)
+            _tables[path] = _pack(builder())
+    return _tables[path]
+
+
+def _cross_index(state):
+    """Table index for the cross of the colour currently on D, read off a facelet state."""
+    colour_face = {int(state[FACE_INDEX[face] * 9 + 4]): face for face in CUBE_FACES}  # centre colour -> face
+    cross_colour = int(state[FACE_INDEX['D'] * 9 + 4])
+    index = 0
+    for edge in EDGES:
+        colours = [int(state[sticker]) for sticker in edge]
+        if cross_colour not in colours:
+            continue
+        cross_sticker = edge[colours.index(cross_colour)]
+        side = colour_face[colours[1 - colours.index(cross_colour)]]
+        index += EDGE_STICKER_INDEX[cross_sticker] * 24 ** CROSS_SIDES.index(side)
+    return index
+
+
+def _eoline_index(state):
+    """Table index for the EOLine (F/B orientation axis, DF/DB line) of the current state."""
+    colour_face = {int(state[FACE_INDEX[face] * 9 + 4]): face for face in CUBE_FACES}
+    eo = 0
+    df_slot = db_slot = 0
+    for slot, edge in enumerate(EDGES):
+        piece_faces = {colour_face[int(state[sticker])]: sticker for sticker in edge}
+        reference_face = next((face for face in 'UD' if face in piece_faces), None) or \
+                         next(face for face in 'FB' if face in piece_faces)
+        if slot < 11 and piece_faces[reference_face] not in EO_REFERENCE_SET:
+            eo |= 1 << slot
+        if set(piece_faces) == {'D', 'F'}:
+            df_slot = slot
+        elif set(piece_faces) == {'D', 'B'}:
+            db_slot = slot
+    return eo * 144 + df_slot * 12 + db_slot
+
+
+def _connected_pairs(state):
+    """Counts F2L corner/edge pairs (for the colour on D) that are already joined or solved."""
+    colour_face = {int(state[FACE_INDEX[face] * 9 + 4]): face for face in CUBE_FACES}
+    face_colour = {face: colour for colour, face in colour_face.items()}
+    sticker_of_colour = {}
+    for piece in EDGES + CORNERS:
+        colours = frozenset(int(state[sticker]) for sticker in piece)
+        sticker_of_colour[colours] = {int(state[sticker]): sticker for sticker in piece}
+
+    pairs = 0
+    for side_a, side_b in (('F', 'R'), ('R', 'B'), ('B', 'L'), ('L', 'F')):
+        colour_a, colour_b = face_colour[side_a], face_colour[side_b]
+        edge = sticker_of_colour[frozenset((colour_a, colour_b))]
+        corner = sticker_of_colour[frozenset((face_colour['D'], colour_a, colour_b))]
+        # Joined when each side colour shows on the same face on both pieces, next to each other.
+        if all(FACE_OF[edge[colour]] == FACE_OF[corner[colour]] and _adjacent(edge[colour], corner[colour])
+               for colour in (colour_a, colour_b)):
+            pairs += 1
+    return pairs
+
+
+def _adjacent(sticker_a, sticker_b):
+    row_a, col_a = divmod(sticker_a % 9, 3)
+    row_b, col_b = divmod(sticker_b % 9, 3)
+    return abs(row_a - row_b) + abs(col_a - col_b) == 1
+
+
+def analyze_scramble(scramble):
+    """Returns exact cross/EOLine lengths and connected-pair counts for a 3x3 scramble.
+
+    Raises ValueError for notation the simulator does not understand.
+    """
+    cross_table = _table(CROSS_TABLE_PATH, build_cross_table)
+    eoline_table = _table(EOLINE_TABLE_PATH, build_eoline_table)
+
+    scrambled = CUBE.apply(CUBE.solved, scramble)
+    cross = {}
+    eoline = {}
+    pairs = {}
+    for face, rotation in ROTATION_TO_D.items():
+        colour = FACE_COLOR_NAMES[face]
+        state = CUBE.apply(scrambled, rotation) if rotation else scrambled
+        cross[colour] = _lookup(cross_table, _cross_index(state))
+        # EOLine can be built along either horizontal axis, so take the better of the two.
+        eoline[colour] = min(_lookup(eoline_table, _eoline_index(state)),
+                             _lookup(eoline_table, _eoline_index(CUBE.apply(state, 'y'))))
+        pairs[colour] = _connected_pairs(state)
+
+    best_colour = min(cross, key=lambda name: (cross[name], -pairs[name]))
+    return {
+        "cross": cross,
+        "eoline": eoline,
+        "connectedPairs": pairs,
+        "bestCross": {"color": best_colour, "moves": cross[best_colour], "connectedPairs": pairs[best_colour]},
+    }
+
+
+def describe_analysis(analysis):
+    """One-sentence scrambleAnalysis text built from analyze_scramble() output."""
+    best = analysis["bestCross"]
+    easiest = sorted(analysis["cross"].items(), key=lambda item: item[1])[:3]
+    others = ", ".join(f"{colour} {moves}" for colour, moves in easiest if colour != best["color"])
+    pair_text = {0: "no F2L pairs are", 1: "1 F2L pair is"}.get(best["connectedPairs"], f"{best['connectedPairs']} F2L pairs are")
+    return (f"The {best['color']} cross is solvable in {best['moves']} moves ({others} for other colours), "
+            f"and {pair_text} already connected for that colour.")
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build', action='store_true', help="Rebuild the binary tables in api/tables/")
+    parser.add_argument('scramble', nargs='?', default="R U R' U' F2 D L2 B' U2 R F' D2 L U B2 R2 D' F L2 U")
+    args = parser.parse_args()
+
+    if args.build:
+        started = time.perf_counter()
+        build_tables()
+        print(f"Built tables in {time.perf_counter() - started:.1f}s: "
+              f"{os.path.getsize(CROSS_TABLE_PATH):,} + {os.path.getsize(EOLINE_TABLE_PATH):,} bytes")
+
+    started = time.perf_counter()
+    result = analyze_scramble(args.scramble)
+    print(f"{(time.perf_counter() - started) * 1000:.2f}ms {result}")
+    print(describe_analysis(result))
@@ -0,0 +1,147 @@
+# api/_scramble_engine.py inside your Vercel project's 'api' directory
+# Batched scramble generation for 2x2, 3x3, 4x4 and pyraminx.
+#
+# Scrambles are sampled as a Markov chain over faces: a move may not follow a move on the same
+# face, and two moves on the same axis must appear in a fixed order (so "R L" is allowed but
+# "L R" and "R L R" are not). Each position is sampled for the whole batch at once with NumPy,
+# so generating a million scrambles costs a few dozen vectorized steps, not a Python loop per move.
+#
+# Benchmark with:  python api/_scramble_engine.py --count 1000000
+
+import os
+import threading
+from collections import namedtuple, deque
+
+import numpy as np
+
+PuzzleSpec = namedtuple('PuzzleSpec', ['faces', 'axes', 'suffixes', 'min_length', 'max_length', 'tips'])
+
+PUZZLES = {
+    '2x2': PuzzleSpec(['R', 'U', 'F'], [0, 1, 2], ['', "'", '2'], 9, 11, []),
+    '3x3': PuzzleSpec(['R', 'L', 'U', 'D', 'F', 'B'], [0, 0, 1, 1, 2, 2], ['', "'", '2'], 20, 21, []),
+    '4x4': PuzzleSpec(['R', 'L', 'U', 'D', 'F', 'B', 'Rw', 'Uw', 'Fw'], [0, 0, 1, 1, 2, 2, 0, 1, 2], ['', "'", '2'], 40, 44, []),
+    'pyraminx': PuzzleSpec(['R', 'L', 'U', 'B'], [0, 1, 2, 3], ['', "'"], 8, 10, ['r', 'l', 'u', 'b']),
+}
+
+SCRAMBLE_POOL_SIZE = int(os.environ.get("SCRAMBLE_POOL_SIZE", "1024"))
+
+
+class ScrambleGenerator:
+    """Vectorized generator for one puzzle type."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        faces = len(spec.faces)
+        # Transition table: row `prev` lists the faces allowed after face `prev`; the extra last
+        # row is the start state, where every face is allowed.
+        self.table = np.full((faces + 1, faces), -1, dtype=np.int16)
+        self.counts = np.zeros(faces + 1, dtype=np.int16)
+        for prev in range(faces + 1):
+            allowed = [face for face in range(faces)
+                       if prev == faces or spec.axes[face] != spec.axes[prev] or face > prev]
+            self.table[prev, :len(allowed)] = allowed
+            self.counts[prev] = len(allowed)
+
+        # Token table: main moves, then tips, then an empty token for unused positions.
+        tokens = [face + suffix for face in spec.faces for suffix in spec.suffixes]
+        tokens += [tip + suffix for tip in spec.tips for suffix in ('', "'")]
+        self.tip_offset = len(spec.faces) * len(spec.suffixes)
+        self.empty_code = len(tokens)
+        tokens.append('')
+        self.token_width = max(len(token) for token in tokens) + 1
+        self.token_bytes = np.zeros((len(tokens), self.token_width), dtype=np.uint8)
+        for code, token in enumerate(tokens):
+            if token:
+                encoded = (token + ' ').encode('ascii')
+                self.token_bytes[code, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+
+    def generate_codes(self, count, rng):
+        """Returns an int16 array of shape (count, positions) of move codes, empty_code-padded."""
+        spec = self.spec
+        faces = len(spec.faces)
+        suffixes = len(spec.suffixes)
+        positions = spec.max_length + len(spec.tips)
+        codes = np.full((count, positions), self.empty_code, dtype=np.int16)
+
+        lengths = rng.integers(spec.min_length, spec.max_length + 1, size=count)
+        prev = np.full(count, faces, dtype=np.int16)
+        for position in range(spec.max_length):
+            pick = (rng.random(count) * self.counts[prev]).astype(np.int16)
+            face = self.table[prev, pick]
+            suffix = rng.integers(0, suffixes, size=count, dtype=np.int16)
+            codes[:, position] = np.where(position < lengths, face * suffixes + suffix, self.empty_code)
+            prev = face
+
+        if spec.tips:
+            # Each tip is independently untouched, turned clockwise or turned counter-clockwise.
+            tip_turns = rng.integers(0, 3, size=(count, len(spec.tips)), dtype=np.int16)
+            tip_codes = self.tip_offset + np.arange(len(spec.tips), dtype=np.int16) * 2 + tip_turns - 1
+            codes[:, spec.max_length:] = np.where(tip_turns > 0, tip_codes, self.empty_code)
+        return codes
+
+    def render(self, codes):
+        """Turns a code array from generate_codes into scramble strings."""
+        # Fixed-width byte rows built in one gather; only the final decode is per scramble.
+        rows = self.token_bytes[codes].reshape(len(codes), -1)
+        packed = rows.view(f'S{rows.shape[1]}').ravel()
+        return [row.replace(b'\x00', b'').decode('ascii').rstrip() for row in packed]
+
+    def generate(self, count, rng):
+        return self.render(self.generate_codes(count, rng))
+
+
+GENERATORS = {cube_type: ScrambleGenerator(spec) for cube_type, spec in PUZZLES.items()}
+
+
+def generate_scrambles(cube_type, count, seed=None):
+    """Generates `count` scrambles for a cube type. A seed makes the batch reproducible."""
+    return GENERATORS[cube_type].generate(count, np.random.default_rng(seed))
+
+
+class ScramblePool:
+    """Per-cube-type pool of pre-generated scrambles, refilled a whole batch at a time."""
+
+    def __init__(self, pool_size=SCRAMBLE_POOL_SIZE):
+        self.pool_size = pool_size
+        self._rng = np.random.default_rng()
+        self._pools = {cube_type: deque() for cube_type in GENERATORS}
+        self._lock = threading.Lock()
+
+    def take(self, cube_type, count):
+        """Returns `count` fresh scrambles, topping the pool back up when it runs low."""
+        with self._lock:
+            pool = self._pools[cube_type]
+            if len(pool) < count + self.pool_size // 4:
+                pool.extend(GENERATORS[cube_type].generate(count + self.pool_size - len(pool), self._rng))
+            return [pool.popleft() for _ in range(count)]
+
+    def warm(self):
+        for cube_type in self._pools:
+            self.take(cube_type, 0)
+
+    def sizes(self):
+        with self._lock:
+            return {cube_type: len(pool) for cube_type, pool in self._pools.items()}
+
+
+scramble_pool = ScramblePool()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for cube_type, generator in GENERATORS.items():
+        started = time.perf_counter()
+        codes = generator.generate_codes(args.count, rng)
+        code_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        strings = generator.render(codes)
+        render_seconds = time.perf_counter() - started
+        print(f"{cube_type:>9}: {args.count / code_seconds:,.0f} scrambles/s (codes) "
+              f"{args.count / (code_seconds + render_seconds):,.0f} scrambles/s (strings)  e.g. {strings[0]}")
@@ -0,0 +1,139 @@
+# api/_single_flight.py inside your Vercel project's 'api' directory
+# Single-flight coalescing: concurrent callers with the same key share one computation.
+#
+# The first caller for a key (the leader) runs the computation; callers that arrive while it is in
+# flight wait for the leader's result instead of starting their own. Once it has finished, the
+# next caller computes again, unless the SingleFlight was created with `replay_seconds` (as the
+# Idempotency-Key registry is): then callers arriving within that window get the stored result
+# straight away. Failures are shared with the callers already waiting but never replayed, so a
+# retry after an error does real work again.
+#
+# Waiting uses a concurrent.futures.Future, so leaders and followers may be threads (Flask),
+# coroutines on any event loop (ASGI, background jobs) or a mix of both.
+
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+
+def fingerprint(value):
+    """Stable hash of a JSON-serialisable value (dict key order does not matter)."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused with a different request body."""
+
+
+class SingleFlight:
+    """Thread-safe registry of in-flight and recently finished computations, by key."""
+
+    def __init__(self, replay_seconds=0.0, max_replays=1024):
+        self.replay_seconds = replay_seconds
+        self.max_replays = max_replays
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> [Future, finished_at or None]
+        self.leaders = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    def _claim(self, key):
+        """Returns (future, is_leader) for key."""
+        now = time.time()
+        with self._lock:
+            entry = self._flights.get(key)
+            if entry is not None and entry[1] is not None and now - entry[1] > self.replay_seconds:
+                del self._flights[key]
+                entry = None
+            if entry is not None:
+                if entry[1] is None:
+                    self.coalesced += 1
+                else:
+                    self.replayed += 1
+                return entry[0], False
+            future = Future()
+            self._flights[key] = [future, None]
+            self.leaders += 1
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None, replayable=True):
+        with self._lock:
+            if error is None and replayable and self.replay_seconds > 0:
+                self._flights[key][1] = time.time()
+                finished = [k for k, entry in self._flights.items() if entry[1] is not None]
+                for stale in finished[:max(0, len(finished) - self.max_replays)]:
+                    del self._flights[stale]  # Oldest first: dicts keep insertion order.
+            else:
+                self._flights.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def do(self, key, compute, replayable=lambda result: True):
+        """Runs compute() once per key among concurrent (blocking) callers and returns its result."""
+        future, leader = self._claim(key)
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            result = compute()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result, replayable=replayable(result))
+        return result
+
+    async def do_async(self, key, compute, replayable=lambda result: True):
+        """Async counterpart of do(); compute is a coroutine function."""
+        future, leader = self._claim(key)
+        if not leader:
+            return copy.deepcopy(await asyncio.wrap_future(future))
+        try:
+            result = await compute()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # Followers should not inherit the leader's cancellation; they retry on their own.
+                self._settle(key, future, error=RuntimeError("Shared upstream call was cancelled."))
+            else:
+                self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result, replayable=replayable(result))
+        return result
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(1 for entry in self._flights.values() if entry[1] is None)
+            return {
+                "inFlight": in_flight,
+                "replayable": len(self._flights) - in_flight,
+                "replaySeconds": self.replay_seconds,
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "replayed": self.replayed,
+            }
+
+
+def idempotent(flights, key, request_fingerprint, compute):
+    """Runs compute() -> (body, status) at most once per idempotency key (blocking callers).
+
+    Server errors (5xx) are handed to concurrent waiters but not replayed later.
+    """
+    stored_fingerprint, body, status = flights.do(
+        key, lambda: (request_fingerprint,) + tuple(compute()), replayable=lambda result: result[2] < 500)
+    if stored_fingerprint != request_fingerprint:
+        raise IdempotencyConflict("This Idempotency-Key was already used with a different request body.")
+    return body, status
+
+
+async def idempotent_async(flights, key, request_fingerprint, compute):
+    """Async counterpart of idempotent(); compute is a coroutine function returning (body, status)."""
+    async def run():
+        return (request_fingerprint,) + tuple(await compute())
+    stored_fingerprint, body, status = await flights.do_async(key, run, replayable=lambda result: result[2] < 500)
+    if stored_fingerprint != request_fingerprint:
+        raise IdempotencyConflict("This Idempotency-Key was already used with a different request body.")
+    return body, status
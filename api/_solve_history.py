@@ -0,0 +1,209 @@
+# api/_solve_history.py inside your Vercel project's 'api' directory
+# Columnar solve history: one NumPy array per field instead of a list of solve objects.
+#
+# Clients can send userPerformanceHistory either as the usual JSON list of solve objects or in a
+# compact binary form ("CTH1"), raw or base64-encoded:
+#
+#   magic     4 bytes   b'CTH1'
+#   count     uint32    number of solves
+#   types     uint8 n, then n x (uint8 length + ASCII name)   cube type table, e.g. ['3x3', '2x2']
+#   times     count x int32    solve time in ms, delta-encoded (first value is absolute)
+#   penalty   count x uint8    0 = none, 1 = +2, 2 = DNF
+#   cube type count x uint8    index into the type table
+#   timestamp count x varint   zigzag delta of the ms timestamp (LEB128, 7 bits per byte)
+#
+# All integers are little-endian. Decoding slices the buffer with np.frombuffer, so the penalty
+# and cube type columns are views of the request body; only the delta columns are materialised
+# (one cumsum each). Both wire forms produce the same SolveHistory, so everything downstream
+# (stats, insight features) handles a single shape.
+#
+# Benchmark with:  python api/_solve_history.py --solves 50000
+
+import math
+import base64
+import binascii
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+HISTORY_MAGIC = b'CTH1'
+PENALTY_CODES = {None: 0, '+2': 1, 'DNF': 2}
+PENALTY_NAMES = {code: name for name, code in PENALTY_CODES.items()}
+PLUS_TWO_MS = 2000
+
+SolveHistory = namedtuple('SolveHistory', ['time_ms', 'penalty', 'timestamp_ms', 'cube_type_code', 'cube_types'])
+
+
+def empty_history():
+    return SolveHistory(np.zeros(0, np.int64), np.zeros(0, np.uint8), np.zeros(0, np.int64), np.zeros(0, np.uint8), [])
+
+
+def _solve_time(value):
+    """A solve's time in whole ms, or None when it is not a finite number (null, '', NaN, ...)."""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    # The CTH1 time column is int32; anything outside it is not a solve time either.
+    return int(value) if -2 ** 31 <= value < 2 ** 31 else None
+
+
+def history_from_solves(solves):
+    """Builds a SolveHistory from a JSON list of solve objects ({time, penalty, timestamp, cubeType}).
+
+    Solves without a usable time (e.g. {"time": null} from an interrupted solve) are skipped.
+    """
+    if not isinstance(solves, list):
+        raise ValueError("userPerformanceHistory must be a list of solves or an encoded history string.")
+    cube_types = []
+    type_codes = {}
+    columns = ([], [], [], [])
+    for solve in solves:
+        if not isinstance(solve, dict):
+            raise ValueError("Every solve in userPerformanceHistory must be an object.")
+        penalty = solve.get('penalty')
+        if penalty not in PENALTY_CODES:
+            raise ValueError(f"Unknown penalty {penalty!r} in userPerformanceHistory.")
+        time_ms = _solve_time(solve.get('time', 0))
+        if time_ms is None:
+            continue
+        cube_type = str(solve.get('cubeType') or '')
+        if cube_type not in type_codes:
+            type_codes[cube_type] = len(cube_types)
+            cube_types.append(cube_type)
+        timestamp = solve.get('timestamp')
+        columns[0].append(time_ms)
+        columns[1].append(PENALTY_CODES[penalty])
+        columns[2].append(int(timestamp) if isinstance(timestamp, (int, float)) else 0)
+        columns[3].append(type_codes[cube_type])
+    return SolveHistory(np.array(columns[0], np.int64), np.array(columns[1], np.uint8),
+                        np.array(columns[2], np.int64), np.array(columns[3], np.uint8), cube_types)
+
+
+def _encode_varints(values):
+    out = bytearray()
+    for value in values.tolist():
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _decode_varints(buffer, count):
+    """Decodes `count` LEB128 varints from the start of a uint8 array; returns (values, bytes used)."""
+    ends = np.flatnonzero(buffer < 0x80)
+    if len(ends) < count:
+        raise ValueError("Encoded history is truncated in the timestamp column.")
+    if count == 0:
+        return np.zeros(0, np.uint64), 0
+    used = int(ends[count - 1]) + 1
+    data = buffer[:used].astype(np.uint64)
+    starts = np.concatenate(([0], ends[:count - 1] + 1))
+    # Position of every byte inside its own varint gives its shift.
+    group_start = np.repeat(starts, np.diff(np.concatenate((starts, [used]))))
+    shifts = (np.arange(used, dtype=np.uint64) - group_start.astype(np.uint64)) * np.uint64(7)
+    if shifts.max() > 63:
+        raise ValueError("Encoded history has an oversized timestamp varint.")
+    return np.bitwise_or.reduceat((data & np.uint64(0x7F)) << shifts, starts), used
+
+
+def encode_history(history):
+    """Serialises a SolveHistory into the CTH1 binary form."""
+    count = len(history.time_ms)
+    parts = [HISTORY_MAGIC, struct.pack('<IB', count, len(history.cube_types))]
+    for name in history.cube_types:
+        encoded = name.encode('ascii')
+        parts.append(struct.pack('<B', len(encoded)) + encoded)
+    parts.append(np.diff(history.time_ms, prepend=0).astype('<i4').tobytes())
+    parts.append(history.penalty.astype(np.uint8).tobytes())
+    parts.append(history.cube_type_code.astype(np.uint8).tobytes())
+    deltas = np.diff(history.timestamp_ms.astype(np.int64), prepend=0)
+    parts.append(_encode_varints(((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)))  # Zigzag.
+    return b''.join(parts)
+
+
+def decode_history(data):
+    """Decodes CTH1 bytes (or a base64 string of them) into a SolveHistory."""
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Encoded history is not valid base64: {e}")
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if bytes(buffer[:4]) != HISTORY_MAGIC or len(buffer) < 9:
+        raise ValueError("Encoded history does not start with the CTH1 header.")
+    count, type_count = struct.unpack_from('<IB', data, 4)
+    offset = 9
+    cube_types = []
+    for _ in range(type_count):
+        if offset >= len(buffer):
+            raise ValueError("Encoded history is truncated in the cube type table.")
+        length = int(buffer[offset])
+        cube_types.append(bytes(buffer[offset + 1:offset + 1 + length]).decode('ascii', errors='replace'))
+        offset += 1 + length
+    if len(buffer) < offset + count * 6:
+        raise ValueError("Encoded history is truncated in the fixed-width columns.")
+
+    time_deltas = np.frombuffer(data, dtype='<i4', count=count, offset=offset)
+    offset += count * 4
+    penalty = buffer[offset:offset + count]
+    offset += count
+    cube_type_code = buffer[offset:offset + count]
+    offset += count
+    if count and (penalty.max() > 2 or (cube_type_code.max() >= type_count)):
+        raise ValueError("Encoded history has an out-of-range penalty or cube type.")
+    zigzag, _ = _decode_varints(buffer[offset:], count)
+    deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return SolveHistory(np.cumsum(time_deltas, dtype=np.int64), penalty, np.cumsum(deltas), cube_type_code, cube_types)
+
+
+def parse_history(value):
+    """Accepts userPerformanceHistory in any supported wire form and returns a SolveHistory."""
+    if value is None:
+        return empty_history()
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return decode_history(value)
+    return history_from_solves(value)
+
+
+def history_results(history):
+    """Effective results in ms as float64 (+2 applied, DNF -> infinity), oldest first."""
+    results = history.time_ms.astype(np.float64) + PLUS_TWO_MS * (history.penalty == PENALTY_CODES['+2'])
+    results[history.penalty == PENALTY_CODES['DNF']] = np.inf
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--solves', type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    timestamps = 1_700_000_000_000 + np.cumsum(rng.integers(20_000, 90_000, args.solves))
+    solves = [{"id": f"solve-{index}", "time": int(t), "penalty": rng.choice([None, None, None, '+2', 'DNF'], p=[.3, .3, .36, .02, .02]),
+               "timestamp": int(ts), "cubeType": '3x3' if index % 5 else '2x2', "scramble": "R U R' U' F2 D L2"}
+              for index, (t, ts) in enumerate(zip(rng.normal(15000, 2500, args.solves).astype(int), timestamps))]
+
+    json_body = json.dumps(solves)
+    started = time.perf_counter()
+    from_json = history_from_solves(json.loads(json_body))
+    json_seconds = time.perf_counter() - started
+
+    encoded = base64.b64encode(encode_history(from_json)).decode('ascii')
+    started = time.perf_counter()
+    decoded = decode_history(encoded)
+    binary_seconds = time.perf_counter() - started
+
+    assert all(np.array_equal(a, b) for a, b in zip(decoded[:4], from_json[:4])) and decoded.cube_types == from_json.cube_types
+    print(f"{args.solves} solves: json={len(json_body):,} bytes parse={json_seconds * 1000:.1f}ms  "
+          f"cth1(base64)={len(encoded):,} bytes decode={binary_seconds * 1000:.2f}ms  "
+          f"({len(json_body) / len(encoded):.0f}x smaller, {json_seconds / binary_seconds:.0f}x faster)")
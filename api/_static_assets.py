@@ -0,0 +1,287 @@
+# api/_static_assets.py inside your Vercel project's 'api' directory
+# In-memory static file serving for the Flask app (the local/dev server; Vercel's CDN serves the
+# deployed site directly).
+#
+# On the first static request every web asset under STATIC_ROOT is read once into an index with its gzip (and, if
+# the brotli package is installed, brotli) variant precomputed and a strong ETag from its SHA-256.
+# Each asset is also reachable under a content-hashed name (script.<hash>.js) that is served with
+# a one-year immutable Cache-Control, and the HTML pages are rewritten to reference those names, so
+# browsers fetch each script and stylesheet once per version instead of revalidating it on every
+# page load. Plain names are served with `no-cache` and answer If-None-Match with 304. Single byte
+# ranges are supported on the uncompressed body. Building the index takes ~190 ms, so it is not
+# done at import: API-only cold starts (every deployed function) never pay for it.
+#
+# Each request stats the indexed files (microseconds for a site this size), and the index is
+# rebuilt when one was modified or removed, so an edit to script.js shows up on the next request
+# without restarting the dev server, as it did with send_static_file.
+#
+# Files that are not indexed (other types, too large, added after the index was built) fall back to
+# send_from_directory.
+
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response, send_from_directory
+
+try:
+    import brotli  # Optional: without it only gzip variants are built.
+except ImportError:
+    brotli = None
+
+STATIC_ROOT = os.path.abspath(os.environ.get(
+    "STATIC_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')))
+STATIC_MAX_BYTES = int(os.environ.get("STATIC_MAX_BYTES", str(4 * 1024 * 1024)))
+STATIC_BROTLI_QUALITY = int(os.environ.get("STATIC_BROTLI_QUALITY", "11"))
+
+STATIC_EXTENSIONS = {'.html', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.map', '.webmanifest',
+                     '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2'}
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.map', '.webmanifest'}
+# Directories under STATIC_ROOT that hold no site assets.
+STATIC_SKIP_DIRS = {'api', 'jules-scratch', 'test-results', 'node_modules', '__pycache__'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# src="script.js" / href="style.css" in HTML; group 3 is the referenced path.
+ASSET_REFERENCE = re.compile(r'''\b(src|href)=(["'])([^"'#?:]+)\2''')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class StaticAsset:
+    """One indexed file: its bytes per content coding, strong ETag and content-hashed name."""
+
+    def __init__(self, path, body):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json'):
+            self.content_type += '; charset=utf-8'
+        self.set_body(body)
+
+    def set_body(self, body):
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = digest[:20]
+        stem, ext = os.path.splitext(self.path)
+        self.hashed_path = f"{stem}.{digest[:10]}{ext}"
+        self.bodies = {'identity': body}
+        if os.path.splitext(self.path)[1] in COMPRESSIBLE_EXTENSIONS:
+            compressed = gzip.compress(body, 9, mtime=0)
+            if len(compressed) < len(body):
+                self.bodies['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=STATIC_BROTLI_QUALITY)
+                if len(compressed) < len(body):
+                    self.bodies['br'] = compressed
+
+    def etag_for(self, coding):
+        # Strong ETags have to differ between content codings of the same file.
+        return self.etag if coding == 'identity' else f"{self.etag}-{coding}"
+
+
+class StaticIndex:
+    """All web assets under a root directory, by path and by content-hashed path."""
+
+    def __init__(self, root=STATIC_ROOT):
+        self.root = root
+        self.assets = {}
+        self.hashed = {}
+        self.stamps = {}  # path -> (mtime_ns, size) of the file when it was read
+        self.build()
+
+    def build(self):
+        for directory, subdirectories, files in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories
+                                 if not name.startswith('.') and not (directory == self.root and name in STATIC_SKIP_DIRS)]
+            for name in files:
+                full_path = os.path.join(directory, name)
+                if os.path.splitext(name)[1].lower() not in STATIC_EXTENSIONS:
+                    continue
+                # Stat before reading: an edit made in between shows up as changed() later.
+                stat = os.stat(full_path)
+                if stat.st_size > STATIC_MAX_BYTES:
+                    continue
+                path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    self.assets[path] = StaticAsset(path, f.read())
+                self.stamps[path] = (stat.st_mtime_ns, stat.st_size)
+
+        # Pages go last: their references are rewritten to the hashed names of the finished assets.
+        for path, asset in self.assets.items():
+            if path.endswith('.html'):
+                asset.set_body(self._rewrite_references(path, asset.bodies['identity']))
+        self.hashed = {asset.hashed_path: asset for asset in self.assets.values() if not asset.path.endswith('.html')}
+
+    def _rewrite_references(self, page_path, body):
+        page_dir = os.path.dirname(page_path)
+
+        def replace(match):
+            attribute, quote, reference = match.groups()
+            target = self.assets.get(os.path.normpath(os.path.join(page_dir, reference)).replace(os.sep, '/'))
+            if target is None or target.path.endswith('.html'):
+                return match.group(0)
+            hashed_reference = reference[:len(reference) - len(os.path.basename(reference))] + os.path.basename(target.hashed_path)
+            return f"{attribute}={quote}{hashed_reference}{quote}"
+
+        return ASSET_REFERENCE.sub(replace, body.decode('utf-8')).encode('utf-8')
+
+    def changed(self):
+        """True if an indexed file was modified or removed since the index was built."""
+        for path, stamp in self.stamps.items():
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+            except OSError:
+                return True
+            if (stat.st_mtime_ns, stat.st_size) != stamp:
+                return True
+        return False
+
+    def lookup(self, path):
+        """Returns (asset, immutable) for a request path, or (None, False)."""
+        asset = self.hashed.get(path)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(path), False
+
+    def stats(self):
+        return {
+            "assets": len(self.assets),
+            "brotli": brotli is not None,
+            "identityBytes": sum(len(a.bodies['identity']) for a in self.assets.values()),
+            "gzipBytes": sum(len(a.bodies.get('gzip', a.bodies['identity'])) for a in self.assets.values()),
+            "brBytes": sum(len(a.bodies.get('br', a.bodies.get('gzip', a.bodies['identity']))) for a in self.assets.values()),
+        }
+
+
+def preferred_coding(accept_encoding, available):
+    """Best of br/gzip from an Accept-Encoding header that the asset has, else 'identity'."""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in ('br', 'gzip'):
+        if coding in available and accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return 'identity'
+
+
+def etag_matches(if_none_match, asset):
+    """Weak comparison (as If-None-Match uses) against any coding's ETag of the asset."""
+    if if_none_match.strip() == '*':
+        return True
+    tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+    return any(asset.etag_for(coding) in tags for coding in asset.bodies)
+
+
+def byte_range(range_header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None to ignore it, or 'unsatisfiable'."""
+    match = _RANGE.match(range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None  # Malformed or multiple ranges: answer with the whole body.
+    if not match.group(1):
+        suffix = int(match.group(2))
+        if suffix == 0:
+            return 'unsatisfiable'
+        return max(0, size - suffix), size - 1
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def asset_response(index, path, headers):
+    """Response for GET/HEAD of `path` from the index, or None if the path is not indexed."""
+    asset, immutable = index.lookup(path)
+    if asset is None:
+        return None
+    cache_headers = {
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+    }
+    if len(asset.bodies) > 1:
+        cache_headers['Vary'] = 'Accept-Encoding'
+
+    range_header = headers.get('Range')
+    if_range = headers.get('If-Range')
+    if range_header and if_range and if_range.strip().strip('"') != asset.etag:
+        range_header = None  # The client's partial copy is of another version.
+    # Ranges index into the uncompressed body, so a range request gets the identity coding.
+    coding = 'identity' if range_header else preferred_coding(headers.get('Accept-Encoding'), asset.bodies)
+    etag = asset.etag_for(coding)
+
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match and etag_matches(if_none_match, asset):
+        return Response(status=304, headers={**cache_headers, 'ETag': f'"{etag}"'})
+
+    body = asset.bodies[coding]
+    response_headers = {**cache_headers, 'ETag': f'"{etag}"'}
+    if coding != 'identity':
+        response_headers['Content-Encoding'] = coding
+    status = 200
+    if range_header:
+        selected = byte_range(range_header, len(body))
+        if selected == 'unsatisfiable':
+            return Response(status=416, headers={**response_headers, 'Content-Range': f"bytes */{len(body)}"})
+        if selected is not None:
+            start, end = selected
+            response_headers['Content-Range'] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start:end + 1]
+            status = 206
+    return Response(body, status=status, headers=response_headers, content_type=asset.content_type)
+
+
+_static_index = None
+_static_index_lock = threading.Lock()
+
+
+def get_static_index():
+    """Returns the process-wide StaticIndex, building it on first use and again after an indexed
+    file changed on disk. A rebuild replaces the index, so requests in flight keep a consistent one."""
+    global _static_index
+    index = _static_index
+    if index is None or index.changed():
+        with _static_index_lock:
+            if _static_index is index:
+                _static_index = StaticIndex(STATIC_ROOT)
+    return _static_index
+
+
+def serve_static(path, headers):
+    """Flask view body for a static path: the indexed asset, else the file on disk (or 404)."""
+    response = asset_response(get_static_index(), path, headers)
+    if response is None:
+        response = send_from_directory(STATIC_ROOT, path)
+    return response
+
+
+if __name__ == '__main__':
+    # Benchmark: index build time, bytes on the wire per coding, and per-request serving cost.
+    import time
+    from flask import Flask
+
+    started = time.perf_counter()
+    index = StaticIndex()
+    print(f"indexed {len(index.assets)} assets in {(time.perf_counter() - started) * 1000:.0f} ms: {index.stats()}")
+    for path in ('script.js', 'lessons.js', 'style.css', 'index.html'):
+        asset = index.assets.get(path)
+        if asset:
+            sizes = ", ".join(f"{coding}={len(body):,}" for coding, body in asset.bodies.items())
+            print(f"  {path} -> {asset.hashed_path}: {sizes}")
+
+    app = Flask(__name__)
+    for label, request_headers in (("gzip 200", {'Accept-Encoding': 'gzip, br'}),
+                                   ("304", {'If-None-Match': f'"{index.assets["script.js"].etag}-gzip"'})):
+        with app.test_request_context():
+            started = time.perf_counter()
+            for _ in range(1000):
+                asset_response(index, 'script.js', request_headers)
+            print(f"  script.js {label}: {(time.perf_counter() - started) * 1000:.3f} us per response")
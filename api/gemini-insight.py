@@ -3,111 +3,266 @@
 # This function generates AI insight and now AI lessons using Gemini API.
 
 import os
-import requests
+import sys
 import json
+import time
 import uuid
-import re
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 
+# Shared helper modules (underscore-prefixed so Vercel doesn't deploy them) live next to this file.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _gemini_client as gemini_client
+import _metrics as metrics
+from _log import get_logger
+from _static_assets import serve_static
+from _insight_cache import insight_cache, insight_cache_key, canonical_cube_type
+from _scramble_analysis import analyze_scramble, describe_analysis
+from _solve_history import parse_history
+from _history_features import extract_history_features, describe_history_features
+from _course_stream import CourseStreamParser
+from _json_extract import extract_json_object, salvage_json_object, json_error_context, JsonNotFound
+from _course_schema import COURSE_RESPONSE_SCHEMA, repair_course
+from _chat_window import split_chat, window_chat, rolling_summary
+from _chat_slots import extract_chat_slots, reply_commands
+from _course_store import course_store, course_store_key, COMMON_COURSE_PARAMS
+from _job_queue import course_jobs, JobQueueFull
+from _single_flight import SingleFlight, IdempotencyConflict, fingerprint, idempotent
+from _admission import AdmissionRejected, admit, client_id_for
+
 # Initialize the Flask app for Vercel.
-app = Flask(__name__, static_folder='..', static_url_path='')
+# Static files are served from the in-memory index in _static_assets, not Flask's static route.
+app = Flask(__name__, static_folder=None)
 CORS(app) # Enable CORS for all origins for development. Restrict for production if necessary.
+log = get_logger('gemini-insight')
 
 @app.route('/')
 def root():
-    return app.send_static_file('index.html')
+    return serve_static('index.html', request.headers)
 
 @app.route('/<path:path>')
 def static_proxy(path):
-    return app.send_static_file(path)
+    return serve_static(path, request.headers)
+
+def metrics_request_type(request_json):
+    """Request type label for _metrics; None for streamed courses, which trace their own body."""
+    if request_json.get('type') == 'generate_course' and request_json.get('stream') and not request_json.get('background'):
+        return None
+    return request_json.get('type') if request_json.get('type') in ('lesson_chat', 'generate_course') else 'insight'
+
+metrics.instrument_flask(app, '/api/gemini-insight', metrics_request_type)
+
+def admission_class(request_json):
+    """_admission priority class a request is rate limited in: course generation or insight/chat."""
+    return 'course' if request_json.get('type') == 'generate_course' else 'insight'
 
 # Retrieve Gemini API key from environment variables for security.
 # In Vercel, set this as an environment variable (e.g., GEMINI_API_KEY).
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
 
-# Constants for exponential backoff (no longer used for retries, but kept for reference if needed)
-# MAX_RETRIES = 5
-# INITIAL_RETRY_DELAY = 1 # seconds
+@app.route('/api/gemini-insight/cache-stats', methods=['GET'])
+def insight_cache_stats():
+    """Reports insight cache hit/miss counters so the time-bucket width can be tuned."""
+    return jsonify(cache_stats()), 200
+
+@app.route('/api/gemini-insight/course-store-stats', methods=['GET'])
+def course_store_stats():
+    """Reports course store size and hit/miss counters."""
+    return jsonify(course_store.stats()), 200
+
+@app.route('/api/gemini-insight/jobs', methods=['GET'])
+def course_job_stats():
+    """Reports background job queue limits and how many jobs are in each state."""
+    return jsonify(course_jobs.stats()), 200
+
+@app.route('/api/gemini-insight/admission-stats', methods=['GET'])
+def admission_stats():
+    """Reports upstream slots, queued calls, circuit breakers, the retry budget and model latencies."""
+    return jsonify(gemini_client.upstream_stats()), 200
+
+@app.route('/api/gemini-insight/jobs/<job_id>', methods=['GET', 'DELETE'])
+def course_job(job_id):
+    """Polls (GET) or cancels (DELETE) a background course generation job."""
+    job = course_jobs.cancel(job_id) if request.method == 'DELETE' else course_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job ID."}), 404
+    return jsonify(job.to_dict()), 200
+
+# Responses to requests carrying an Idempotency-Key are replayed for this long.
+IDEMPOTENCY_REPLAY_SECONDS = float(os.environ.get("IDEMPOTENCY_REPLAY_SECONDS", "300"))
+idempotent_requests = SingleFlight(replay_seconds=IDEMPOTENCY_REPLAY_SECONDS)
+
+def cache_stats():
+    """Insight cache counters plus the upstream and idempotency single-flight counters."""
+    return {**insight_cache.stats(), "upstreamSingleFlight": gemini_client.upstream_flights.stats(),
+            "idempotency": idempotent_requests.stats()}
+
+def idempotency_key_for(request_json, headers):
+    """Client-supplied idempotency key (Idempotency-Key header or idempotencyKey field), or None."""
+    key = headers.get('Idempotency-Key') or request_json.get('idempotencyKey')
+    return f"gemini-insight|{key}" if key else None
+
+def request_fingerprint(request_json):
+    return fingerprint({k: v for k, v in request_json.items() if k != 'idempotencyKey'})
+
+def submit_course_job(request_json):
+    """Queues course generation; returns the 202 body with the job ID instead of waiting for Gemini."""
+    job = course_jobs.submit('generate_course', lambda: handle_generate_course(request_json))
+    log.info("Queued course generation job", job_id=job.id)
+    return job.to_dict(), 202
+
+def handle_json_request(request_json):
+    """Every non-streaming request: returns (body, status)."""
+    if request_json.get('type') == 'generate_course' and request_json.get('background'):
+        return submit_course_job(request_json)
+    return gemini_client.run_sync(dispatch_insight_request(request_json))
 
 @app.route('/api/gemini-insight', methods=['POST', 'OPTIONS'])
 def gemini_insight_handler():
     """HTTP endpoint that generates AI insight or AI lessons using Gemini API.
     Handles both preflight (OPTIONS) and actual (POST) requests.
     """
-    print("DEBUG: === gemini_insight_handler received a request. ===") # Prominent log at entry
+    log.debug("gemini_insight_handler received a request", method=request.method)
 
     # Handle CORS preflight (OPTIONS) request. Vercel routes these automatically.
     if request.method == 'OPTIONS':
-        print("DEBUG: Handling OPTIONS (preflight) request.")
         return '', 204
 
     try:
         # Attempt to parse the incoming JSON request body.
         request_json = request.get_json(silent=True)
-        print(f"DEBUG: Received request JSON: {request_json}")
+        log.debug("Received request JSON", payload=request_json)
 
         if not request_json:
-            print("ERROR: Invalid JSON body.")
+            log.warning("Invalid JSON body")
             return jsonify({"error": "Invalid JSON body or empty request."}), 400
 
-        request_type = request_json.get('type')
+        admit(client_id_for(request.headers, request.remote_addr), admission_class(request_json))
 
-        if request_type == 'lesson_chat':
-            return handle_lesson_chat(request_json)
-        elif request_type == 'generate_course':
-            return handle_generate_course(request_json)
-        else:
-            # Fallback to existing insight generation if no specific type is provided
-            return generate_insight(request_json)
+        if request_json.get('type') == 'generate_course' and request_json.get('stream') and not request_json.get('background'):
+            return stream_generate_course(request_json)
 
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"ERROR: Connection error during Gemini API call: {conn_err}")
+        # Retries and double-clicks carrying the same key share (or replay) the first response.
+        idempotency_key = idempotency_key_for(request_json, request.headers)
+        if idempotency_key:
+            body, status = idempotent(idempotent_requests, idempotency_key, request_fingerprint(request_json),
+                                      lambda: handle_json_request(request_json))
+        else:
+            body, status = handle_json_request(request_json)
+        return jsonify(body), status
+
+    except AdmissionRejected as e:
+        log.warning("Request shed by admission control", reason=e.reason, priority_class=e.priority_class)
+        return jsonify({"error": str(e), "retryAfter": e.retry_after}), e.status, e.headers()
+    except gemini_client.UpstreamUnavailable as e:
+        log.warning("Gemini circuit breaker is open", error=str(e))
+        body, status = gemini_client.error_response(e)
+        return jsonify(body), status, e.headers()
+    except JobQueueFull as e:
+        log.warning("Course job queue is full", error=str(e))
+        return jsonify({"error": "Too many courses are being generated right now. Please try again shortly."}), 503, {'Retry-After': '30'}
+    except IdempotencyConflict as e:
+        log.warning("Idempotency key reused with a different body", error=str(e))
+        return jsonify({"error": str(e)}), 422
+
+    except gemini_client.UpstreamConnectionError as conn_err:
+        log.error("Connection error during Gemini API call", error=str(conn_err))
         return jsonify({"error": "Network error: Could not connect to the AI service. Please check your internet connection or try again later."}), 503
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"ERROR: Timeout error during Gemini API call: {timeout_err}")
+    except gemini_client.UpstreamTimeout as timeout_err:
+        log.error("Timeout error during Gemini API call", error=str(timeout_err))
         return jsonify({"error": "AI service request timed out. The request took too long to get a response."}), 504
-    except requests.exceptions.RequestException as e:
-        print(f"ERROR: General request error during Gemini API call: {e}")
-        # 'response' variable might not be defined in all error paths, so check its existence
-        if 'response' in locals() and response is not None and hasattr(response, 'text') and response.text:
-            print(f"ERROR: API detailed error response: {response.text}")
-        else:
-            print("ERROR: No detailed response text available from Gemini API.")
+    except gemini_client.UpstreamError as e:
+        log.error("General request error during Gemini API call", error=str(e), response=e.details)
         return jsonify({"error": f"An unknown error occurred during the AI service request: {e}"}), 500
     except json.JSONDecodeError as json_err:
-        raw_body = request.get_data(as_text=True)
-        print(f"ERROR: JSON decoding error on incoming request: {json_err}. Raw request body: '{raw_body}'")
+        log.error("JSON decoding error on incoming request", error=str(json_err), body=request.get_data(as_text=True))
         return jsonify({"error": f"Invalid JSON format in your request. Details: {json_err}"}), 400
     except ValueError as val_err:
-        print(f"ERROR: Data validation error: {val_err}")
+        log.error("Data validation error", error=str(val_err))
         return jsonify({"error": f"Invalid data received or generated: {val_err}"}), 400
     except Exception as e:
-        import traceback
-        print(f"CRITICAL ERROR: An unexpected server-side error occurred: {e}\n{traceback.format_exc()}")
+        log.exception("An unexpected server-side error occurred")
         return jsonify({"error": f"An unexpected internal server error occurred. Details: {str(e)}."}), 500
 
+def dispatch_insight_request(request_json):
+    """Picks the handler for a request body. Every handler is a generator that yields
+    gemini_client.UpstreamCall objects and returns a (body, status) tuple, so the same code runs
+    under the Flask endpoint (gemini_client.run_sync) and the ASGI app (gemini_client.run_async).
+    """
+    request_type = request_json.get('type')
+
+    if request_type == 'lesson_chat':
+        return handle_lesson_chat(request_json)
+    elif request_type == 'generate_course':
+        return handle_generate_course(request_json)
+    else:
+        # Fallback to existing insight generation if no specific type is provided
+        return generate_insight(request_json)
+
 def generate_insight(request_json):
     """Generates AI insight based on scramble, time, and user performance."""
+    prompt_started = time.perf_counter()
     scramble = request_json.get('scramble')
     time_ms = request_json.get('time_ms')
-    user_performance_history = request_json.get('userPerformanceHistory', [])
+    # A JSON list of solves or a base64 CTH1 history; both decode to the same columnar arrays.
+    user_performance_history = parse_history(request_json.get('userPerformanceHistory'))
     cube_type = request_json.get('cubeType', '3x3')
     user_level = request_json.get('userLevel', 'beginner')
 
     if not scramble or time_ms is None:
-        print("ERROR: Missing 'scramble' or 'time_ms' for insight generation.")
-        return jsonify({"error": "Missing 'scramble' or 'time_ms' in request for insight generation."}), 400
+        log.warning("Missing 'scramble' or 'time_ms' for insight generation")
+        return {"error": "Missing 'scramble' or 'time_ms' in request for insight generation."}, 400
+
+    # The history is reduced to a few fixed-size lines, so the prompt doesn't grow with it.
+    history_summary = describe_history_features(extract_history_features(user_performance_history, cube_type))
+
+    cache_key = insight_cache_key(scramble, time_ms, cube_type, user_level, history_summary=history_summary)
+    cached_insight = insight_cache.get(cache_key)
+    if cached_insight is not None:
+        log.debug("Serving insight from cache")
+        return cached_insight, 200
+
+    # 3x3 scrambles are analysed exactly (optimal cross per colour, connected pairs) instead of
+    # asking Gemini to guess, which also takes scrambleAnalysis out of the generated output.
+    scramble_stats = None
+    if canonical_cube_type(cube_type) == '3x3':
+        try:
+            scramble_stats = analyze_scramble(scramble)
+        except ValueError as e:
+            log.debug("Skipping exact scramble analysis", error=str(e))
+
+    if scramble_stats:
+        best = scramble_stats['bestCross']
+        scramble_facts = (f"Exact scramble facts: the best cross is {best['color']} in {best['moves']} moves "
+                          f"with {best['connectedPairs']} F2L pair(s) already connected; optimal cross lengths by colour: "
+                          + ", ".join(f"{colour} {moves}" for colour, moves in scramble_stats['cross'].items()) + ".")
+        prompt = f"""
+    You are an AI cubing coach named Jarvis. Provide a concise, encouraging, and actionable insight for a {user_level} level cuber solving a {cube_type} cube.
+    The scramble was: {scramble}
+    {scramble_facts}
+    The solve time was: {time_ms / 1000:.2f} seconds.
+    {history_summary}
 
-    prompt = f"""
+    Based on this, provide:
+    1.  **Personalized Tip:** A single, actionable tip for improvement based on the solve time, the scramble facts, the solver history (if given) and the user's level. Focus on one specific area (e.g., "focus on look-ahead," "practice F2L recognition," "improve finger tricks").
+    2.  **Targeted Practice Focus:** Suggest one specific type of practice or drill.
+
+    Format your response as a JSON object with the keys `personalizedTip` and `targetedPracticeFocus`.
+    """
+        properties = {
+            "personalizedTip": {"type": "STRING"},
+            "targetedPracticeFocus": {"type": "STRING"}
+        }
+    else:
+        prompt = f"""
     You are an AI cubing coach named Jarvis. Provide a concise, encouraging, and actionable insight for a {user_level} level cuber solving a {cube_type} cube.
     The scramble was: {scramble}
     The solve time was: {time_ms / 1000:.2f} seconds.
+    {history_summary}
     
     Based on this, provide:
     1.  **Scramble Analysis:** A very brief analysis of the provided scramble, highlighting any obvious features or challenges (e.g., "easy cross," "tricky F2L pair"). Keep this to one sentence.
-    2.  **Personalized Tip:** A single, actionable tip for improvement based on the solve time and the user's level. Focus on one specific area (e.g., "focus on look-ahead," "practice F2L recognition," "improve finger tricks").
+    2.  **Personalized Tip:** A single, actionable tip for improvement based on the solve time, the solver history (if given) and the user's level. Focus on one specific area (e.g., "focus on look-ahead," "practice F2L recognition," "improve finger tricks").
     3.  **Targeted Practice Focus:** Suggest one specific type of practice or drill.
 
     Format your response as a JSON object with the keys `scrambleAnalysis`, `personalizedTip`, and `targetedPracticeFocus`.
@@ -118,105 +273,71 @@ def generate_insight(request_json):
         "targetedPracticeFocus": "Practice cross solutions from various angles without looking."
     }}
     """
+        properties = {
+            "scrambleAnalysis": {"type": "STRING"},
+            "personalizedTip": {"type": "STRING"},
+            "targetedPracticeFocus": {"type": "STRING"}
+        }
 
-    headers = {
-        'Content-Type': 'application/json',
-        'x-goog-api-key': GEMINI_API_KEY
-    }
     payload = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {
             "responseMimeType": "application/json",
             "responseSchema": {
                 "type": "OBJECT",
-                "properties": {
-                    "scrambleAnalysis": {"type": "STRING"},
-                    "personalizedTip": {"type": "STRING"},
-                    "targetedPracticeFocus": {"type": "STRING"}
-                },
-                "required": ["scrambleAnalysis", "personalizedTip", "targetedPracticeFocus"]
+                "properties": properties,
+                "required": list(properties)
             }
         }
     }
+    metrics.record_span('prompt_build', time.perf_counter() - prompt_started)
     
     try:
-        gemini_response = requests.post(
-            f"{GEMINI_API_BASE_URL}/gemini-2.5-flash-lite:generateContent",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        gemini_response.raise_for_status()
-
-        response_data = gemini_response.json()
-        print(f"DEBUG: Gemini API response: {response_data}")
+        response_data = yield gemini_client.routed_call('insight', payload)
+        log.debug("Gemini API response", response=response_data)
 
         if response_data and response_data.get('candidates'):
             json_text = response_data['candidates'][0]['content']['parts'][0]['text']
-            insight = json.loads(json_text)
-            return jsonify(insight), 200
+            with metrics.span('json_extract'):
+                insight = json.loads(json_text)
+            with metrics.span('post_process'):
+                if scramble_stats:
+                    insight = {**insight, "scrambleAnalysis": describe_analysis(scramble_stats), "scrambleStats": scramble_stats}
+                insight_cache.set(cache_key, insight)
+            return insight, 200
         else:
-            print(f"ERROR: Gemini API response missing candidates or content: {response_data}")
-            return jsonify({"error": "AI service did not return a valid insight."}), 500
+            log.error("Gemini API response missing candidates or content", response=response_data)
+            return {"error": "AI service did not return a valid insight."}, 500
 
-    except requests.exceptions.RequestException as e:
+    except gemini_client.UpstreamError as e:
         error_message = f"Failed to get insight from AI service: {e}"
-        if hasattr(e, 'response') and e.response is not None:
-            error_message += f" | Details: {e.response.text}"
-        print(f"ERROR: Request to Gemini API failed: {error_message}")
-        return jsonify({"error": error_message}), 500
+        if e.details:
+            error_message += f" | Details: {e.details}"
+        log.error("Request to Gemini API failed", error=error_message)
+        return {"error": error_message}, 500
     except json.JSONDecodeError as e:
-        print(f"ERROR: Failed to parse Gemini API response as JSON: {e}")
-        if 'gemini_response' in locals() and gemini_response is not None:
-            print(f"Raw response text: {gemini_response.text}")
-        else:
-            print("No gemini_response object available to show raw response text.")
-        return jsonify({"error": f"AI service returned invalid JSON: {e}"}), 500
+        log.error("Failed to parse Gemini API response as JSON", error=str(e), response=locals().get('json_text'))
+        return {"error": f"AI service returned invalid JSON: {e}"}, 500
     except Exception as e:
-        print(f"CRITICAL ERROR: Unexpected error in generate_insight: {e}")
-        return jsonify({"error": f"An unexpected error occurred during insight generation: {e}"}), 500
+        log.exception("Unexpected error in generate_insight")
+        return {"error": f"An unexpected error occurred during insight generation: {e}"}, 500
 
 
 def handle_lesson_chat(request_json):
     """Handles conversational chat for lesson creation or in-lesson queries."""
+    prompt_started = time.perf_counter()
     chat_history = request_json.get('chatHistory', [])
 
-    latest_user_message = ""
-    if chat_history and isinstance(chat_history, list) and len(chat_history) > 0:
-        for msg in reversed(chat_history):
-            if isinstance(msg, dict) and msg.get('role') == 'user' and \
-               isinstance(msg.get('parts'), list) and len(msg['parts']) > 0:
-                if isinstance(msg['parts'][0], dict):
-                    latest_user_message = msg['parts'][0].get('text', '').lower()
-                elif isinstance(msg['parts'][0], str):
-                    latest_user_message = msg['parts'][0].lower()
-                break
-
-    if "generate verification course" in latest_user_message:
-        print("DEBUG: Verification course generation action triggered by magic string.")
-        return jsonify({'action': 'generate_course', 'message': 'Generating verification course...'}), 200
+    slots = extract_chat_slots(chat_history)
+    if 'verification_course' in slots.latest_commands:
+        log.debug("Verification course generation action triggered by magic string")
+        return {'action': 'generate_course', 'message': 'Generating verification course...'}, 200
 
     cube_type = request_json.get('cubeType', '3x3')
     skill_level = request_json.get('skillLevel', 'beginner')
 
-    latest_user_message = ""
-    if chat_history and isinstance(chat_history, list) and len(chat_history) > 0:
-        for msg in reversed(chat_history):
-            if isinstance(msg, dict) and msg.get('role') == 'user' and \
-               isinstance(msg.get('parts'), list) and len(msg['parts']) > 0:
-                if isinstance(msg['parts'][0], dict):
-                    latest_user_message = msg['parts'][0].get('text', '').lower()
-                elif isinstance(msg['parts'][0], str):
-                    latest_user_message = msg['parts'][0].lower()
-                break
-
-    formatted_chat = []
-    for msg in chat_history:
-        if isinstance(msg, dict) and msg.get('parts') and msg.get('role'):
-            role = msg.get('role') # Correctly get the role from the message
-            text = msg['parts'][0] if isinstance(msg['parts'][0], str) else msg['parts'][0].get('text', '')
-            formatted_chat.append({"role": role, "parts": [{"text": text}]})
-
+    # Only the most recent turns go verbatim; older ones are folded into a cached rolling summary.
+    client_instructions, formatted_chat = split_chat(chat_history)
     system_instruction = {
         "parts": [{
             "text": f"""You are Jarvis, an AI cubing coach, and your role is to be a proactive **course architect**.
@@ -229,125 +350,108 @@ def handle_lesson_chat(request_json):
         }]
     }
 
-    explicit_generate_commands = ["generate course", "create course", "make the course", "generate the course now"]
-    if any(cmd in latest_user_message for cmd in explicit_generate_commands):
-        return jsonify({
+    if 'generate_course' in slots.latest_commands:
+        return {
             'action': "generate_course",
             'message': "Understood. I am now generating your personalized cubing course. This may take a moment."
-        }), 200
+        }, 200
+
+    older_chat, recent_chat = window_chat(formatted_chat)
+    metrics.record_span('prompt_build', time.perf_counter() - prompt_started)
+    summary = yield from rolling_summary(older_chat)
+    if summary is not None:
+        formatted_chat = recent_chat
+    extra_instructions = [text for text in client_instructions if text]
+    if summary:
+        extra_instructions.append(f"Summary of the earlier part of this conversation:\n{summary}")
+    if extra_instructions:
+        system_instruction["parts"].append({"text": "\n\n".join(extra_instructions)})
 
-    headers = {
-        'Content-Type': 'application/json',
-        'x-goog-api-key': GEMINI_API_KEY
-    }
     payload = {
         "contents": formatted_chat,
         "systemInstruction": system_instruction
     }
 
     try:
-        gemini_response = requests.post(
-            f"{GEMINI_API_BASE_URL}/gemini-2.5-flash-lite:generateContent",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        gemini_response.raise_for_status()
-        response_data = gemini_response.json()
+        response_data = yield gemini_client.routed_call('lesson_chat', payload)
 
         if response_data.get('candidates') and response_data['candidates'][0].get('content'):
             ai_message = response_data['candidates'][0]['content']['parts'][0]['text']
 
             # First, check if the AI returned a JSON action object, even if it's embedded in other text.
             try:
-                json_match = re.search(r'\{.*\}', ai_message, re.DOTALL)
-                if json_match:
-                    possible_json = json_match.group(0)
-                    parsed_json = json.loads(possible_json)
-                    if isinstance(parsed_json, dict) and parsed_json.get('action') == 'generate_course':
-                        print("DEBUG: AI returned a JSON action to generate course.")
-                        return jsonify({
-                            'action': 'generate_course',
-                            'message': 'Great, I have enough information to build your course now. Please wait a moment...'
-                        }), 200
+                with metrics.span('json_extract'):
+                    parsed_json = extract_json_object(ai_message)
+                if parsed_json.get('action') == 'generate_course':
+                    log.debug("AI returned a JSON action to generate course")
+                    return {
+                        'action': 'generate_course',
+                        'message': 'Great, I have enough information to build your course now. Please wait a moment...'
+                    }, 200
             except json.JSONDecodeError:
                 # The extracted string was not valid JSON, treat it as a regular chat message.
                 pass
 
             # Fallback: check for natural language triggers if not a JSON action
-            generation_triggers = [
-                "i have enough information",
-                "build your course now",
-                "assemble it for you",
-                "creating your course"
-            ]
-            if any(trigger in ai_message.lower() for trigger in generation_triggers):
-                print("DEBUG: AI returned a natural language trigger to generate course.")
-                return jsonify({
+            with metrics.span('post_process'):
+                commands = reply_commands(ai_message)
+            if 'generate_course' in commands:
+                log.debug("AI returned a natural language trigger to generate course")
+                return {
                     'action': "generate_course",
                     'message': ai_message
-                }), 200
+                }, 200
 
             # If neither of the above, it's a regular chat message.
-            return jsonify({'message': ai_message}), 200
+            return {'message': ai_message}, 200
         else:
-            print(f"ERROR: Invalid response format from Gemini API: {response_data}")
-            return jsonify({"error": "Failed to get a valid response from the AI service"}), 500
+            log.error("Invalid response format from Gemini API", response=response_data)
+            return {"error": "Failed to get a valid response from the AI service"}, 500
 
-    except requests.exceptions.RequestException as e:
+    except gemini_client.UpstreamError as e:
         error_message = f"Failed to get response from AI service: {e}"
-        if hasattr(e, 'response') and e.response is not None:
-            error_message += f" | Details: {e.response.text}"
-        print(f"ERROR: Failed to get response from Gemini API: {error_message}")
-        return jsonify({"error": error_message}), 500
-
-
-def handle_generate_course(request_json):
-    """Generates a structured cubing course based on user preferences."""
-    print("DEBUG: === handle_generate_course received a request. ===")
-
-    chat_history = request_json.get('chatHistory', [])
-
-    # Check for verification course magic string
-    for msg in chat_history:
-        if msg.get('role') == 'user':
-            text = msg.get('parts', [{}])[0].get('text', '').lower()
-            if "generate verification course" in text:
-                print("DEBUG: Verification course generation triggered.")
-                verification_course = {
-                    "title": "Comprehensive Test Course",
-                    "description": "A course to test all features.",
-                    "cubeType": "3x3x3",
-                    "level": "beginner",
-                    "modules": [
+        if e.details:
+            error_message += f" | Details: {e.details}"
+        log.error("Failed to get response from Gemini API", error=error_message)
+        return {"error": error_message}, 500
+
+
+def find_verification_course(chat_history):
+    """Returns the fixed verification course if any user message asks for it, otherwise None."""
+    if extract_chat_slots(chat_history).verification_requested:
+        log.debug("Verification course generation triggered")
+        verification_course = {
+            "title": "Comprehensive Test Course",
+            "description": "A course to test all features.",
+            "cubeType": "3x3x3",
+            "level": "beginner",
+            "modules": [
+                {
+                    "module_title": "Module 1: Previews",
+                    "lessons": [
                         {
-                            "module_title": "Module 1: Previews",
-                            "lessons": [
+                            "lesson_title": "Lesson 1.1: Inline Player",
+                            "steps": [
                                 {
-                                    "lesson_title": "Lesson 1.1: Inline Player",
-                                    "steps": [
-                                        {
-                                            "content": "Here is an algorithm: [ALGORITHM: R U R' U']"
-                                        }
-                                    ]
+                                    "content": "Here is an algorithm: [ALGORITHM: R U R' U']"
                                 }
                             ]
-                        },
+                        }
+                    ]
+                },
+                {
+                    "module_title": "Module 2: Quizzes",
+                    "lessons": [
                         {
-                            "module_title": "Module 2: Quizzes",
-                            "lessons": [
+                            "lesson_title": "Lesson 2.1: Simple Quiz",
+                            "steps": [
                                 {
-                                    "lesson_title": "Lesson 2.1: Simple Quiz",
-                                    "steps": [
+                                    "content": "Time for a quiz!",
+                                    "quiz": [
                                         {
-                                            "content": "Time for a quiz!",
-                                            "quiz": [
-                                                {
-                                                    "question": "What color is opposite to White?",
-                                                    "options": ["Blue", "Green", "Yellow", "Red"],
-                                                    "answer": "Yellow"
-                                                }
-                                            ]
+                                            "question": "What color is opposite to White?",
+                                            "options": ["Blue", "Green", "Yellow", "Red"],
+                                            "answer": "Yellow"
                                         }
                                     ]
                                 }
@@ -355,8 +459,13 @@ def handle_generate_course(request_json):
                         }
                     ]
                 }
-                return jsonify(verification_course)
+            ]
+        }
+        return verification_course
+    return None
 
+def resolve_course_params(request_json, chat_history):
+    """Resolves (cube_type, skill_level, focus_area, learning_style) from the request and chat history."""
     # Parameters should ideally be passed explicitly from frontend after handle_lesson_chat confirms them
     # For robustness, try to extract them again if not explicitly provided in request_json
     cube_type = request_json.get('cubeType', '3x3')
@@ -366,43 +475,19 @@ def handle_generate_course(request_json):
 
     # Re-extract from chat history as a fallback/confirmation for handle_generate_course
     # This ensures handle_generate_course has the latest confirmed parameters
-    extracted_skill_level = None
-    extracted_focus_area = None
-    extracted_learning_style = None
-
-    for msg in chat_history:
-        if msg.get('role') == 'user':
-            text = msg.get('parts', [{}])[0].get('text', '').lower()
-            if re.search(r'\b(beginner|begginer|biginner)\b', text):
-                extracted_skill_level = "beginner"
-            elif re.search(r'\b(intermediate|intermidiate)\b', text):
-                extracted_skill_level = "intermediate"
-            elif re.search(r'\b(advanced|advance)\b', text):
-                extracted_skill_level = "advanced"
-            
-            if re.search(r'\bf2l\b', text):
-                extracted_focus_area = "F2L"
-            elif re.search(r'\boll\b', text):
-                extracted_focus_area = "OLL"
-            elif re.search(r'\bpll\b', text):
-                extracted_focus_area = "PLL"
-            elif re.search(r'\bcross\b', text):
-                extracted_focus_area = "Cross"
-            
-            if re.search(r'\b(theoretical|concept(ual)?)\b', text):
-                extracted_learning_style = "theoretical"
-            elif re.search(r'\b(hands[- ]?on|practical|practice|practce)\b', text):
-                extracted_learning_style = "hands-on practice"
-            elif re.search(r'\b(interactive )?quiz(zes)?\b', text):
-                extracted_learning_style = "interactive quiz"
+    slots = extract_chat_slots(chat_history)
 
     # Use extracted parameters if available, otherwise fall back to defaults or request_json
-    skill_level = skill_level or extracted_skill_level or 'beginner'
-    learning_style = learning_style or extracted_learning_style or 'conceptual'
-    focus_area = focus_area or extracted_focus_area or 'general'
+    skill_level = skill_level or slots.skill_level or 'beginner'
+    learning_style = learning_style or slots.learning_style or 'conceptual'
+    focus_area = focus_area or slots.focus_area or 'general'
 
-    print(f"DEBUG: handle_generate_course - Final parameters for generation: skill_level={skill_level}, focus_area={focus_area}, learning_style={learning_style}, cube_type={cube_type}")
+    log.debug("Final course generation parameters", skill_level=skill_level, focus_area=focus_area,
+              learning_style=learning_style, cube_type=cube_type)
+    return cube_type, skill_level, focus_area, learning_style
 
+def build_course_payload(cube_type, skill_level, focus_area, learning_style):
+    """Builds the Gemini payload that generates a course for one parameter tuple."""
     user_prompt_for_course = f"Generate a course for a {skill_level} level cuber focusing on {focus_area} for a {cube_type} cube with a {learning_style} learning style."
 
 
@@ -470,134 +555,250 @@ def handle_generate_course(request_json):
     }}
     """
 
-    headers = {
-        'Content-Type': 'application/json',
-        'x-goog-api-key': GEMINI_API_KEY
-    }
     payload = {
         "systemInstruction": {"parts": [{"text": system_instruction}]}, # System instruction moved here
         "contents": [{"role": "user", "parts": [{"text": prompt_text}]}], # Only the prompt_text as a single user message
         "generationConfig": {
             "responseMimeType": "application/json", # Request application/json output
-            "responseSchema": { # Define the full schema here
-                "type": "OBJECT",
-                "properties": {
-                    "course_id": {"type": "STRING"},
-                    "title": {"type": "STRING"},
-                    "description": {"type": "STRING"},
-                    "cubeType": {"type": "STRING"},
-                    "level": {"type": "STRING"},
-                    "modules": {
-                        "type": "ARRAY",
-                        "items": {
-                            "type": "OBJECT",
-                            "properties": {
-                                "module_id": {"type": "STRING"},
-                                "module_title": {"type": "STRING"},
-                                "lessons": {
-                                    "type": "ARRAY",
-                                    "items": {
-                                        "type": "OBJECT",
-                                        "properties": {
-                                            "lesson_id": {"type": "STRING"},
-                                            "lesson_title": {"type": "STRING"},
-                                            "lesson_type": {"type": "STRING"},
-                                            "content": {"type": "STRING"},
-                                            "scrambles": {"type": "ARRAY", "items": {"type": "STRING"}, "nullable": True},
-                                            "algorithms": {"type": "ARRAY", "items": {"type": "STRING"}, "nullable": True},
-                                            "quiz": {
-                                                "type": "ARRAY",
-                                                "items": {
-                                                    "type": "OBJECT",
-                                                    "properties": {
-                                                        "question": {"type": "STRING"},
-                                                        "options": {"type": "ARRAY", "items": {"type": "STRING"}},
-                                                        "answer": {"oneOf": [{"type": "STRING"}, {"type": "ARRAY", "items": {"type": "STRING"}}]}
-                                                    },
-                                                    "required": ["question", "options", "answer"]
-                                                },
-                                                "nullable": True
-                                            }
-                                        },
-                                        "required": ["lesson_id", "lesson_title", "lesson_type", "content"]
-                                    }
-                                }
-                            },
-                            "required": ["module_id", "module_title", "lessons"]
-                        }
-                    }
-                },
-                "required": ["course_id", "title", "description", "cubeType", "level", "modules"]
-            }
+            "responseSchema": COURSE_RESPONSE_SCHEMA # Shared with the local validator in _course_schema
         }
     }
+    return payload
+
+def backfill_lesson_ids(lesson):
+    """Adds any missing lesson_id/step_id and a default step. Safe to call more than once."""
+    lesson.setdefault('lesson_id', str(uuid.uuid4()))
+    # Defensively add a steps array if it's missing.
+    if not isinstance(lesson.get('steps'), list) or not lesson['steps']:
+        lesson['steps'] = [{
+            'step_id': str(uuid.uuid4()),
+            'title': lesson.get('lesson_title', 'Introduction'),
+            'content': lesson.get('content', 'No content available for this step.')
+        }]
+    else:
+        for step in lesson['steps']:
+            if isinstance(step, dict):
+                step.setdefault('step_id', str(uuid.uuid4()))
+    return lesson
+
+def backfill_module_ids(module):
+    """Adds any missing module_id, then backfills each lesson. Skips malformed parts (see _course_schema)."""
+    module.setdefault('module_id', str(uuid.uuid4()))
+    for lesson in module.get('lessons') if isinstance(module.get('lessons'), list) else []:
+        if isinstance(lesson, dict):
+            backfill_lesson_ids(lesson)
+    return module
+
+def backfill_course_ids(course):
+    """Adds any missing course_id/module_id/lesson_id/step_id to a generated course."""
+    course.setdefault('course_id', str(uuid.uuid4()))
+    for module in course.get('modules') if isinstance(course.get('modules'), list) else []:
+        if isinstance(module, dict):
+            backfill_module_ids(module)
+    return course
+
+def handle_generate_course(request_json):
+    """Generates a structured cubing course based on user preferences."""
+    prompt_started = time.perf_counter()
+
+    chat_history = request_json.get('chatHistory', [])
+
+    verification_course = find_verification_course(chat_history)
+    if verification_course:
+        return verification_course, 200
+
+    course_params = resolve_course_params(request_json, chat_history)
+    store_key = course_store_key(*course_params)
+    # Serve a stored variant for the same parameters unless the client asks for a fresh course.
+    if not request_json.get('fresh'):
+        stored_course = course_store.get(store_key)
+        if stored_course is not None:
+            log.debug("Serving course from the course store", store_key=store_key)
+            return backfill_course_ids(stored_course), 200
+
+    payload = build_course_payload(*course_params)
+    metrics.record_span('prompt_build', time.perf_counter() - prompt_started)
 
     try:
-        gemini_response = requests.post(
-            f"{GEMINI_API_BASE_URL}/gemini-2.5-flash-lite:generateContent",
-            headers=headers,
-            json=payload,
-            timeout=120
-        )
-        gemini_response.raise_for_status()
-        response_data = gemini_response.json()
-        print(f"DEBUG: Gemini API raw response for course generation: {response_data}")
+        response_data = yield gemini_client.routed_call('generate_course', payload)
+        log.debug("Gemini API raw response for course generation", response=response_data)
 
         if response_data and response_data.get('candidates'):
             # The response may have multiple parts, concatenate them
             full_response_text = "".join(part['text'] for part in response_data['candidates'][0]['content']['parts'])
 
-            # Use regex to find the JSON block
-            json_match = re.search(r'\{.*\}', full_response_text, re.DOTALL)
-            if not json_match:
-                print(f"ERROR: No JSON object found in the AI response: {full_response_text}")
-                return jsonify({"error": "AI service did not return a valid course structure in JSON format."}), 500
-
-            ai_response_text = json_match.group(0)
-            generated_course = json.loads(ai_response_text)
-
-            generated_course.setdefault('course_id', str(uuid.uuid4()))
-            for module in generated_course.get('modules', []):
-                module.setdefault('module_id', str(uuid.uuid4()))
-                for lesson in module.get('lessons', []):
-                    lesson.setdefault('lesson_id', str(uuid.uuid4()))
-                    # Defensively add a steps array if it's missing.
-                    if 'steps' not in lesson or not lesson['steps']:
-                        lesson['steps'] = [{
-                            'step_id': str(uuid.uuid4()),
-                            'title': lesson.get('lesson_title', 'Introduction'),
-                            'content': lesson.get('content', 'No content available for this step.')
-                        }]
-                    else:
-                        for step in lesson.get('steps', []):
-                            step.setdefault('step_id', str(uuid.uuid4()))
-
-            return jsonify(generated_course), 200
+            # The course object may be wrapped in a code fence or followed by prose.
+            with metrics.span('json_extract'):
+                try:
+                    generated_course = extract_json_object(full_response_text)
+                except JsonNotFound:
+                    log.error("No JSON object found in the AI response", response=full_response_text)
+                    return {"error": "AI service did not return a valid course structure in JSON format."}, 500
+                except json.JSONDecodeError as e:
+                    # Usually a response cut off mid-course: keep every module and lesson that did finish.
+                    generated_course = salvage_json_object(full_response_text)
+                    if generated_course is None:
+                        raise
+                    log.warning("Course JSON was incomplete; salvaged the complete part", error=json_error_context(e))
+                backfill_course_ids(generated_course)
+
+            # Fix or drop only the fragments that break the schema instead of failing the request.
+            generated_course, _ = yield from repair_course(generated_course, *course_params)
+            if generated_course is None:
+                return {"error": "AI service did not return a valid course structure."}, 500
+            with metrics.span('post_process'):
+                backfill_course_ids(generated_course)
+                course_store.put(store_key, generated_course)
+            return generated_course, 200
         else:
-            print(f"ERROR: Gemini API response missing candidates or content: {response_data}")
-            return jsonify({"error": "AI service did not return a valid course structure."}), 500
+            log.error("Gemini API response missing candidates or content", response=response_data)
+            return {"error": "AI service did not return a valid course structure."}, 500
 
-    except requests.exceptions.RequestException as e:
+    except gemini_client.UpstreamError as e:
         error_message = f"Failed to generate course from AI service: {e}"
-        if hasattr(e, 'response') and e.response is not None:
-            error_message += f" | Details: {e.response.text}"
-        print(f"ERROR: Request to Gemini API for course generation failed: {error_message}")
-        return jsonify({"error": error_message}), 500
+        if e.details:
+            error_message += f" | Details: {e.details}"
+        log.error("Request to Gemini API for course generation failed", error=error_message)
+        return {"error": error_message}, 500
     except json.JSONDecodeError as e:
-        print(f"ERROR: Failed to parse Gemini API's text response as JSON: {e}")
-        if 'ai_response_text' in locals():
-            print(f"Raw AI text response that failed parsing: {ai_response_text}") 
-        else:
-            print("No ai_response_text variable available to show raw response text.")
-        return jsonify({"error": "AI service returned malformed JSON for course. Please try again or rephrase."}), 500
+        log.error("Failed to parse Gemini API's text response as JSON", error=json_error_context(e))
+        return {"error": "AI service returned malformed JSON for course. Please try again or rephrase."}, 500
     except Exception as e:
-        print(f"CRITICAL ERROR: Unexpected error in handle_generate_course: {e}")
-        return jsonify({"error": f"An unexpected error occurred during course generation: {e}"}), 500
+        log.exception("Unexpected error in handle_generate_course")
+        return {"error": f"An unexpected error occurred during course generation: {e}"}, 500
+
+def sse_event(event, data):
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_generate_course(request_json):
+    """Server-sent-events variant of handle_generate_course, used when the body has "stream": true.
+
+    Emits a `lesson` event as each lesson object completes, a `module` event as each module
+    completes, and finally a `course` event with the same course object the non-streaming path
+    returns (or an `error` event). IDs are backfilled once, so later events reuse earlier IDs.
+    """
+    chat_history = request_json.get('chatHistory', [])
+
+    verification_course = find_verification_course(chat_history)
+    if verification_course:
+        return Response(sse_event('course', verification_course), mimetype='text/event-stream')
+
+    course_params = resolve_course_params(request_json, chat_history)
+    store_key = course_store_key(*course_params)
+    if not request_json.get('fresh'):
+        stored_course = course_store.get(store_key)
+        if stored_course is not None:
+            log.debug("Serving streamed course from the course store", store_key=store_key)
+            return Response(sse_event('course', backfill_course_ids(stored_course)), mimetype='text/event-stream')
+
+    payload = build_course_payload(*course_params)
+    upstream_call = gemini_client.routed_call('generate_course', payload)
+
+    try:
+        upstream = gemini_client.open_stream(upstream_call)
+    except gemini_client.UpstreamUnavailable:
+        raise  # Answered by gemini_insight_handler with 503 and Retry-After.
+    except gemini_client.UpstreamError as e:
+        error_message = f"Failed to generate course from AI service: {e}"
+        if e.details:
+            error_message += f" | Details: {e.details}"
+        log.error("Streaming request to Gemini API for course generation failed", error=error_message)
+        return jsonify({"error": error_message}), 500
+
+    def events():
+        parser = CourseStreamParser()
+        lessons = {}  # (module_index, lesson_index) -> backfilled lesson already sent
+        modules = {}  # module_index -> backfilled module already sent
+        # The response outlives the Flask request, so the stream keeps its own trace.
+        trace = metrics.begin_request('generate_course_stream')
+        status = 200
+        try:
+            for text in gemini_client.iter_stream_text(upstream, upstream_call):
+                for kind, index, raw in parser.feed(text):
+                    if kind == 'lesson':
+                        lesson = backfill_lesson_ids(json.loads(raw))
+                        lessons[index] = lesson
+                        yield sse_event('lesson', {'moduleIndex': index[0], 'lessonIndex': index[1], 'lesson': lesson})
+                    else:
+                        module = json.loads(raw)
+                        if isinstance(module.get('lessons'), list):
+                            module['lessons'] = [lessons.get((index, j), lesson) for j, lesson in enumerate(module['lessons'])]
+                        backfill_module_ids(module)
+                        modules[index] = module
+                        yield sse_event('module', {'moduleIndex': index, 'module': module})
+
+            with metrics.span('json_extract'):
+                try:
+                    generated_course = parser.decode()
+                except JsonNotFound:
+                    generated_course = parser.decode_truncated()
+            if generated_course is None:
+                log.error("Course stream ended before the JSON object closed", response=parser.text)
+                status = 500
+                yield sse_event('error', {"error": "AI service did not return a valid course structure in JSON format."})
+                return
+            if parser.end is None:
+                log.warning("Course stream ended before the JSON object closed; salvaged the complete part")
+            if isinstance(generated_course.get('modules'), list):
+                generated_course['modules'] = [modules.get(i, module) for i, module in enumerate(generated_course['modules'])]
+            backfill_course_ids(generated_course)
+            generated_course, _ = gemini_client.run_sync(repair_course(generated_course, *course_params))
+            if generated_course is None:
+                status = 500
+                yield sse_event('error', {"error": "AI service did not return a valid course structure."})
+                return
+            with metrics.span('post_process'):
+                backfill_course_ids(generated_course)
+                course_store.put(store_key, generated_course)
+            yield sse_event('course', generated_course)
+
+        except (AdmissionRejected, gemini_client.UpstreamUnavailable) as e:
+            log.warning("Course repair shed", error=str(e))
+            status = e.status if isinstance(e, AdmissionRejected) else 503
+            yield sse_event('error', {"error": str(e), "retryAfter": e.retry_after})
+        except gemini_client.UpstreamError as e:
+            log.error("Course stream from Gemini API failed", error=str(e))
+            status = 502
+            yield sse_event('error', {"error": f"Failed to generate course from AI service: {e}"})
+        except json.JSONDecodeError as e:
+            log.error("Failed to parse streamed course JSON", error=json_error_context(e))
+            status = 500
+            yield sse_event('error', {"error": "AI service returned malformed JSON for course. Please try again or rephrase."})
+        finally:
+            gemini_client.close_stream(upstream)
+            metrics.end_request(trace, status)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 import argparse
 
+def warm_course_store(variants=1):
+    """Generates courses for COMMON_COURSE_PARAMS until each has `variants` stored variants."""
+    for course_params in COMMON_COURSE_PARAMS:
+        store_key = course_store_key(*course_params)
+        while course_store.variant_count(store_key) < variants:
+            cube_type, skill_level, focus_area, learning_style = course_params
+            request_json = {'cubeType': cube_type, 'skillLevel': skill_level, 'focusArea': focus_area,
+                            'learningStyle': learning_style, 'fresh': True}
+            body, status = gemini_client.run_sync(handle_generate_course(request_json))
+            if status != 200:
+                log.error("Warm-up course generation failed", store_key=store_key, error=body.get('error'))
+                break
+            log.info("Stored warm-up course variant", store_key=store_key, variants=course_store.variant_count(store_key))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--warm-course-store', action='store_true',
+                        help="Pre-generate courses for the common parameter combinations, then exit")
+    parser.add_argument('--variants', type=int, default=1, help="Variants per combination for --warm-course-store")
     args = parser.parse_args()
-    app.run(host='0.0.0.0', port=args.port, debug=True)
+    if args.warm_course_store:
+        warm_course_store(args.variants)
+    else:
+        app.run(host='0.0.0.0', port=args.port, debug=True)
@@ -3,15 +3,25 @@
 # and returning a simplified, canonical action.
 
 import os
-import requests
+import sys
 import json
-import re
 from flask import Flask, request, jsonify
 from flask_cors import CORS # Required for handling CORS in Flask functions
 
+# Shared helper modules (underscore-prefixed so Vercel doesn't deploy them) live next to this file.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _gemini_client as gemini_client
+import _metrics as metrics
+from _log import get_logger
+from _nlu_classifier import classify_transcript, is_confident
+from _json_extract import extract_json_object, json_error_context, JsonNotFound
+from _admission import AdmissionRejected, admit, client_id_for
+
 # Initialize the Flask app for Vercel.
 app = Flask(__name__)
 CORS(app) # Enable CORS for all origins for development. Restrict for production if necessary.
+log = get_logger('gemini-nlu')
+metrics.instrument_flask(app, '/api/gemini-nlu', lambda request_json: 'nlu')
 
 @app.route('/api/gemini-nlu', methods=['POST', 'OPTIONS'])
 def gemini_nlu_handler():
@@ -19,154 +29,158 @@ def gemini_nlu_handler():
     It expects a 'transcript' in the JSON body and returns a 'canonicalCommand' and optionally 'commandValue' or 'query'.
     Handles both preflight (OPTIONS) and actual (POST) requests.
     """
-    print("DEBUG: gemini_nlu_handler received a request.")
+    log.debug("gemini_nlu_handler received a request", method=request.method)
 
     # Handle CORS preflight (OPTIONS) request
     if request.method == 'OPTIONS':
-        print("DEBUG: Handling OPTIONS (preflight) request for NLU.")
         return '', 204
 
     try:
         request_json = request.get_json(silent=True)
-        print(f"DEBUG: Received NLU request JSON: {request_json}")
-
-        if not request_json or 'transcript' not in request_json:
-            print("ERROR: Invalid JSON body. Missing 'transcript'.")
-            return jsonify({"error": "Invalid request: 'transcript' field is required."}), 400
-
-        user_transcript = request_json.get('transcript', '')
-
-        gemini_api_key = os.environ.get("GEMINI_API_KEY")
-        if not gemini_api_key:
-            print("ERROR: GEMINI_API_KEY environment variable not set.")
-            return jsonify({"error": "Server configuration error: GEMINI_API_KEY is not set."}), 500
-
-        headers = {
-            'Content-Type': 'application/json',
-            'x-goog-api-key': gemini_api_key
-        }
-        gemini_url = f"https://generativelanguage.googleapis.com/v1/models/gemini-pro:generateContent"
-
-        system_prompt = """
-        You are Jarvis, an AI assistant for a Rubik's Cube timer application.
-        Your task is to interpret a user's voice command transcript and classify it.
-
-        Determine if the transcript is a specific command for the application or a general question.
-
-        If it's a **specific command**, identify the `canonicalCommand` and any `commandValue`.
-        Possible commands and their values:
-        - "set cube type [2x2, 3x3, 4x4, pyraminx]": canonicalCommand: 'set_cube_type', commandValue: '2x2' or '3x3' etc.
-        - "analyze my solve" / "get insight": canonicalCommand: 'analyze_solve'
-        - "toggle sound effects": canonicalCommand: 'toggle_sound_effects'
-        - "toggle inspection": canonicalCommand: 'toggle_inspection'
-        - "set theme [dark, light, vibrant]": canonicalCommand: 'set_theme', commandValue: 'dark' or 'light' etc.
-        - "show history": canonicalCommand: 'show_history'
-        - "show stats": canonicalCommand: 'show_stats'
-        - "generate new scramble": canonicalCommand: 'generate_scramble'
-        - "start timer": canonicalCommand: 'start_timer'
-        - "stop timer": canonicalCommand: 'stop_timer'
-        - "reset timer": canonicalCommand: 'reset_timer'
-
-        If it's a **general question** about cubing (e.g., algorithms, history, concepts) or about the features and usage of *this* Rubik's Cube timer web application, set `canonicalCommand` to 'general_query' and extract the `query` itself.
-
-        Respond with a JSON object. Ensure the `confidence` score is between 0 and 1.
-
-        Example Command Response:
-        {
-            "canonicalCommand": "set_cube_type",
-            "commandValue": "3x3",
-            "confidence": 1.0
-        }
-
-        Example General Question Response:
-        {
-            "canonicalCommand": "general_query",
-            "query": "What is F2L?",
-            "confidence": 0.9
-        }
-
-        Example Question about the app:
-        {
-            "canonicalCommand": "general_query",
-            "query": "How do I change the theme?",
-            "confidence": 0.95
-        }
-
-        Example Unknown Command Response:
-        {
-            "canonicalCommand": "unknown",
-            "commandValue": null,
-            "confidence": 0.5
-        }
-        """
-
-        payload = {
-            "contents": [{"role": "user", "parts": [{"text": user_transcript}]}],
-            "systemInstruction": {
-                "parts": [{"text": system_prompt}]
-            },
-            "generationConfig": {
-                "responseMimeType": "application/json"
-            }
-        }
-
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": gemini_api_key
-        }
-
-        gemini_response = requests.post(gemini_url, headers=headers, data=json.dumps(payload))
-        gemini_response.raise_for_status() # Raise an exception for HTTP errors
-        gemini_result = gemini_response.json()
-        print(f"DEBUG: Gemini raw response: {gemini_result}")
-
-        if gemini_result and gemini_result.get('candidates'):
-            candidate = gemini_result['candidates'][0]
-            if candidate and candidate.get('content') and candidate['content'].get('parts'):
-                gemini_content_str = candidate['content']['parts'][0].get('text')
-                if gemini_content_str:
-                    # Use regex to find the JSON block within the markdown code block
-                    json_match = re.search(r'\{.*\}', gemini_content_str, re.DOTALL)
-                    if not json_match:
-                        print(f"ERROR: No JSON object found in the AI response: {gemini_content_str}")
-                        return jsonify({"error": "AI service did not return a valid JSON object."}), 500
-
-                    json_str_to_parse = json_match.group(0)
-
-                    try:
-                        parsed_content = json.loads(json_str_to_parse)
-                        return jsonify(parsed_content), 200
-                    except json.JSONDecodeError as e:
-                        print(f"ERROR: Failed to decode extracted JSON string: {e}. Extracted string: '{json_str_to_parse}'")
-                        return jsonify({"error": f"AI service returned malformed JSON content after extraction: {e}"}), 500
-                else:
-                    print("ERROR: Gemini content part 'text' is missing or empty.")
-                    return jsonify({"error": "AI service response content is empty."}), 500
-            else:
-                print("ERROR: Gemini candidate 'content' or 'parts' is missing or malformed.")
-                return jsonify({"error": "AI service response candidate content is malformed."}), 500
-        else:
-            print("ERROR: Gemini response missing 'candidates' or malformed.")
-            return jsonify({"error": "AI service response is malformed or missing candidates."}), 500
-
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"ERROR: Connection error during Gemini API call: {conn_err}")
+        log.debug("Received NLU request JSON", payload=request_json)
+        admit(client_id_for(request.headers, request.remote_addr), 'nlu')
+
+        body, status = gemini_client.run_sync(interpret_transcript(request_json))
+        return jsonify(body), status
+
+    except AdmissionRejected as e:
+        log.warning("Request shed by admission control", reason=e.reason)
+        return jsonify({"error": str(e), "retryAfter": e.retry_after}), e.status, e.headers()
+    except gemini_client.UpstreamUnavailable as e:
+        log.warning("Gemini circuit breaker is open", error=str(e))
+        body, status = gemini_client.error_response(e)
+        return jsonify(body), status, e.headers()
+    except gemini_client.UpstreamConnectionError as conn_err:
+        log.error("Connection error during Gemini API call", error=str(conn_err))
         return jsonify({"error": "Network error: Could not connect to the AI service. Please check your internet connection or try again later."}), 503
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"ERROR: Timeout error during Gemini API call: {timeout_err}")
+    except gemini_client.UpstreamTimeout as timeout_err:
+        log.error("Timeout error during Gemini API call", error=str(timeout_err))
         return jsonify({"error": "AI service request timed out. The request took too long to get a response."}), 504
-    except requests.exceptions.RequestException as req_err:
-        print(f"ERROR: General request error during Gemini API call: {req_err}")
+    except gemini_client.UpstreamError as req_err:
+        log.error("General request error during Gemini API call", error=str(req_err), response=req_err.details)
         return jsonify({"error": f"An unknown error occurred during the AI service request: {req_err}"}), 500
     except json.JSONDecodeError as json_err:
-        raw_body = request.get_data(as_text=True)
-        print(f"ERROR: JSON decoding error on incoming request: {json_err}. Raw request body: '{raw_body}'")
+        log.error("JSON decoding error on incoming request", error=str(json_err), body=request.get_data(as_text=True))
         return jsonify({"error": f"Invalid JSON format in your request. Details: {json_err}"}), 400
     except Exception as e:
-        import traceback
-        print(f"CRITICAL ERROR: An unexpected server-side error occurred: {e}\n{traceback.format_exc()}")
+        log.exception("An unexpected server-side error occurred")
         return jsonify({"error": f"An unexpected internal server error occurred. Details: {str(e)}."}), 500
 
+def interpret_transcript(request_json):
+    """Classifies a voice transcript into a canonical command or general query.
+    A generator handler: yields gemini_client.UpstreamCall and returns a (body, status) tuple.
+    """
+    if not request_json or 'transcript' not in request_json:
+        log.warning("Invalid JSON body, missing 'transcript'")
+        return {"error": "Invalid request: 'transcript' field is required."}, 400
+
+    user_transcript = request_json.get('transcript', '')
+
+    # Canonical commands ("start timer", "set cube type 3x3", ...) are answered locally in
+    # microseconds; only questions and low-confidence transcripts go to Gemini.
+    with metrics.span('local_classify'):
+        local_result = classify_transcript(user_transcript)
+    if is_confident(local_result):
+        log.debug("NLU fast path matched", payload=local_result)
+        return local_result, 200
+
+    gemini_api_key = os.environ.get("GEMINI_API_KEY")
+    if not gemini_api_key and not gemini_client.STANDIN_MODE:
+        log.error("GEMINI_API_KEY environment variable not set")
+        return {"error": "Server configuration error: GEMINI_API_KEY is not set."}, 500
+
+    system_prompt = """
+    You are Jarvis, an AI assistant for a Rubik's Cube timer application.
+    Your task is to interpret a user's voice command transcript and classify it.
+
+    Determine if the transcript is a specific command for the application or a general question.
+
+    If it's a **specific command**, identify the `canonicalCommand` and any `commandValue`.
+    Possible commands and their values:
+    - "set cube type [2x2, 3x3, 4x4, pyraminx]": canonicalCommand: 'set_cube_type', commandValue: '2x2' or '3x3' etc.
+    - "analyze my solve" / "get insight": canonicalCommand: 'analyze_solve'
+    - "toggle sound effects": canonicalCommand: 'toggle_sound_effects'
+    - "toggle inspection": canonicalCommand: 'toggle_inspection'
+    - "set theme [dark, light, vibrant]": canonicalCommand: 'set_theme', commandValue: 'dark' or 'light' etc.
+    - "show history": canonicalCommand: 'show_history'
+    - "show stats": canonicalCommand: 'show_stats'
+    - "generate new scramble": canonicalCommand: 'generate_scramble'
+    - "start timer": canonicalCommand: 'start_timer'
+    - "stop timer": canonicalCommand: 'stop_timer'
+    - "reset timer": canonicalCommand: 'reset_timer'
+
+    If it's a **general question** about cubing (e.g., algorithms, history, concepts) or about the features and usage of *this* Rubik's Cube timer web application, set `canonicalCommand` to 'general_query' and extract the `query` itself.
+
+    Respond with a JSON object. Ensure the `confidence` score is between 0 and 1.
+
+    Example Command Response:
+    {
+        "canonicalCommand": "set_cube_type",
+        "commandValue": "3x3",
+        "confidence": 1.0
+    }
+
+    Example General Question Response:
+    {
+        "canonicalCommand": "general_query",
+        "query": "What is F2L?",
+        "confidence": 0.9
+    }
+
+    Example Question about the app:
+    {
+        "canonicalCommand": "general_query",
+        "query": "How do I change the theme?",
+        "confidence": 0.95
+    }
+
+    Example Unknown Command Response:
+    {
+        "canonicalCommand": "unknown",
+        "commandValue": null,
+        "confidence": 0.5
+    }
+    """
+
+    payload = {
+        "contents": [{"role": "user", "parts": [{"text": user_transcript}]}],
+        "systemInstruction": {
+            "parts": [{"text": system_prompt}]
+        },
+        "generationConfig": {
+            "responseMimeType": "application/json"
+        }
+    }
+
+    gemini_result = yield gemini_client.routed_call('nlu', payload)
+    log.debug("Gemini raw response", response=gemini_result)
+
+    if gemini_result and gemini_result.get('candidates'):
+        candidate = gemini_result['candidates'][0]
+        if candidate and candidate.get('content') and candidate['content'].get('parts'):
+            gemini_content_str = candidate['content']['parts'][0].get('text')
+            if gemini_content_str:
+                # The JSON object may be wrapped in a markdown code block
+                try:
+                    with metrics.span('json_extract'):
+                        parsed_content = extract_json_object(gemini_content_str)
+                    return parsed_content, 200
+                except JsonNotFound:
+                    log.error("No JSON object found in the AI response", response=gemini_content_str)
+                    return {"error": "AI service did not return a valid JSON object."}, 500
+                except json.JSONDecodeError as e:
+                    log.error("Failed to decode extracted JSON string", error=json_error_context(e))
+                    return {"error": f"AI service returned malformed JSON content after extraction: {e}"}, 500
+            else:
+                log.error("Gemini content part 'text' is missing or empty")
+                return {"error": "AI service response content is empty."}, 500
+        else:
+            log.error("Gemini candidate 'content' or 'parts' is missing or malformed", response=gemini_result)
+            return {"error": "AI service response candidate content is malformed."}, 500
+    else:
+        log.error("Gemini response missing 'candidates' or malformed", response=gemini_result)
+        return {"error": "AI service response is malformed or missing candidates."}, 500
+
 # To run this with Vercel, ensure you have a 'requirements.txt' in the same 'api' directory:
 # Flask==3.*
 # requests==2.*
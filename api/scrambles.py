@@ -0,0 +1,66 @@
+# api/scrambles.py inside your Vercel project's 'api' directory
+# This function serves batches of scrambles from a warm, server-side pool so clients can fetch
+# several scrambles (or whole practice sets) in one call.
+
+import os
+import sys
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+
+# Shared helper modules (underscore-prefixed so Vercel doesn't deploy them) live next to this file.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _scramble_engine import PUZZLES, generate_scrambles, scramble_pool
+from _log import get_logger
+
+# Initialize the Flask app for Vercel.
+app = Flask(__name__)
+CORS(app) # Enable CORS for all origins for development. Restrict for production if necessary.
+log = get_logger('scrambles')
+
+SCRAMBLES_MAX_COUNT = int(os.environ.get("SCRAMBLES_MAX_COUNT", "1000"))
+
+# Fill every pool once per cold start so the first requests are served straight from memory.
+scramble_pool.warm()
+
+@app.route('/api/scrambles', methods=['GET', 'POST', 'OPTIONS'])
+def scrambles_handler():
+    """HTTP endpoint that returns `count` scrambles for `cubeType`.
+    Parameters come from the query string (GET) or JSON body (POST). An optional integer `seed`
+    returns a reproducible set instead of drawing from the pool.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    params = request.args.to_dict() if request.method == 'GET' else (request.get_json(silent=True) or {})
+
+    cube_type = params.get('cubeType', '3x3')
+    if cube_type not in PUZZLES:
+        log.warning("Unsupported cube type for scrambles", cube_type=cube_type)
+        return jsonify({"error": f"Unsupported cubeType '{cube_type}'. Expected one of: {', '.join(PUZZLES)}."}), 400
+
+    try:
+        count = int(params.get('count', 1))
+        seed = params.get('seed')
+        seed = int(seed) if seed is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "'count' and 'seed' must be integers."}), 400
+    if seed is not None and seed < 0:
+        # numpy's default_rng() only takes non-negative seeds.
+        return jsonify({"error": "'seed' must be a non-negative integer."}), 400
+
+    if count < 1 or count > SCRAMBLES_MAX_COUNT:
+        return jsonify({"error": f"'count' must be between 1 and {SCRAMBLES_MAX_COUNT}."}), 400
+
+    if seed is not None:
+        scrambles = generate_scrambles(cube_type, count, seed=seed)
+    else:
+        scrambles = scramble_pool.take(cube_type, count)
+
+    return jsonify({"cubeType": cube_type, "scrambles": scrambles}), 200
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+    app.run(host='0.0.0.0', port=args.port, debug=True)
@@ -0,0 +1,68 @@
+# api/solve-stats.py inside your Vercel project's 'api' directory
+# This function computes session statistics (best single, mean, current and best-ever AoN for
+# several window sizes) for a list of solves in one call.
+
+import os
+import sys
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+
+# Shared helper modules (underscore-prefixed so Vercel doesn't deploy them) live next to this file.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _solve_stats import DEFAULT_AVERAGE_SIZES, summarize_results
+from _solve_history import history_results, parse_history
+from _log import get_logger
+
+# Initialize the Flask app for Vercel.
+app = Flask(__name__)
+CORS(app) # Enable CORS for all origins for development. Restrict for production if necessary.
+log = get_logger('solve-stats')
+
+SOLVE_STATS_MAX_AVERAGE = int(os.environ.get("SOLVE_STATS_MAX_AVERAGE", "10000"))
+
+@app.route('/api/solve-stats', methods=['POST', 'OPTIONS'])
+def solve_stats_handler():
+    """HTTP endpoint that summarizes `solves` (objects shaped like script.js solves: time in ms and
+    penalty null/'+2'/'DNF', oldest first). `averages` optionally lists the AoN sizes to report.
+    `solves` may also be a base64 CTH1 history (see _solve_history.py), or the whole body may be
+    raw CTH1 bytes sent as application/octet-stream with `averages` in the query string.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    if request.mimetype == 'application/octet-stream':
+        solves = request.get_data()
+        sizes = request.args.get('averages')
+        sizes = sizes.split(',') if sizes else list(DEFAULT_AVERAGE_SIZES)
+    else:
+        request_json = request.get_json(silent=True)
+        if not request_json or not isinstance(request_json.get('solves'), (list, str)):
+            log.warning("Missing 'solves' for solve stats")
+            return jsonify({"error": "Request body must be JSON with a 'solves' list or encoded history."}), 400
+        solves = request_json['solves']
+        sizes = request_json.get('averages', list(DEFAULT_AVERAGE_SIZES))
+
+    try:
+        if not isinstance(sizes, list):
+            raise TypeError
+        sizes = sorted({int(size) for size in sizes})
+    except (TypeError, ValueError):
+        return jsonify({"error": "'averages' must be a list of integers."}), 400
+    if not sizes or sizes[0] < 3 or sizes[-1] > SOLVE_STATS_MAX_AVERAGE:
+        return jsonify({"error": f"Average sizes must be between 3 and {SOLVE_STATS_MAX_AVERAGE}."}), 400
+
+    try:
+        history = parse_history(solves)
+        stats = summarize_results(history_results(history).tolist(), sizes)
+    except (TypeError, ValueError) as e:
+        log.warning("Invalid solve history in solve stats request", error=str(e))
+        return jsonify({"error": f"Invalid solve history: {e}"}), 400
+
+    return jsonify(stats), 200
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5002)
+    args = parser.parse_args()
+    app.run(host='0.0.0.0', port=args.port, debug=True)
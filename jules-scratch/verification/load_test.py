@@ -0,0 +1,305 @@
+# Load test for the real API handlers, run offline against the mock Gemini server in proxy_server.py.
+#
+#   python jules-scratch/verification/load_test.py --mode flask --concurrency 16 --requests 200 \
+#       --latency lognormal:300:0.4 --latency generate_course=lognormal:2000:0.3
+#   python jules-scratch/verification/load_test.py --mode asgi --concurrency 256 --requests 2000
+#   python jules-scratch/verification/load_test.py --url http://localhost:8000 --endpoints chat,nlu
+#
+# Options this script does not know (--latency, --error-rate, --timeout-rate, --truncate-rate, ...)
+# are passed on to the mock; see proxy_server.py.
+#
+# --mode flask drives the Flask apps in this process from a thread pool (one worker thread per
+# concurrent request, as the WSGI functions are served); --mode asgi drives _asgi.app from
+# asyncio tasks; --url sends real HTTP requests to a server that is already running (point its
+# GEMINI_API_ROOT at a mock started with proxy_server.py). The mock runs in its own process so it
+# does not compete with the handlers for the GIL.
+#
+# Each endpoint is a separate phase. Reported per phase: requests, errors, throughput,
+# p50/p95/p99/max latency, upstream calls answered by the mock, peak RSS of this process and (with
+# --tracemalloc) the Python heap peak. --json PATH writes the same numbers for comparing runs.
+# Request bodies carry a nonce, so caches miss (concurrent identical calls are still coalesced, as
+# in production); pass --cache to measure warm caches.
+# Requests come from --clients simulated users (X-Forwarded-For), which _admission rate limits
+# separately; responses it sheds (429/503) are counted in their own column, not as errors.
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import resource
+import argparse
+import subprocess
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(HERE, '..', '..', 'api')
+
+FACES = ['U', 'D', 'L', 'R', 'F', 'B']
+TOPICS = ['f2l', 'oll', 'pll', 'cross']
+QUESTIONS = ["what is the best way to learn {topic}", "how do I get faster at {topic}",
+             "why do people use {topic} algorithms", "explain {topic} to me"]
+COMMANDS = ["start timer", "stop timer", "set cube type 3x3", "show stats", "generate new scramble"]
+
+
+def random_scramble(length=20):
+    moves, last = [], None
+    for _ in range(length):
+        face = random.choice([face for face in FACES if face != last])
+        moves.append(face + random.choice(['', "'", '2']))
+        last = face
+    return ' '.join(moves)
+
+
+def nonce(cache):
+    return '' if cache else f" ({uuid.uuid4().hex[:8]})"
+
+
+def insight_body(cache):
+    return {'scramble': random_scramble() if not cache else "R U R' U' F2 D L2", 'time_ms': random.randint(8000, 30000),
+            'cubeType': '3x3', 'userLevel': 'intermediate'}
+
+
+def chat_body(cache):
+    topic = random.choice(TOPICS)
+    history = [{'role': 'user', 'parts': [{'text': "Hi Jarvis, I'd like a course."}]},
+               {'role': 'model', 'parts': [{'text': "Great! What is your skill level?"}]},
+               {'role': 'user', 'parts': [{'text': f"I'm intermediate and want to work on {topic}{nonce(cache)}"}]}]
+    return {'type': 'lesson_chat', 'chatHistory': history, 'cubeType': '3x3'}
+
+
+def course_body(cache, stream=False):
+    text = f"I'm a beginner, teach me {random.choice(TOPICS)} with hands-on practice"
+    body = {'type': 'generate_course', 'chatHistory': [{'role': 'user', 'parts': [{'text': text}]}],
+            'cubeType': '3x3', 'fresh': not cache}
+    if stream:
+        body['stream'] = True
+    return body
+
+
+def nlu_body(cache):
+    # Half canonical commands (answered locally), half questions that go to Gemini.
+    if random.random() < 0.5:
+        return {'transcript': random.choice(COMMANDS)}
+    return {'transcript': random.choice(QUESTIONS).format(topic=random.choice(TOPICS)) + nonce(cache)}
+
+
+ENDPOINTS = {
+    'insight': ('/api/gemini-insight', insight_body),
+    'chat': ('/api/gemini-insight', chat_body),
+    'course': ('/api/gemini-insight', course_body),
+    'course_stream': ('/api/gemini-insight', lambda cache: course_body(cache, stream=True)),
+    'nlu': ('/api/gemini-nlu', nlu_body),
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(mock_args):
+    """Starts proxy_server.py with `mock_args` in its own process; returns (process, root URL)."""
+    port = free_port()
+    command = [sys.executable, os.path.join(HERE, 'proxy_server.py'), '--port', str(port), *mock_args]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    root = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 15
+    while time.time() < deadline and process.poll() is None:
+        try:
+            mock_stats(root)
+            return process, root
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Mock Gemini server did not start: {' '.join(command)}")
+
+
+def mock_stats(root):
+    import urllib.request
+    with urllib.request.urlopen(f"{root}/mock/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+SHED_STATUSES = (429, 503)
+
+
+def client_headers(clients):
+    """X-Forwarded-For of a random one of `clients` simulated users."""
+    return {'X-Forwarded-For': f"10.0.{random.randrange(clients) // 256}.{random.randrange(clients) % 256}"}
+
+
+def run_threads(count, concurrency, send):
+    """Runs `count` calls of send() on `concurrency` threads; returns [(seconds, status)]."""
+    def one(_):
+        started = time.perf_counter()
+        try:
+            status = send()
+        except Exception:
+            status = None
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(count)))
+
+
+def flask_sender(asgi_module, path, make_body, cache, clients):
+    app = asgi_module.nlu_function.app if path == '/api/gemini-nlu' else asgi_module.insight_function.app
+    local = threading.local()
+
+    def send():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.post(path, json=make_body(cache), headers=client_headers(clients))
+        response.get_data()  # Drains streamed (SSE) responses too.
+        return response.status_code
+    return send
+
+
+def url_sender(base_url, path, make_body, cache, clients):
+    import requests
+    local = threading.local()
+
+    def send():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.post(base_url.rstrip('/') + path, json=make_body(cache),
+                                      headers=client_headers(clients), timeout=300)
+        return response.status_code
+    return send
+
+
+async def run_asgi(asgi_module, count, concurrency, path, make_body, cache, clients):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=asgi_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://load-test', timeout=300) as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, json=make_body(cache), headers=client_headers(clients))
+                    status = response.status_code
+                except Exception:
+                    status = None
+                return time.perf_counter() - started, status
+        return await asyncio.gather(*(one() for _ in range(count)))
+
+
+def run_phase(args, name, asgi_module, count):
+    path, make_body = ENDPOINTS[name]
+    if args.url:
+        return run_threads(count, args.concurrency, url_sender(args.url, path, make_body, args.cache, args.clients))
+    if args.mode == 'asgi':
+        return asyncio.run(run_asgi(asgi_module, count, args.concurrency, path, make_body, args.cache, args.clients))
+    return run_threads(count, args.concurrency, flask_sender(asgi_module, path, make_body, args.cache, args.clients))
+
+
+def summarize(name, results, wall, upstream_calls, rss_kb, heap_peak):
+    latencies = sorted(seconds for seconds, _ in results)
+    shed = sum(1 for _, status in results if status in SHED_STATUSES)
+    errors = sum(1 for _, status in results if status is None or status >= 400) - shed
+    return {
+        'endpoint': name,
+        'requests': len(results),
+        'errors': errors,
+        'shed': shed,
+        'throughput': len(results) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        'upstream_calls': upstream_calls,
+        'peak_rss_mb': rss_kb / 1024 if rss_kb is not None else None,
+        'heap_peak_mb': heap_peak / 2 ** 20 if heap_peak is not None else None,
+    }
+
+
+def print_table(rows):
+    print(f"{'endpoint':>14} {'reqs':>6} {'errs':>5} {'shed':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'upstream':>8} {'rss MB':>7} {'heap MB':>8}")
+    for row in rows:
+        rss = f"{row['peak_rss_mb']:.0f}" if row['peak_rss_mb'] is not None else '-'
+        heap = f"{row['heap_peak_mb']:.1f}" if row['heap_peak_mb'] is not None else '-'
+        print(f"{row['endpoint']:>14} {row['requests']:>6} {row['errors']:>5} {row['shed']:>5} {row['throughput']:>8.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f} "
+              f"{row['upstream_calls']:>8} {rss:>7} {heap:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--url', help="Load-test a running server instead of the in-process apps.")
+    parser.add_argument('--gemini-root', help="Use an already running mock instead of starting one.")
+    parser.add_argument('--endpoints', default='insight,chat,course,course_stream,nlu')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per endpoint first.")
+    parser.add_argument('--clients', type=int, default=1000, help="Simulated users the requests come from.")
+    parser.add_argument('--cache', action='store_true', help="Repeat identical requests so caches can hit.")
+    parser.add_argument('--tracemalloc', action='store_true', help="Track the Python heap peak (slows requests).")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    parser.add_argument('--seed', type=int, default=1)
+    args, mock_args = parser.parse_known_args()
+    random.seed(args.seed)
+
+    names = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoints {unknown}; expected some of {', '.join(ENDPOINTS)}.")
+
+    mock_process, gemini_root = (None, args.gemini_root) if args.gemini_root else start_mock(mock_args)
+    asgi_module = None
+    if not args.url:
+        # Configure the handlers before importing them: the constants are read at import time.
+        os.environ['GEMINI_API_ROOT'] = gemini_root
+        os.environ.setdefault('GEMINI_API_KEY', 'mock')
+        os.environ.setdefault('COURSE_STORE_DB', '')
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        sys.path.insert(0, API_DIR)
+        import _asgi as asgi_module
+
+    rows = []
+    try:
+        for name in names:
+            run_phase(args, name, asgi_module, args.warmup)
+            calls_before = sum(mock_stats(gemini_root).values())
+            if args.tracemalloc:
+                tracemalloc.start()
+            started = time.perf_counter()
+            results = run_phase(args, name, asgi_module, args.requests)
+            wall = time.perf_counter() - started
+            heap_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+            if args.tracemalloc:
+                tracemalloc.stop()
+            rss_kb = None if args.url else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            upstream_calls = sum(mock_stats(gemini_root).values()) - calls_before
+            rows.append(summarize(name, results, wall, upstream_calls, rss_kb, heap_peak))
+    finally:
+        if mock_process is not None:
+            mock_process.terminate()
+
+    print(f"mode={'url ' + args.url if args.url else args.mode} concurrency={args.concurrency} "
+          f"requests={args.requests} cache={'on' if args.cache else 'off'} mock: {' '.join(mock_args) or 'defaults'}")
+    print_table(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'mockArgs': mock_args, 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,132 @@
-from flask import Flask, request, jsonify
+# Local stand-in server for the verification scripts and the load tests.
+#
+# /api/gemini-insight answers the Playwright verification scripts with canned lessons and courses.
+# /<version>/models/<model>:generateContent and :streamGenerateContent answer like the Gemini API
+# itself (the same canned texts as GEMINI_STANDIN mode), so the real API functions can be run and
+# load-tested against it offline:
+#
+#   python jules-scratch/verification/proxy_server.py --port 8001 --latency lognormal:800:0.4 \
+#       --latency generate_course=lognormal:20000:0.3 --error-rate 0.02 --timeout-rate 0.01
+#   GEMINI_API_ROOT=http://localhost:8001 GEMINI_API_KEY=mock python api/gemini-insight.py
+#
+# Latency specs: fixed:MS, uniform:LOW_MS:HIGH_MS, normal:MEAN_MS:SD_MS, lognormal:MEDIAN_MS:SIGMA,
+# optionally per call type (insight, lesson_chat, generate_course, course_repair, nlu).
+# --down-model MODEL answers every call to that model with 503, to exercise model failover.
+
+from flask import Flask, Response, request, jsonify
 import os
+import sys
+import json
+import math
+import time
+import random
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'api'))
+from _gemini_client import standin_body, standin_kind, standin_sse, standin_text_for
 
 app = Flask(__name__, static_folder=os.path.join(os.getcwd()), static_url_path='')
 
+# Errors the real API returns under load, as (status, Gemini error status).
+INJECTED_ERRORS = [(429, 'RESOURCE_EXHAUSTED'), (500, 'INTERNAL'), (503, 'UNAVAILABLE')]
+
+
+def parse_latency(spec):
+    """Turns 'lognormal:800:0.4' (etc.) into a function returning a latency in seconds."""
+    name, *params = spec.split(':')
+    values = [float(value) for value in params]
+    if name == 'fixed':
+        return lambda: values[0] / 1000
+    if name == 'uniform':
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if name == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1])) / 1000
+    if name == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution '{spec}'. Expected fixed, uniform, normal or lognormal.")
+
+
+class MockConfig:
+    """Latency, fault injection and stream pacing of the mock Gemini endpoints."""
+
+    def __init__(self, latency='fixed:0', latency_by_kind=None, error_rate=0.0, timeout_rate=0.0,
+                 hang_seconds=130.0, truncate_rate=0.0, stream_chunks=8, down_models=()):
+        self.default_latency = parse_latency(latency)
+        self.latency_by_kind = {kind: parse_latency(spec) for kind, spec in (latency_by_kind or {}).items()}
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.truncate_rate = truncate_rate
+        self.stream_chunks = stream_chunks
+        self.down_models = set(down_models)
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def latency(self, kind):
+        return self.latency_by_kind.get(kind, self.default_latency)()
+
+    def count(self, kind, outcome):
+        with self._lock:
+            key = f"{kind}:{outcome}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+mock_config = MockConfig()
+
+
+@app.route('/<version>/models/<path:model_method>', methods=['POST'])
+def mock_generate_content(version, model_method):
+    """Gemini-compatible generateContent / streamGenerateContent?alt=sse."""
+    model, _, method = model_method.partition(':')
+    raw_body = request.get_data()
+    payload = json.loads(raw_body or b'{}')
+    kind = standin_kind(payload)
+    roll = random.random()
+
+    if model in mock_config.down_models:
+        mock_config.count(kind, f"down:{model}")
+        return jsonify({"error": {"code": 503, "message": f"{model} is overloaded.", "status": "UNAVAILABLE"}}), 503
+    if roll < mock_config.timeout_rate:
+        # Hang past the caller's read timeout, as an overloaded upstream would.
+        mock_config.count(kind, 'timeout')
+        time.sleep(mock_config.hang_seconds)
+        return jsonify({"error": {"code": 504, "message": "Deadline exceeded.", "status": "DEADLINE_EXCEEDED"}}), 504
+    if roll < mock_config.timeout_rate + mock_config.error_rate:
+        status, error_status = random.choice(INJECTED_ERRORS)
+        mock_config.count(kind, str(status))
+        time.sleep(mock_config.latency(kind) / 4)
+        return jsonify({"error": {"code": status, "message": f"Injected {error_status} for {model}.", "status": error_status}}), status
+
+    text = standin_text_for(payload)
+    if random.random() < mock_config.truncate_rate:
+        # A response cut off mid-JSON, as when the output token limit is hit.
+        text = text[:int(len(text) * random.uniform(0.5, 0.9))]
+        mock_config.count(kind, 'truncated')
+    else:
+        mock_config.count(kind, 'ok')
+    body = standin_body(raw_body, text)
+    latency = mock_config.latency(kind)
+
+    if method == 'streamGenerateContent':
+        events = standin_sse(body, pieces=mock_config.stream_chunks).split('\r\n\r\n')[:-1]
+
+        def stream():
+            for event in events:
+                time.sleep(latency / len(events))
+                yield event + '\r\n\r\n'
+
+        return Response(stream(), mimetype='text/event-stream')
+
+    time.sleep(latency)
+    return jsonify(body)
+
+
+@app.route('/mock/stats', methods=['GET'])
+def mock_stats():
+    """Calls answered so far, by call type and outcome."""
+    return jsonify(mock_config.counts)
+
+
 @app.route('/api/gemini-insight', methods=['POST'])
 def proxy_gemini_insight():
     data = request.get_json()
@@ -67,10 +191,37 @@ def serve_static(path):
 def serve_index():
     return app.send_static_file('index.html')
 
+
+def add_mock_arguments(parser):
+    """Mock Gemini options, shared with load_test.py."""
+    parser.add_argument('--latency', action='append', default=[],
+                        help="Latency distribution, e.g. lognormal:800:0.4, or KIND=SPEC for one call type.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of calls answered with 429/500/503.")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="Share of calls that hang for --hang-seconds.")
+    parser.add_argument('--hang-seconds', type=float, default=130.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help="Share of responses cut off mid-JSON.")
+    parser.add_argument('--stream-chunks', type=int, default=8)
+    parser.add_argument('--down-model', action='append', default=[], help="Model that answers every call with 503.")
+
+
+def mock_config_from_args(args):
+    default, by_kind = 'fixed:0', {}
+    for spec in args.latency:
+        if '=' in spec:
+            kind, _, spec = spec.partition('=')
+            by_kind[kind] = spec
+        else:
+            default = spec
+    return MockConfig(default, by_kind, args.error_rate, args.timeout_rate, args.hang_seconds,
+                      args.truncate_rate, args.stream_chunks, args.down_model)
+
+
 if __name__ == '__main__':
     # The verification script will pass the port, but default to 8000
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=8000)
+    add_mock_arguments(parser)
     args = parser.parse_args()
-    app.run(host='0.0.0.0', port=args.port)
+    mock_config = mock_config_from_args(args)
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
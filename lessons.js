@@ -1077,6 +1077,7 @@ async function initiateCourseGeneration() {
             chatHistory: courseChatHistory, // Send the full chat history for context
             cubeType: courseTypeFilter.value,
             skillLevel: courseLevelFilter.value,
+            stream: true, // Receive modules as server-sent events while the rest is still generating
             // Add other relevant context from the UI if needed for the AI model
         };
 
@@ -1093,7 +1094,17 @@ async function initiateCourseGeneration() {
             throw new Error(`Server responded with status ${response.status}: ${JSON.stringify(errorData)}`);
         }
 
-        const result = await response.json();
+        let result;
+        if ((response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+            result = await readCourseEventStream(response, (eventName, data) => {
+                if (eventName === 'module') {
+                    const moduleTitle = data.module.module_title || `Module ${data.moduleIndex + 1}`;
+                    displayCourseChatMessage('jarvis', `${moduleTitle} is ready, Sir Sevindu. Preparing the rest of your course...`);
+                }
+            });
+        } else {
+            result = await response.json();
+        }
         console.log("[DEBUG] Vercel Serverless Function response (course generation):", result);
 
         // Corrected: Check for 'title' directly in the result object, as the server now returns the course object itself with 'title'.
@@ -1121,6 +1132,49 @@ async function initiateCourseGeneration() {
 }
 
 
+/**
+ * Reads a server-sent-events course stream from /api/gemini-insight.
+ * `lesson` and `module` events are passed to onEvent as they arrive.
+ * @param {Response} response - The fetch response with a text/event-stream body.
+ * @param {Function} onEvent - Called with (eventName, data) for each partial event.
+ * @returns {Promise<Object>} The final course object, or an object with an `error` field.
+ */
+async function readCourseEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+
+            const parsed = JSON.parse(data);
+            if (eventName === 'course' || eventName === 'error') {
+                result = parsed;
+            } else {
+                onEvent(eventName, parsed);
+            }
+        }
+    }
+
+    return result || { error: "The course stream ended before the course was complete, Sir Sevindu. Please try again." };
+}
+
 /**
  * Saves a new course to Firestore.
  * @param {Object} courseData - The course data to save.
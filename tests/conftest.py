@@ -0,0 +1,5 @@
+# The api/ modules import each other by bare name, the way Vercel runs them.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
@@ -0,0 +1,97 @@
+import copy
+
+import pytest
+
+import _course_schema as course_schema
+import _gemini_client as gemini_client
+from _admission import AdmissionRejected
+
+
+def lesson(number, **changes):
+    return dict({"lesson_id": f"l{number}", "lesson_title": f"Lesson {number}", "lesson_type": "text",
+                 "content": "Text", "scrambles": [], "algorithms": [], "quiz": []}, **changes)
+
+
+COURSE = {"course_id": "c", "title": "Cross", "description": "", "cubeType": "3x3", "level": "beginner",
+          "modules": [{"module_id": "m1", "module_title": "Basics",
+                       "lessons": [lesson(1), lesson(2), lesson(3)]}]}
+
+
+def gemini_response(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def run_repair(course, response):
+    """Drives repair_course, answering its one upstream call with `response`; returns (result, calls)."""
+    repair = course_schema.repair_course(course, '3x3', 'beginner', 'cross', 'visual')
+    calls = []
+    try:
+        calls.append(next(repair))
+        repair.send(response)
+    except StopIteration as stop:
+        return stop.value, calls
+    raise AssertionError("repair_course made more than one upstream call")
+
+
+def test_valid_course_makes_no_call():
+    (course, report), calls = run_repair(copy.deepcopy(COURSE), None)
+    assert calls == []
+    assert course == COURSE
+    assert report["repairedLessons"] == 0
+
+
+def test_validate_course_reports_path():
+    course = copy.deepcopy(COURSE)
+    del course['modules'][0]['lessons'][1]['content']
+    paths = [course_schema.format_path(path) for path, _ in course_schema.validate_course(course)]
+    assert paths == ['modules[0].lessons[1].content']
+
+
+def test_repair_replaces_only_the_broken_lesson():
+    course = copy.deepcopy(COURSE)
+    del course['modules'][0]['lessons'][1]['content']
+    fixed = '{"lessons": [{"lesson_title": "Lesson 2", "lesson_type": "text", "content": "Fixed"}]}'
+    (repaired, report), calls = run_repair(course, gemini_response(fixed))
+
+    assert [call.request_type for call in calls] == ['course_repair']
+    prompt = calls[0].payload['contents'][0]['parts'][0]['text']
+    assert '"l2"' in prompt and '"l1"' not in prompt and '"l3"' not in prompt
+    lessons = repaired['modules'][0]['lessons']
+    assert [item.get('content') for item in lessons] == ['Text', 'Fixed', 'Text']
+    assert lessons[0] == COURSE['modules'][0]['lessons'][0]
+    assert report == {"droppedQuizItems": 0, "repairedLessons": 1, "droppedLessons": 0, "droppedModules": 0}
+
+
+def test_repair_drops_lesson_when_the_fix_is_still_broken():
+    course = copy.deepcopy(COURSE)
+    del course['modules'][0]['lessons'][1]['content']
+    (repaired, report), _ = run_repair(course, gemini_response('{"lessons": [{"lesson_title": "Lesson 2"}]}'))
+    assert [item['lesson_id'] for item in repaired['modules'][0]['lessons']] == ['l1', 'l3']
+    assert report["droppedLessons"] == 1
+
+
+def test_repair_drops_bad_quiz_items_without_a_call():
+    course = copy.deepcopy(COURSE)
+    course['modules'][0]['lessons'][0]['quiz'] = [{"question": "Q?", "options": ["a", "b"], "answer": "a"},
+                                                  {"question": "Q?", "options": ["a", "b"], "answer": "c"}]
+    (repaired, report), calls = run_repair(course, None)
+    assert calls == []
+    assert len(repaired['modules'][0]['lessons'][0]['quiz']) == 1
+    assert report["droppedQuizItems"] == 1
+
+
+@pytest.mark.parametrize('shed', [
+    AdmissionRejected("Queue full", 503, 2, 'course', 'queue_timeout'),
+    gemini_client.UpstreamUnavailable("gemini-2.5-flash-lite is failing", 15),
+])
+def test_shed_repair_call_drops_the_lesson_instead_of_failing(monkeypatch, shed):
+    def call_sync(call):
+        assert call.optional
+        raise shed
+    monkeypatch.setattr(gemini_client, 'call_sync', call_sync)
+    course = copy.deepcopy(COURSE)
+    del course['modules'][0]['lessons'][1]['content']
+
+    repaired, report = gemini_client.run_sync(course_schema.repair_course(course, '3x3', 'beginner', 'cross', 'visual'))
+    assert [item['lesson_id'] for item in repaired['modules'][0]['lessons']] == ['l1', 'l3']
+    assert report["droppedLessons"] == 1
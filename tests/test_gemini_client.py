@@ -0,0 +1,440 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+import _gemini_client as gemini_client
+import _model_routing as model_routing
+import _resilience as resilience
+from _admission import AdmissionRejected, upstream_limiter
+
+
+def shed_error():
+    return AdmissionRejected("Too many requests", 429, 1, 'insight', 'rate_limited')
+
+
+def raising(error):
+    def call(call):
+        raise error
+    return call
+
+
+def handler(optional, fallback):
+    """A handler generator making one call; returns the answer, or 'fallback' when it catches the error."""
+    try:
+        answer = yield gemini_client.UpstreamCall('insight', 'gemini-2.0-flash-lite', {}, optional=optional)
+    except Exception:
+        if not fallback:
+            raise
+        return 'fallback', 200
+    return answer, 200
+
+
+def test_run_sync_passes_shed_errors_out_of_required_calls(monkeypatch):
+    error = shed_error()
+    monkeypatch.setattr(gemini_client, 'call_sync', raising(error))
+    steps = handler(optional=False, fallback=True)
+    with pytest.raises(AdmissionRejected) as raised:
+        gemini_client.run_sync(steps)
+    assert raised.value is error
+    assert steps.gi_frame is None  # Closed, not thrown into: its broad except never saw the error.
+
+
+def test_run_sync_throws_shed_errors_into_optional_calls(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'call_sync', raising(shed_error()))
+    assert gemini_client.run_sync(handler(optional=True, fallback=True)) == ('fallback', 200)
+
+
+def test_run_sync_optional_call_without_fallback_still_sheds(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'call_sync', raising(shed_error()))
+    with pytest.raises(AdmissionRejected):
+        gemini_client.run_sync(handler(optional=True, fallback=False))
+
+
+def test_run_async_throws_shed_errors_into_optional_calls(monkeypatch):
+    async def call_async(call):
+        raise gemini_client.UpstreamUnavailable("model is failing", 5)
+    monkeypatch.setattr(gemini_client, 'call_async', call_async)
+    assert asyncio.run(gemini_client.run_async(handler(optional=True, fallback=True))) == ('fallback', 200)
+    with pytest.raises(gemini_client.UpstreamUnavailable):
+        asyncio.run(gemini_client.run_async(handler(optional=False, fallback=True)))
+
+
+# --- Retries, failover, hedging and circuit breaking, against a fake generate_content -----------
+
+CHEAP, NEXT = 'gemini-2.0-flash-lite', 'gemini-2.5-flash-lite'  # The short-insight route, in order.
+
+
+class FakeClock:
+    """Stands in for the time module inside _gemini_client; sleep() only advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status=200, label='ok', text=''):
+        self.status_code = status
+        self.label = label
+        self.text = text
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+    def json(self):
+        return {"candidates": [{"content": {"parts": [{"text": self.label}]}}]}
+
+
+class FakeGemini:
+    """generate_content() answering from a script: each entry is a status code or a function
+    returning a FakeResponse. `models` records the model of every request made."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.models = []
+        self._lock = threading.Lock()
+
+    def __call__(self, request_type, model, payload, api_version='v1beta'):
+        with self._lock:
+            self.models.append(model)
+            step = self.script[len(self.models) - 1]
+        return step() if callable(step) else FakeResponse(step)
+
+
+def count(counter, **labels):
+    return counter._values.get(tuple(labels.get(name, '') for name in counter.labelnames), 0)
+
+
+def text_of(body):
+    return body['candidates'][0]['content']['parts'][0]['text']
+
+
+def slots_in_use():
+    return sum(upstream_limiter.stats()['inUse'].values())
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fresh retry budget, breakers and latency stats, and backoff without jitter (0.1 s, 0.2 s, ...)."""
+    monkeypatch.setattr(resilience, 'retry_budget', resilience.RetryBudget())
+    monkeypatch.setattr(resilience, 'breakers', resilience.BreakerRegistry())
+    monkeypatch.setattr(resilience, 'latency_stats', resilience.LatencyStats())
+    monkeypatch.setattr(resilience, 'backoff_delay', lambda attempt: 0.1 * 2 ** attempt)
+
+    def install(script):
+        gemini = FakeGemini(script)
+        monkeypatch.setattr(gemini_client, 'generate_content', gemini)
+        return gemini
+    return install
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(gemini_client, 'time', clock)
+    return clock
+
+
+def insight_call(model=CHEAP):
+    return gemini_client.UpstreamCall('insight', model, {})
+
+
+def http_error(status, details=''):
+    return gemini_client.UpstreamError(f"{status} Error", status_code=status, details=details)
+
+
+RETRY_INFO = ('{"error": {"code": 429, "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", '
+              '"retryDelay": "3s"}]}}')
+
+
+def test_retry_delay_backs_off_on_transient_errors(upstream, clock):
+    assert gemini_client.retry_delay(insight_call(), http_error(503), 0, clock.now) == 0.1
+    assert gemini_client.retry_delay(insight_call(), gemini_client.UpstreamTimeout("read timeout"), 1, clock.now) == 0.2
+
+
+def test_retry_delay_gives_up_on_client_errors_and_open_breakers(upstream, clock):
+    assert gemini_client.retry_delay(insight_call(), http_error(400), 0, clock.now) is None
+    unavailable = gemini_client.UpstreamUnavailable("breaker open", 10)
+    assert gemini_client.retry_delay(insight_call(), unavailable, 0, clock.now) is None
+
+
+def test_retry_delay_gives_up_after_last_attempt(upstream, clock):
+    last = resilience.GEMINI_MAX_ATTEMPTS - 1
+    assert gemini_client.retry_delay(insight_call(), http_error(503), last, clock.now) is None
+
+
+def test_retry_delay_honours_429_retry_info(upstream, clock):
+    assert gemini_client.retry_delay(insight_call(), http_error(429, RETRY_INFO), 0, clock.now) == 3.0
+    # Only a 429 says when the quota frees up; other statuses keep the normal backoff.
+    assert gemini_client.retry_delay(insight_call(), http_error(503, RETRY_INFO), 0, clock.now) == 0.1
+
+
+def test_retry_delay_gives_up_when_the_call_timeout_would_pass(upstream, clock):
+    read_timeout = gemini_client.REQUEST_TIMEOUTS['insight'][1]
+    assert gemini_client.retry_delay(insight_call(), http_error(429, RETRY_INFO), 0, clock.now - read_timeout + 4) == 3.0
+    assert gemini_client.retry_delay(insight_call(), http_error(429, RETRY_INFO), 0, clock.now - read_timeout + 2) is None
+
+
+def test_retry_delay_gives_up_when_the_latency_budget_would_pass(upstream, clock, monkeypatch):
+    monkeypatch.setattr(model_routing, 'remaining_budget', lambda request_type, payload: 0.15)
+    assert gemini_client.retry_delay(insight_call(), http_error(503), 0, clock.now) == 0.1
+    assert gemini_client.retry_delay(insight_call(), http_error(503), 1, clock.now) is None
+
+
+def test_retry_delay_gives_up_when_the_retry_budget_is_spent(upstream, clock, monkeypatch):
+    monkeypatch.setattr(resilience, 'retry_budget', resilience.RetryBudget(ratio=0, min_per_second=0))
+    exhausted = count(resilience.UPSTREAM_RETRIES, call_type='insight', outcome='budget_exhausted')
+    assert gemini_client.retry_delay(insight_call(), http_error(503), 0, clock.now) is None
+    assert count(resilience.UPSTREAM_RETRIES, call_type='insight', outcome='budget_exhausted') == exhausted + 1
+
+
+def test_call_with_retries_retries_transient_errors(upstream, clock):
+    gemini = upstream([503, 200])
+    assert text_of(gemini_client.call_with_retries(insight_call())) == 'ok'
+    assert gemini.models == [CHEAP, CHEAP]
+    assert clock.sleeps == [0.1]
+    assert resilience.retry_budget.stats()['retries'] == 1
+
+
+def test_call_with_retries_does_not_retry_client_errors(upstream, clock):
+    gemini = upstream([400])
+    with pytest.raises(gemini_client.UpstreamError) as raised:
+        gemini_client.call_with_retries(insight_call())
+    assert raised.value.status_code == 400
+    assert gemini.models == [CHEAP]
+    assert clock.sleeps == []
+
+
+def test_call_with_retries_fails_over_after_the_last_attempt(upstream, clock):
+    attempts = resilience.GEMINI_MAX_ATTEMPTS
+    gemini = upstream([503] * attempts + [200])
+    assert text_of(gemini_client.call_with_retries(insight_call())) == 'ok'
+    assert gemini.models == [CHEAP] * attempts + [NEXT]
+    assert clock.sleeps == [0.1 * 2 ** attempt for attempt in range(attempts - 1)]
+
+
+def test_call_with_retries_raises_when_every_model_failed(upstream, clock):
+    attempts = resilience.GEMINI_MAX_ATTEMPTS
+    gemini = upstream([503] * (2 * attempts))
+    with pytest.raises(gemini_client.UpstreamError) as raised:
+        gemini_client.call_with_retries(insight_call())
+    assert raised.value.status_code == 503
+    assert gemini.models == [CHEAP] * attempts + [NEXT] * attempts
+
+
+def test_pinned_model_outside_the_route_does_not_fail_over(upstream, clock):
+    attempts = resilience.GEMINI_MAX_ATTEMPTS
+    gemini = upstream([503] * attempts)
+    with pytest.raises(gemini_client.UpstreamError):
+        gemini_client.call_with_retries(insight_call('gemini-2.0-flash'))
+    assert gemini.models == ['gemini-2.0-flash'] * attempts
+
+
+def test_failover_needs_retry_budget(upstream, clock, monkeypatch):
+    monkeypatch.setattr(resilience, 'retry_budget', resilience.RetryBudget(ratio=0, min_per_second=0.1, window=10))
+    gemini = upstream([503, 503, 200])
+    with pytest.raises(gemini_client.UpstreamError):
+        gemini_client.call_with_retries(insight_call())
+    assert gemini.models == [CHEAP, CHEAP]  # One retry from the budget; nothing left to fail over with.
+
+
+def test_failover_skips_errors_that_are_not_transient(upstream):
+    assert gemini_client.failover(insight_call(), http_error(400), [CHEAP]) is None
+    moved = gemini_client.failover(insight_call(), http_error(500), [CHEAP])
+    assert (moved.model, moved.api_version) == (NEXT, model_routing.MODELS[NEXT].api_version)
+    assert gemini_client.failover(moved, http_error(500), [CHEAP, NEXT]) is None
+
+
+def test_transient_failures_open_the_breaker_and_later_calls_fail_fast(upstream, clock):
+    breaker = resilience.breakers.get(CHEAP)
+    gemini = upstream([503] * breaker.min_calls)
+    for _ in range(breaker.min_calls):
+        with pytest.raises(gemini_client.UpstreamError):
+            gemini_client.attempt_sync(insight_call())
+    assert breaker.state == 'open'
+    with pytest.raises(gemini_client.UpstreamUnavailable) as raised:
+        gemini_client.attempt_sync(insight_call())
+    assert raised.value.retry_after >= 1
+    assert len(gemini.models) == breaker.min_calls
+    assert slots_in_use() == 0
+
+
+def test_client_errors_do_not_open_the_breaker(upstream, clock):
+    breaker = resilience.breakers.get(CHEAP)
+    upstream([400] * breaker.min_calls)
+    for _ in range(breaker.min_calls):
+        with pytest.raises(gemini_client.UpstreamError):
+            gemini_client.attempt_sync(insight_call())
+    assert breaker.state == 'closed'
+
+
+def test_successful_attempt_records_latency(upstream, clock, monkeypatch):
+    monkeypatch.setattr(resilience, 'latency_stats', resilience.LatencyStats(min_samples=1))
+
+    def slow():
+        clock.now += 0.25
+        return FakeResponse()
+    upstream([slow])
+    gemini_client.attempt_sync(insight_call())
+    assert resilience.latency_stats.quantile('insight', CHEAP, 0.5) == pytest.approx(0.25)
+
+
+def test_open_breaker_fails_over_without_calling_its_model(upstream, clock):
+    breaker = resilience.breakers.get(CHEAP)
+    for _ in range(breaker.min_calls):
+        breaker.record(False)
+    gemini = upstream([200])
+    assert text_of(gemini_client.call_with_retries(insight_call())) == 'ok'
+    assert gemini.models == [NEXT]
+
+
+@pytest.fixture
+def hedged(upstream, monkeypatch):
+    """Insight calls on CHEAP are hedged after HEDGE_MIN_DELAY (the model's p95 is below it)."""
+    monkeypatch.setattr(resilience, 'latency_stats', resilience.LatencyStats(min_samples=1))
+    resilience.latency_stats.record('insight', CHEAP, 0.001)
+    assert gemini_client.hedge_delay(insight_call()) == gemini_client.HEDGE_MIN_DELAY
+    return upstream
+
+
+def test_hedged_call_is_answered_by_the_hedge(hedged):
+    release = threading.Event()
+
+    def stuck():
+        release.wait(5)
+        return FakeResponse(label='primary')
+    gemini = hedged([stuck, lambda: FakeResponse(label='hedge')])
+    won = count(resilience.UPSTREAM_HEDGES, call_type='insight', outcome='won')
+    try:
+        assert text_of(gemini_client.hedged_sync(insight_call())) == 'hedge'
+        assert count(resilience.UPSTREAM_HEDGES, call_type='insight', outcome='won') == won + 1
+        assert slots_in_use() == 1  # The primary still holds its slot until it finishes.
+    finally:
+        release.set()
+    wait_until(lambda: slots_in_use() == 0)
+    assert gemini.models == [CHEAP, CHEAP]
+
+
+def test_hedge_answers_when_the_primary_fails(hedged):
+    def failing():
+        time.sleep(0.1)
+        return FakeResponse(503)
+
+    def late():
+        time.sleep(0.2)
+        return FakeResponse(label='hedge')
+    hedged([failing, late])
+    assert text_of(gemini_client.hedged_sync(insight_call())) == 'hedge'
+    wait_until(lambda: slots_in_use() == 0)
+
+
+def test_hedged_call_raises_when_both_attempts_fail(hedged):
+    def failing():
+        time.sleep(0.1)
+        return FakeResponse(503)
+    hedged([failing, lambda: FakeResponse(502)])
+    with pytest.raises(gemini_client.UpstreamError) as raised:
+        gemini_client.hedged_sync(insight_call())
+    assert raised.value.status_code in (502, 503)
+    wait_until(lambda: slots_in_use() == 0)
+
+
+def test_fast_primary_is_not_hedged(hedged):
+    gemini = hedged([lambda: FakeResponse(label='primary')])
+    assert text_of(gemini_client.hedged_sync(insight_call())) == 'primary'
+    assert gemini.models == [CHEAP]
+    assert slots_in_use() == 0
+
+
+def test_no_hedge_without_retry_budget(hedged, monkeypatch):
+    monkeypatch.setattr(resilience, 'retry_budget', resilience.RetryBudget(ratio=0, min_per_second=0))
+
+    def slow():
+        time.sleep(0.15)
+        return FakeResponse(label='primary')
+    gemini = hedged([slow])
+    assert text_of(gemini_client.hedged_sync(insight_call())) == 'primary'
+    assert gemini.models == [CHEAP]
+    assert slots_in_use() == 0
+
+
+class FakeAsyncResponse(FakeResponse):
+    def raise_for_status(self):
+        import httpx
+
+        if self.status_code >= 400:
+            raise httpx.HTTPStatusError(f"{self.status_code} Error", request=None, response=self)
+
+
+class FakeAsyncClient:
+    """get_async_client() stand-in; each post() runs the next coroutine function of the script."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.posts = 0
+
+    async def post(self, url, headers, json, timeout):
+        self.posts += 1
+        return await self.script[self.posts - 1]()
+
+
+def test_async_hedge_wins_and_the_primary_is_cancelled(hedged, monkeypatch):
+    cancelled = []
+
+    async def stuck():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return FakeAsyncResponse(label='primary')
+
+    async def fast():
+        return FakeAsyncResponse(label='hedge')
+    client = FakeAsyncClient([stuck, fast])
+    monkeypatch.setattr(gemini_client, 'get_async_client', lambda: client)
+
+    async def run():
+        body = await gemini_client.hedged_async(insight_call())
+        await asyncio.sleep(0)  # Let the cancelled primary unwind.
+        return body
+    assert text_of(asyncio.run(run())) == 'hedge'
+    assert cancelled == [True]
+    assert client.posts == 2
+    assert slots_in_use() == 0
+    assert resilience.breakers.get(CHEAP).state == 'closed'
+
+
+def test_async_hedge_answers_when_the_primary_fails(hedged, monkeypatch):
+    async def failing():
+        await asyncio.sleep(0.1)
+        return FakeAsyncResponse(503)
+
+    async def late():
+        await asyncio.sleep(0.2)
+        return FakeAsyncResponse(label='hedge')
+    client = FakeAsyncClient([failing, late])
+    monkeypatch.setattr(gemini_client, 'get_async_client', lambda: client)
+    assert text_of(asyncio.run(gemini_client.hedged_async(insight_call()))) == 'hedge'
+    assert client.posts == 2
+    assert slots_in_use() == 0
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from _json_extract import JsonObjectScanner, JsonNotFound, extract_json_object
+
+OBJECT = '{"title": "F2L {pairs}", "note": "close with \\"}\\" not }", "steps": [{"a": "["}, "]}"], "n": {}}'
+RESPONSE = 'Here is your course:\n```json\n' + OBJECT + '\n```\nHope this helps {really}!'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, len(RESPONSE)])
+def test_scanner_finds_object_across_chunks(chunk_size):
+    scanner = JsonObjectScanner()
+    for start in range(0, len(RESPONSE), chunk_size):
+        scanner.feed(RESPONSE[start:start + chunk_size])
+        if start + chunk_size < RESPONSE.index(OBJECT) + len(OBJECT):
+            assert scanner.result() is None
+    assert scanner.result() == OBJECT
+    assert scanner.decode() == json.loads(OBJECT)
+
+
+def test_scanner_ignores_braces_after_the_object():
+    scanner = JsonObjectScanner()
+    scanner.feed(RESPONSE)
+    scanner.feed('{"another": 1}')
+    assert scanner.result() == OBJECT
+
+
+def test_scanner_reports_unclosed_object():
+    scanner = JsonObjectScanner()
+    scanner.feed(OBJECT[:-1])
+    assert scanner.result() is None
+    with pytest.raises(JsonNotFound):
+        scanner.decode()
+
+
+def test_scanner_salvages_last_complete_value():
+    scanner = JsonObjectScanner()
+    scanner.feed('{"modules": [{"lessons": [{"t": "}"}, {"t": "cut o')
+    assert scanner.decode_truncated() == {"modules": [{"lessons": [{"t": "}"}]}]}
+
+
+def test_extract_skips_prose_and_fences():
+    assert extract_json_object(RESPONSE) == json.loads(OBJECT)
+
+
+def test_extract_skips_candidate_that_does_not_decode():
+    assert extract_json_object('use {R U} then ' + OBJECT) == json.loads(OBJECT)
+
+
+def test_extract_without_object():
+    with pytest.raises(JsonNotFound):
+        extract_json_object('no json here')
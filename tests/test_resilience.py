@@ -0,0 +1,112 @@
+import pytest
+
+import _resilience as resilience
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    return clock
+
+
+def open_breaker(clock):
+    breaker = resilience.CircuitBreaker('test-model', window=4, min_calls=4, failure_ratio=0.5, cooldown=10)
+    for success in (True, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open'
+    return breaker
+
+
+def test_breaker_stays_closed_below_min_calls(clock):
+    breaker = resilience.CircuitBreaker('test-model', window=4, min_calls=4, failure_ratio=0.5, cooldown=10)
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_breaker_opens_then_rejects_until_cooldown(clock):
+    breaker = open_breaker(clock)
+    assert not breaker.allow()
+    assert not breaker.available()
+    assert breaker.retry_after() == 10
+    clock.now += 9.9
+    assert not breaker.allow()
+    clock.now += 0.1
+    assert breaker.available()
+
+
+def test_breaker_half_open_lets_one_probe_through(clock):
+    breaker = open_breaker(clock)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    assert not breaker.available()
+
+
+def test_breaker_closes_after_successful_probe(clock):
+    breaker = open_breaker(clock)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == 'closed'
+    assert breaker.stats()['recentCalls'] == 0
+    assert breaker.allow()
+
+
+def test_breaker_reopens_after_failed_probe(clock):
+    breaker = open_breaker(clock)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == 10
+    assert not breaker.allow()
+
+
+def test_breaker_abandoned_probe_frees_the_slot(clock):
+    breaker = open_breaker(clock)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+
+
+def test_retry_budget_exhausts_at_ratio_of_calls(clock):
+    budget = resilience.RetryBudget(ratio=0.1, min_per_second=0, window=10)
+    for _ in range(30):
+        budget.record_call()
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+    assert budget.stats()['retries'] == 3
+
+
+def test_retry_budget_floor_allows_retries_without_calls(clock):
+    budget = resilience.RetryBudget(ratio=0.1, min_per_second=0.5, window=4)
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
+
+
+def test_retry_budget_recovers_when_window_slides(clock):
+    budget = resilience.RetryBudget(ratio=0.1, min_per_second=0, window=10)
+    for _ in range(10):
+        budget.record_call()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    clock.now += 10
+    assert not budget.try_spend()  # The calls that paid for retries left the window too.
+    for _ in range(10):
+        budget.record_call()
+    assert budget.try_spend()
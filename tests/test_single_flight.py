@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from _single_flight import SingleFlight
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_follower_shares_leader_result():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return {"value": 1}
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do('k', leader)))]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=lambda: results.append(flights.do('k', lambda: {"value": 2}))))
+    threads[1].start()
+    wait_for(lambda: flights.coalesced == 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [{"value": 1}, {"value": 1}]
+    # Without replay_seconds a finished call is not replayed: the next caller computes again.
+    assert flights.do('k', lambda: {"value": 3}) == {"value": 3}
+    assert (flights.leaders, flights.coalesced, flights.replayed) == (2, 1, 0)
+    assert flights.stats()['replayable'] == 0
+
+
+def test_finished_result_is_replayed_within_replay_seconds():
+    flights = SingleFlight(replay_seconds=30)
+    assert flights.do('k', lambda: {"value": 1}) == {"value": 1}
+    replayed = flights.do('k', lambda: {"value": 2})
+    assert replayed == {"value": 1}
+    replayed["value"] = 99  # Replays are copies: one caller cannot change another's result.
+    assert flights.do('k', lambda: {"value": 3}) == {"value": 1}
+    assert (flights.leaders, flights.replayed) == (1, 2)
+
+
+def test_follower_gets_leader_exception_and_it_is_not_replayed():
+    flights = SingleFlight(replay_seconds=30)
+    started, release = threading.Event(), threading.Event()
+    error = ValueError("upstream failed")
+    outcomes = {}
+
+    def failing_leader():
+        started.set()
+        release.wait(5)
+        raise error
+
+    def call(name, compute):
+        try:
+            outcomes[name] = flights.do('k', compute)
+        except ValueError as e:
+            outcomes[name] = e
+
+    leader = threading.Thread(target=call, args=('leader', failing_leader))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call, args=('follower', lambda: "follower ran"))
+    follower.start()
+    wait_for(lambda: flights.coalesced == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert outcomes['leader'] is error
+    assert outcomes['follower'] is error
+    # A call after the failure does the work again instead of getting the stored error.
+    assert flights.do('k', lambda: "fresh") == "fresh"
+    assert (flights.leaders, flights.replayed) == (2, 0)
+    assert flights.stats()['inFlight'] == 0
+
+
+def test_unreplayable_result_is_computed_again():
+    flights = SingleFlight(replay_seconds=30)
+    assert flights.do('k', lambda: 500, replayable=lambda status: status < 500) == 500
+    assert flights.do('k', lambda: 200, replayable=lambda status: status < 500) == 200
+    assert flights.leaders == 2
+
+
+def test_replay_expires():
+    flights = SingleFlight(replay_seconds=0.01)
+    flights.do('k', lambda: 1)
+    time.sleep(0.02)
+    assert flights.do('k', lambda: 2) == 2
+
+
+def test_leader_exception_propagates_to_its_caller():
+    flights = SingleFlight()
+    with pytest.raises(KeyError):
+        flights.do('k', lambda: {}['missing'])
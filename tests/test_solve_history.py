@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from _solve_history import decode_history, encode_history, history_from_solves, parse_history
+
+
+def test_solves_without_a_usable_time_are_skipped():
+    history = history_from_solves([
+        {"time": 12000, "penalty": None, "timestamp": 1, "cubeType": "3x3"},
+        {"time": None, "penalty": None, "timestamp": 2, "cubeType": "3x3"},
+        {"penalty": "DNF", "timestamp": 3},  # No time at all counts as 0 ms, as before.
+        {"time": "abc", "timestamp": 4},
+        {"time": float('nan'), "timestamp": 5},
+        {"time": 1e30, "timestamp": 6},
+        {"time": True, "timestamp": 7},
+        {"time": "9500.4", "penalty": "+2", "timestamp": 8, "cubeType": "2x2"},
+    ])
+    assert history.time_ms.tolist() == [12000, 0, 9500]
+    assert history.timestamp_ms.tolist() == [1, 3, 8]
+    assert history.penalty.tolist() == [0, 2, 1]
+    assert [history.cube_types[code] for code in history.cube_type_code] == ['3x3', '', '2x2']
+
+
+def test_only_null_times_gives_an_empty_history():
+    history = parse_history([{"time": None}, {"time": None, "penalty": "DNF"}])
+    assert len(history.time_ms) == 0
+
+
+def test_malformed_solves_are_still_rejected():
+    with pytest.raises(ValueError):
+        history_from_solves([{"time": 1000, "penalty": "+3"}])
+    with pytest.raises(ValueError):
+        history_from_solves(["12.34"])
+
+
+def test_json_and_binary_forms_match():
+    solves = [{"time": 15000 + i * 7, "penalty": [None, '+2', 'DNF'][i % 3], "timestamp": 1700000000000 + i * 60000,
+               "cubeType": ['3x3', '4x4'][i % 2]} for i in range(50)]
+    history = history_from_solves(solves)
+    decoded = decode_history(encode_history(history))
+    for field in ('time_ms', 'penalty', 'timestamp_ms', 'cube_type_code'):
+        assert np.array_equal(getattr(decoded, field), getattr(history, field))
+    assert decoded.cube_types == history.cube_types
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from flask import Flask
+
+import _static_assets as static_assets
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    (tmp_path / 'index.html').write_text('<script src="script.js"></script>')
+    (tmp_path / 'script.js').write_text('console.log("v1");')
+    monkeypatch.setattr(static_assets, 'STATIC_ROOT', str(tmp_path))
+    monkeypatch.setattr(static_assets, '_static_index', None)
+    with Flask(__name__).test_request_context():
+        yield tmp_path
+
+
+def get(path, **headers):
+    response = static_assets.serve_static(path, headers)
+    response.direct_passthrough = False
+    return response
+
+
+def touch_later(path, text):
+    """Rewrites a file and moves its mtime forward, so the change shows even on coarse clocks."""
+    stat = os.stat(path)
+    path.write_text(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_index_is_built_on_first_request(site):
+    assert static_assets._static_index is None
+    assert get('script.js').get_data() == b'console.log("v1");'
+    assert static_assets._static_index is not None
+
+
+def test_unchanged_files_keep_the_index(site):
+    get('script.js')
+    index = static_assets.get_static_index()
+    assert static_assets.get_static_index() is index
+
+
+def test_edited_file_is_served_without_restart(site):
+    first = get('script.js')
+    touch_later(site / 'script.js', 'console.log("v2");')
+
+    second = get('script.js')
+    assert second.get_data() == b'console.log("v2");'
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert get('script.js', **{'If-None-Match': first.headers['ETag']}).status_code == 200
+    # Pages are rewritten to the new content-hashed name.
+    hashed = static_assets.get_static_index().assets['script.js'].hashed_path
+    assert hashed.encode() in get('index.html').get_data()
+    assert get(hashed).get_data() == b'console.log("v2");'
+
+
+def test_removed_file_rebuilds_the_index(site):
+    get('script.js')
+    os.remove(site / 'script.js')
+    assert 'script.js' not in static_assets.get_static_index().assets